@@ -1,67 +1,130 @@
+import time
+
+_SCRIPT_STARTED = time.perf_counter()  # pentru raportul de pornire (cold start)
+
 import streamlit as st
+from streamlit import config as st_config, logger as st_logger
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
-from datetime import datetime, date
+import numpy as np
+from datetime import datetime, date, timedelta, timezone
 import io
+import argparse
+import bisect
 import hashlib
+import heapq
 import math
+import multiprocessing
+import os
 from pathlib import Path
-from streamlit_gsheets import GSheetsConnection
-
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.lib.utils import ImageReader
-from PIL import Image
+# reportlab, PIL si streamlit_gsheets / gspread se importa la prima folosire (bon, logo, backend Google Sheets)
 import json  # For multiple printers JSON
+import re
+import sys
+import sqlite3
+import tempfile
+import threading
+import unicodedata
+import zipfile
+from collections import ChainMap, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Optional
 
+IMPORT_SECONDS = time.perf_counter() - _SCRIPT_STARTED
+
 
 # ============================================================================
 # APP CONFIG
 # ============================================================================
-st.set_page_config(
-    page_title="PRINTHEAD Complete Solutions CRM",
-    page_icon="🖨️",
-    layout="wide",
-)
-
-# Load logo from repository - FIX: Keep as BytesIO
-if "logo_image" not in st.session_state:
-    try:
-        logo_path = Path("logo.png")
-        if logo_path.exists():
-            with open(logo_path, "rb") as f:
-                logo_bytes = f.read()
-            st.session_state["logo_image"] = io.BytesIO(logo_bytes)
-        else:
-            st.session_state["logo_image"] = None
-    except Exception as e:
-        st.warning(f"Logo not found: {e}")
-        st.session_state["logo_image"] = None
+def init_page():
+    """Page config + session defaults; the first thing main() does, so importing the module stays headless."""
+    st.set_page_config(
+        page_title="PRINTHEAD Complete Solutions CRM",
+        page_icon="🖨️",
+        layout="wide",
+    )
+
+    # Initialize session state
+    if "active_tab" not in st.session_state:
+        st.session_state["active_tab"] = 0
+
+    if "last_tab" not in st.session_state:
+        st.session_state["last_tab"] = 0
+
+    if "selected_order_for_update" not in st.session_state:
+        st.session_state["selected_order_for_update"] = None
+
+    if "previous_selected_order" not in st.session_state:
+        st.session_state["previous_selected_order"] = None
+
+    if "last_created_order" not in st.session_state:
+        st.session_state["last_created_order"] = None
+
+    if "pdf_downloaded" not in st.session_state:
+        st.session_state["pdf_downloaded"] = False
+
+    # For new-order temporary printers
+    if "temp_printers" not in st.session_state:
+        st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
+
+
+COMPANY_INFO_DEFAULTS = {
+    "company_name": "Company Name",
+    "company_address": "Address",
+    "cui": "CUI",
+    "reg_com": "Reg.Com",
+    "phone": "Phone",
+    "email": "Email",
+}
 
-# Initialize session state
-if "active_tab" not in st.session_state:
-    st.session_state["active_tab"] = 0
 
-if "last_tab" not in st.session_state:
-    st.session_state["last_tab"] = 0
+def load_company_info() -> dict:
+    """[company_info] from secrets (placeholders if secrets are missing)."""
+    try:
+        return dict(st.secrets.get("company_info", {}))
+    except Exception:
+        return dict(COMPANY_INFO_DEFAULTS)
 
-if "selected_order_for_update" not in st.session_state:
-    st.session_state["selected_order_for_update"] = None
 
-if "previous_selected_order" not in st.session_state:
-    st.session_state["previous_selected_order"] = None
+def notify(level: str, message: str):
+    """
+    Status message from the storage / CRM layer: st.sidebar.<level> inside the app,
+    stderr when there is no Streamlit session (command line, worker processes, background threads).
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        print(message, file=sys.stderr)
+    elif getattr(ctx, "current_fragment_id", None):
+        # sidebar-ul nu se redeseneaza la rerun-ul unui fragment: mesajul apare in fragment
+        getattr(st, level)(message)
+    else:
+        getattr(st.sidebar, level)(message)
+
+
+def rerun_fragment():
+    """st.rerun() for just the calling fragment; the whole app when the fragment ran as part of a full rerun."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
 
-if "last_created_order" not in st.session_state:
-    st.session_state["last_created_order"] = None
+def forget_row_widgets(prefixes: tuple, rows: int):
+    """
+    Drop the widget state of a printer list's rows. The widgets are keyed by row index, so after a
+    removal the kept rows would otherwise show (and write back) the values of the rows above them.
+    """
+    for i in range(rows):
+        for prefix in prefixes:
+            st.session_state.pop(f"{prefix}_{i}", None)
 
-if "pdf_downloaded" not in st.session_state:
-    st.session_state["pdf_downloaded"] = False
 
-# For new-order temporary printers
-if "temp_printers" not in st.session_state:
-    st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
+# fara sesiune (CLI, procese worker): fara avertismentele "no runtime" ale Streamlit la apelurile
+# st.cache_*; configul se citeste intai, altfel la prima citire (lenesa) nivelul de log revine la cel din config
+if get_script_run_ctx(suppress_warning=True) is None:
+    st_config.get_config_options()
+    st_logger.set_log_level("error")
 
 
 # ============================================================================
@@ -108,25 +171,64 @@ def check_password() -> bool:
 # ============================================================================
 # UTILITY FUNCTIONS
 # ============================================================================
+DIACRITICS_MAP = str.maketrans({
+    "ă": "a", "Ă": "A", "â": "a", "Â": "A",
+    "î": "i", "Î": "I", "ș": "s", "Ș": "S",
+    "ț": "t", "Ț": "T",
+    # variantele cu sedila (tastaturi / sisteme mai vechi)
+    "ş": "s", "Ş": "S", "ţ": "t", "Ţ": "T",
+})
+
+
 def remove_diacritics(text):
     if not isinstance(text, str):
         return text
-    diacritics_map = {
-        "ă": "a", "Ă": "A", "â": "a", "Â": "A",
-        "î": "i", "Î": "I", "ș": "s", "Ș": "S",
-        "ț": "t", "Ț": "T",
-    }
-    for d, r in diacritics_map.items():
-        text = text.replace(d, r)
-    return text
+    return text.translate(DIACRITICS_MAP)
+
+
+def fold_text(text) -> str:
+    """Forma de cautare: fara diacritice (oricare), litere mici, spatii simple."""
+    text = safe_text(text)
+    if not text.isascii():
+        text = remove_diacritics(text)
+        text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split())
+
+
+def normalize_phone(phone) -> str:
+    """
+    Telefon in forma canonica +40XXXXXXXXX pentru numerele romanesti
+    (07xx..., 0040..., 40..., +40..., si 7xxxxxxxx fara 0, cum il intoarce Sheets dupa o
+    scriere USER_ENTERED); alte numere raman doar cifre (cu + daca a existat).
+    Merge si pe prefixe partiale ("07" -> "+407"), pentru autocomplete.
+    """
+    if isinstance(phone, float) and phone.is_integer():
+        phone = int(phone)  # 722123456.0 citit din Sheets
+    text = safe_text(phone).strip()
+    digits = re.sub(r"\D", "", text)
+    if not digits:
+        return ""
+    if digits.startswith("0040"):
+        return "+40" + digits[4:]
+    if text.startswith("+"):
+        return "+" + digits
+    if digits.startswith("40") and len(digits) == 11:
+        return "+" + digits
+    if digits.startswith("0") and not digits.startswith("00"):
+        return "+40" + digits[1:]
+    if digits.startswith("7") and len(digits) == 9:
+        return "+40" + digits
+    return digits
 
 
 def safe_text(value: object) -> str:
-    """Transformă None / NaN în string gol, altfel în string normal."""
-    if value is None:
+    """Transformă None / NaN / NaT în string gol, datele în YYYY-MM-DD, altfel în string normal."""
+    if value is None or value is pd.NaT:
         return ""
     if isinstance(value, float) and math.isnan(value):
         return ""
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
     return str(value)
 
 
@@ -144,6 +246,11 @@ def safe_float(value: object, default: float = 0.0) -> float:
         return default
 
 
+def order_revision(order) -> int:
+    """Revision stamp of an order row (0 for rows written before revisions existed)."""
+    return int(safe_float(order.get("revision") if order is not None else 0))
+
+
 def load_printers_from_order(order: dict):
     """
     Returnează o listă de imprimante din order:
@@ -180,6 +287,40 @@ def load_printers_from_order(order: dict):
     return cleaned
 
 
+def normalize_serial(serial) -> str:
+    """Cheia de cautare pentru un numar de serie: fara spatii / separatori, litere mari."""
+    return re.sub(r"[\s\-_/.:]", "", safe_text(serial)).upper()
+
+
+def order_printers(order: dict):
+    """Imprimantele unei comenzi: lista pre-calculata de store (cheia "printers"), altfel parsare."""
+    printers = order.get("printers")
+    if isinstance(printers, list):
+        return printers
+    return load_printers_from_order(order)
+
+
+def printer_fields(printers) -> dict:
+    """
+    Coloanele de scris pentru o lista de imprimante: printers_json (fara randuri goale)
+    + campurile legacy printer_brand/model/serial cu prima imprimanta.
+    """
+    cleaned = []
+    for p in printers:
+        brand = safe_text(p.get("brand", "")).strip()
+        model = safe_text(p.get("model", "")).strip()
+        serial = safe_text(p.get("serial", "")).strip()
+        if brand or model or serial:
+            cleaned.append({"brand": brand, "model": model, "serial": serial})
+    first = cleaned[0] if cleaned else {"brand": "", "model": "", "serial": ""}
+    return {
+        "printers_json": json.dumps(cleaned, ensure_ascii=False),
+        "printer_brand": first["brand"],
+        "printer_model": first["model"],
+        "printer_serial": first["serial"],
+    }
+
+
 # ============================================================================
 # GOOGLE SHEETS CONNECTION
 # ============================================================================
@@ -187,615 +328,3441 @@ def load_printers_from_order(order: dict):
 def get_sheets_connection():
     """Native Streamlit connection to Google Sheets using streamlit-gsheets."""
     try:
+        from streamlit_gsheets import GSheetsConnection
+
         conn = st.connection("gsheets", type=GSheetsConnection)
         return conn
     except Exception as e:
-        st.error(f"Google Sheets connection failed: {e}")
+        notify("error", f"Google Sheets connection failed: {e}")
         return None
 
 
-def generate_initial_receipt_pdf(order, company_info, logo_image=None):
-    """Generate A4 PDF with TWO identical A5 receipts (top + bottom)."""
-    buffer = io.BytesIO()
+def rowcol_to_a1(row: int, col: int) -> str:
+    """gspread.utils.rowcol_to_a1, imported only once the Google Sheets backend is in use."""
+    from gspread.utils import rowcol_to_a1 as convert
 
-    width = 210 * mm           # A4 width
-    a5_height = 148.5 * mm     # A5 height
-    total_height = 2 * a5_height
+    return convert(row, col)
 
-    c = canvas.Canvas(buffer, pagesize=(width, total_height))
 
-    def draw_half(offset_y: float):
-        """
-        Deseneaza un bon A5 complet, pornind de la offset_y (bottom-ul
-        acestei jumatati). Layout-ul este identic cu cel vechi A5.
-        """
-        # Topul acestei jumatati A5
-        top = offset_y + a5_height
+# ============================================================================
+# RECEIPT ASSETS
+# ============================================================================
+LOGO_PATH = Path("logo.png")
+LOGO_SLOT_MM = (40, 25)  # latime x inaltime maxima a logo-ului pe bon
+LOGO_DPI = 300  # rezolutia de tiparire la care se pre-scaleaza
+mm = 72 / 25.4  # = reportlab.lib.units.mm, fara sa importam reportlab la pornirea scriptului
 
-        # Logo + date firma
-        header_y_start = top - 10 * mm
-        x_business = 10 * mm
-        y_pos = header_y_start
+# Fluxurile PDF raman binare: ASCII85 umfla imaginea logo-ului cu ~25% si encoderul lui
+# (Python pur fara rl_accel) ocupa cea mai mare parte din timpul de randare al unui bon.
+# reportlab nu are optiunea per canvas; rl_config citeste RL_useA85 o singura data, la import,
+# deci o setam aici (inainte de primul import reportlab) si poate fi suprascrisa din mediu.
+os.environ.setdefault("RL_useA85", "0")
 
-        # Company info - left side
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(x_business, y_pos, remove_diacritics(company_info.get('company_name', '')))
-        y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 7)
-        c.drawString(x_business, y_pos, remove_diacritics(company_info.get('company_address', '')))
-        y_pos -= 3 * mm
-        c.drawString(x_business, y_pos, f"CUI: {company_info.get('cui', '')}")
-        y_pos -= 3 * mm
-        c.drawString(x_business, y_pos, f"Reg.Com: {company_info.get('reg_com', '')}")
-        y_pos -= 3 * mm
-        c.drawString(x_business, y_pos, f"Tel: {company_info.get('phone', '')}")
-        y_pos -= 3 * mm
-        c.drawString(x_business, y_pos, f"Email: {company_info.get('email', '')}")
-
-        # Logo middle
-        logo_x = 85 * mm
-        logo_y = header_y_start - 20 * mm
-
-        if logo_image:
+
+def new_canvas(target, pagesize: tuple, **kwargs):
+    """reportlab canvas; reportlab is imported on the first PDF, not on every script start."""
+    from reportlab.pdfgen import canvas
+
+    return canvas.Canvas(target, pagesize=pagesize, **kwargs)
+
+
+class LogoAsset:
+    """
+    Logo-ul decodat o singura data si redus la rezolutia de tiparire pentru slotul de 40x25 mm.
+    Dimensiunile pe bon si ImageReader-ul sunt calculate aici si refolosite de ambele jumatati
+    ale fiecarui bon, deci PDF-urile nu mai decodeaza si nu mai incorporeaza PNG-ul original.
+    """
+
+    def __init__(self, data: bytes):
+        from PIL import Image
+        from reportlab.lib.utils import ImageReader
+
+        self.digest = hashlib.sha256(data).hexdigest()
+        img = Image.open(io.BytesIO(data))
+        img.load()
+
+        slot_w, slot_h = LOGO_SLOT_MM
+        aspect_ratio = img.height / img.width
+        self.width_mm, self.height_mm = slot_w, slot_w * aspect_ratio
+        if self.height_mm > slot_h:
+            self.height_mm = slot_h
+            self.width_mm = slot_h / aspect_ratio
+
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        target = (
+            max(1, round(self.width_mm / 25.4 * LOGO_DPI)),
+            max(1, round(self.height_mm / 25.4 * LOGO_DPI)),
+        )
+        if img.width > target[0] or img.height > target[1]:
+            img = img.resize(target, Image.LANCZOS)
+        self.image = img
+        self.reader = ImageReader(img)
+        png = io.BytesIO()
+        img.save(png, format="PNG", optimize=True)
+        self.png = png.getvalue()  # varianta redusa, pentru afisare in sidebar
+
+    def draw(self, c, x: float, y: float):
+        c.drawImage(self.reader, x, y, width=self.width_mm * mm, height=self.height_mm * mm,
+                    preserveAspectRatio=True, mask="auto")
+
+
+@st.cache_resource
+def get_logo_asset() -> Optional[LogoAsset]:
+    """logo.png from the repository, decoded and scaled once per process."""
+    try:
+        if LOGO_PATH.exists():
+            return LogoAsset(LOGO_PATH.read_bytes())
+    except Exception:
+        pass
+    return None
+
+
+def as_logo_asset(logo_image) -> Optional[LogoAsset]:
+    """Accepts a LogoAsset or raw image bytes / BytesIO (decoded on the spot)."""
+    # duck typing: fiecare rerun redefineste clasa, dar get_logo_asset() pastreaza instanta veche
+    if not logo_image or hasattr(logo_image, "reader"):
+        return logo_image or None
+    data = logo_image.getvalue() if hasattr(logo_image, "getvalue") else bytes(logo_image)
+    return LogoAsset(data)
+
+
+# ============================================================================
+# RECEIPT TEMPLATES
+# ============================================================================
+# Layout-ul documentelor ca date. Coordonatele sunt in mm, cu originea in coltul stanga-jos al
+# unei copii (jumatate A5 din A4). "static" se deseneaza o singura data ca form XObject, "fields"
+# pentru fiecare comanda. Textele pot contine {camp} din comanda (din company_info in "static").
+#   text  : at, text, font=("Helvetica", 8), align="left"|"center", color
+#   rect  : at, size, fill          line: from, to, dash          logo: at
+#   group : at, blocks (blocurile sunt relative la "at")
+#   flow  : at, items - coloana care curge in jos: line (text, if, font, step), gap (step),
+#           printers (font, step), wrap (field, label, default, font, measure_size, width, leading,
+#           max_lines, bottom). Textul care nu incape intr-un wrap (max_lines sau sub "bottom") se
+#           termina cu "..." si se tipareste complet pe o pagina de continuare.
+A5_TOP = 148.5
+
+RECEIPT_HEADER = [
+    # Company info - left side
+    {"type": "text", "at": (10, A5_TOP - 10), "text": "{company_name}", "font": ("Helvetica-Bold", 9)},
+    {"type": "text", "at": (10, A5_TOP - 13.5), "text": "{company_address}", "font": ("Helvetica", 7)},
+    {"type": "text", "at": (10, A5_TOP - 16.5), "text": "CUI: {cui}", "font": ("Helvetica", 7)},
+    {"type": "text", "at": (10, A5_TOP - 19.5), "text": "Reg.Com: {reg_com}", "font": ("Helvetica", 7)},
+    {"type": "text", "at": (10, A5_TOP - 22.5), "text": "Tel: {phone}", "font": ("Helvetica", 7)},
+    {"type": "text", "at": (10, A5_TOP - 25.5), "text": "Email: {email}", "font": ("Helvetica", 7)},
+    # Logo middle
+    {"type": "logo", "at": (85, A5_TOP - 30)},
+    # Client - right side (numele si telefonul sunt in RECEIPT_CLIENT)
+    {"type": "text", "at": (155, A5_TOP - 10), "text": "CLIENT", "font": ("Helvetica-Bold", 8)},
+]
+
+RECEIPT_CLIENT = [
+    {"type": "text", "at": (155, A5_TOP - 13.5), "text": "Nume: {client_name}", "font": ("Helvetica", 7)},
+    {"type": "text", "at": (155, A5_TOP - 16.5), "text": "Tel: {client_phone}", "font": ("Helvetica", 7)},
+]
+
+SIGNATURE_BOXES = [
+    {"type": "rect", "at": (10, 0), "size": (85, 18)},
+    {"type": "text", "at": (12, 15), "text": "OPERATOR SERVICE", "font": ("Helvetica-Bold", 8)},
+    {"type": "text", "at": (12, 2), "text": "Semnatura", "font": ("Helvetica", 7)},
+    {"type": "rect", "at": (115, 0), "size": (85, 18)},
+    {"type": "text", "at": (117, 15), "text": "CLIENT", "font": ("Helvetica-Bold", 8)},
+    {"type": "text", "at": (117, 11), "text": "Am luat la cunostinta", "font": ("Helvetica", 7)},
+    {"type": "text", "at": (117, 2), "text": "Semnatura", "font": ("Helvetica", 7)},
+]
+
+CUT_LINE = {"type": "line", "from": (5, 1), "to": (205, 1), "dash": (3, 3)}
+
+
+def receipt_title(title: str, number_color: str) -> tuple:
+    """Titlul (static) si numarul comenzii (camp) de sub el."""
+    return (
+        {"type": "text", "at": (105, A5_TOP - 38), "text": title, "font": ("Helvetica-Bold", 12), "align": "center"},
+        {"type": "text", "at": (105, A5_TOP - 44), "text": "Nr. Comanda: {order_id}",
+         "font": ("Helvetica-Bold", 10), "align": "center", "color": number_color},
+    )
+
+
+def footer_note(text: str) -> dict:
+    return {"type": "text", "at": (105, 3), "text": text, "font": ("Helvetica", 6), "align": "center"}
+
+
+INITIAL_TITLE, INITIAL_NUMBER = receipt_title("DOVADA PREDARE ECHIPAMENT IN SERVICE", "#E5283A")
+COMPLETION_TITLE, COMPLETION_NUMBER = receipt_title("DOVADA RIDICARE ECHIPAMENT DIN SERVICE", "#00aa00")
+
+RECEIPT_TEMPLATES = {
+    "initial": {
+        "page": (210, 297),
+        "copies": (0, A5_TOP),  # jumatatea de jos + jumatatea de sus
+        "static": [
+            *RECEIPT_HEADER,
+            INITIAL_TITLE,
+            {"type": "text", "at": (10, A5_TOP - 50), "text": "DETALII ECHIPAMENT:", "font": ("Helvetica-Bold", 9)},
+            {"type": "group", "at": (0, 22), "blocks": SIGNATURE_BOXES},
+            {"type": "text", "at": (105, 18), "align": "center", "font": ("Helvetica-Bold", 7),
+             "text": "Avand in vedere ca dispozitivele din prezenta fisa nu au putut fi testate in momentul preluarii lor, acestea sunt considerate ca fiind nefunctionale."},
+            {"type": "text", "at": (105, 15), "align": "center", "font": ("Helvetica", 7),
+             "text": "Aveti obligatia ca, la finalizarea reparatiei echipamentului aflat in service, sa va prezentati in termen de 30 de zile de la data anuntarii de catre"},
+            {"type": "text", "at": (105, 12), "align": "center", "font": ("Helvetica", 7),
+             "text": "reprezentantul SC PRINTHEAD COMPLETE SOLUTIONS SRL pentru a ridica echipamentul.In cazul neridicarii echipamentului"},
+            {"type": "text", "at": (105, 9), "align": "center", "font": ("Helvetica", 7),
+             "text": "in intervalul specificat mai sus, ne rezervam dreptul de valorificare a acestuia"},
+            footer_note("Acest document constituie dovada predarii echipamentului in service."),
+            CUT_LINE,
+        ],
+        "fields": [
+            *RECEIPT_CLIENT,
+            INITIAL_NUMBER,
+            {"type": "flow", "at": (10, A5_TOP - 55), "items": [
+                {"type": "printers", "step": 4},
+                {"type": "line", "text": "Data predarii: {date_received}", "step": 4},
+                {"type": "line", "text": "Accesorii: {accessories}", "if": "accessories", "step": 4},
+                {"type": "gap", "step": 2},
+                # pozitia depinde de numarul de imprimante, deci nu poate fi in stratul static
+                {"type": "line", "text": "PROBLEMA RAPORTATA:", "font": ("Helvetica-Bold", 9), "step": 4},
+                {"type": "wrap", "field": "issue_description", "label": "PROBLEMA RAPORTATA", "width": 190,
+                 "bottom": 42},  # deasupra casutelor de semnatura
+            ]},
+        ],
+    },
+    "completion": {
+        "page": (210, 297),
+        "copies": (0, A5_TOP),
+        "static": [
+            *RECEIPT_HEADER,
+            COMPLETION_TITLE,
+            # Three columns section
+            {"type": "text", "at": (10, A5_TOP - 50), "text": "DETALII ECHIPAMENT:", "font": ("Helvetica-Bold", 9)},
+            {"type": "text", "at": (73, A5_TOP - 50), "text": "REPARATII EFECTUATE:", "font": ("Helvetica-Bold", 9)},
+            {"type": "text", "at": (136, A5_TOP - 50), "text": "PIESE UTILIZATE:", "font": ("Helvetica-Bold", 9)},
+            # Cost table (coborat cu 15 mm fata de layout-ul original)
+            {"type": "group", "at": (10, A5_TOP - 93), "blocks": [
+                {"type": "text", "at": (0, 0), "text": "COSTURI:", "font": ("Helvetica-Bold", 9)},
+                {"type": "rect", "at": (0, -24), "size": (70, 20)},
+                {"type": "rect", "at": (0, -9), "size": (70, 5), "fill": "#e0e0e0"},
+                {"type": "text", "at": (2, -7.5), "text": "Descriere", "font": ("Helvetica-Bold", 8)},
+                {"type": "text", "at": (48, -7.5), "text": "Suma (RON)", "font": ("Helvetica-Bold", 8)},
+                {"type": "line", "from": (0, -9), "to": (70, -9)},
+                {"type": "text", "at": (2, -12.5), "text": "Manopera"},
+                {"type": "line", "from": (0, -14), "to": (70, -14)},
+                {"type": "text", "at": (2, -17.5), "text": "Piese"},
+                {"type": "line", "from": (0, -19), "to": (70, -19)},
+                {"type": "rect", "at": (0, -24), "size": (70, 5), "fill": "#f0f0f0"},
+                {"type": "text", "at": (2, -22.5), "text": "TOTAL", "font": ("Helvetica-Bold", 9)},
+            ]},
+            {"type": "group", "at": (0, 7), "blocks": SIGNATURE_BOXES},
+            footer_note("Acest document constituie dovada ridicarii echipamentului din service."),
+            CUT_LINE,
+        ],
+        "fields": [
+            *RECEIPT_CLIENT,
+            COMPLETION_NUMBER,
+            # LEFT COLUMN - Equipment details (MULTIPLE PRINTERS)
+            {"type": "flow", "at": (10, A5_TOP - 55), "items": [
+                {"type": "printers", "step": 4},
+                {"type": "line", "text": "Data predarii: {date_received}", "step": 4},
+                {"type": "line", "text": "Ridicare: {date_picked_up}", "if": "date_picked_up", "step": 4},
+                {"type": "line", "text": "Accesorii: {accessories}", "if": "accessories", "step": 4},
+            ]},
+            # MIDDLE COLUMN - Repairs
+            {"type": "flow", "at": (73, A5_TOP - 53.5), "items": [
+                {"type": "wrap", "field": "repair_details", "label": "REPARATII EFECTUATE", "default": "N/A",
+                 "measure_size": 7,
+                 "width": 45, "leading": 2.5, "max_lines": 5},
+            ]},
+            # RIGHT COLUMN - Parts used
+            {"type": "flow", "at": (136, A5_TOP - 53.5), "items": [
+                {"type": "wrap", "field": "parts_used", "label": "PIESE UTILIZATE", "default": "N/A",
+                 "measure_size": 7,
+                 "width": 61, "leading": 2.5, "max_lines": 5},
+            ]},
+            # Sumele din tabelul de costuri
+            {"type": "group", "at": (10, A5_TOP - 93), "blocks": [
+                {"type": "text", "at": (48, -12.5), "text": "{labor_cost:.2f}"},
+                {"type": "text", "at": (48, -17.5), "text": "{parts_cost:.2f}"},
+                {"type": "text", "at": (48, -22.5), "text": "{total_cost:.2f}", "font": ("Helvetica-Bold", 9)},
+            ]},
+        ],
+    },
+}
+
+
+# ============================================================================
+# RECEIPT TEMPLATE ENGINE
+# ============================================================================
+DEFAULT_FONT = ("Helvetica", 8)
+TEMPLATE_FIELD_RE = re.compile(r"\{(\w+)")
+LEGACY_PRINTER_FIELDS = ("printer_brand", "printer_model", "printer_serial")
+
+
+class TemplateFields(dict):
+    """Campurile unui document; cele lipsa se afiseaza gol."""
+
+    def __missing__(self, key):
+        return ""
+
+
+def template_fields(values: dict) -> TemplateFields:
+    """Values as printable text (fara diacritice - fonturile standard PDF nu au ș/ț)."""
+    fields = TemplateFields()
+    for key, value in (values or {}).items():
+        if not isinstance(value, (list, dict)):
+            fields[key] = remove_diacritics(safe_text(value))
+    return fields
+
+
+def order_template_fields(order: dict) -> TemplateFields:
+    fields = template_fields(order)
+    labor = safe_float(order.get('labor_cost', 0))
+    parts = safe_float(order.get('parts_cost', 0))
+    fields["labor_cost"] = labor
+    fields["parts_cost"] = parts
+    fields["total_cost"] = safe_float(order.get('total_cost', labor + parts))
+    return fields
+
+
+def compile_blocks(blocks, dx: float = 0.0, dy: float = 0.0) -> list:
+    """Transforma blocurile (mm, relative) in operatii cu coordonate absolute in puncte."""
+    from reportlab.lib import colors
+
+    ops = []
+    for block in blocks:
+        kind = block["type"]
+        if kind == "group":
+            gx, gy = block["at"]
+            ops.extend(compile_blocks(block["blocks"], dx + gx, dy + gy))
+            continue
+        if kind == "line":
+            (x1, y1), (x2, y2) = block["from"], block["to"]
+            ops.append(("line", (dx + x1) * mm, (dy + y1) * mm, (dx + x2) * mm, (dy + y2) * mm, block.get("dash")))
+            continue
+        x, y = block["at"]
+        x, y = (dx + x) * mm, (dy + y) * mm
+        if kind == "text":
+            text = block["text"]
+            face, size = block.get("font", DEFAULT_FONT)
+            color = block.get("color")
+            ops.append(("text", x, y, text, "{" in text, face, size, block.get("align", "left"),
+                        colors.HexColor(color) if color else None))
+        elif kind == "rect":
+            w, h = block["size"]
+            fill = block.get("fill")
+            ops.append(("rect", x, y, w * mm, h * mm, colors.HexColor(fill) if fill else None))
+        elif kind == "logo":
+            ops.append(("logo", x, y))
+        elif kind == "flow":
+            ops.append(("flow", x, y, [compile_flow_item(item) for item in block["items"]]))
+        else:
+            raise ValueError(f"Unknown template block type: {kind}")
+    return ops
+
+
+def compile_flow_item(item: dict) -> tuple:
+    kind = item["type"]
+    face, size = item.get("font", DEFAULT_FONT)
+    if kind == "gap":
+        return ("gap", item["step"] * mm)
+    if kind == "line":
+        text = item["text"]
+        return ("line", text, "{" in text, item.get("if"), face, size, item["step"] * mm)
+    if kind == "printers":
+        return ("printers", face, size, item["step"] * mm)
+    if kind == "wrap":
+        leading = item["leading"] * mm if "leading" in item else size * 1.2  # ca la beginText
+        bottom = item["bottom"] * mm if "bottom" in item else None
+        return ("wrap", item["field"], item.get("default", ""), face, size, item.get("measure_size", size),
+                item["width"] * mm, leading, item.get("max_lines"), bottom, item.get("label", item["field"]))
+    raise ValueError(f"Unknown flow item type: {kind}")
+
+
+def template_field_names(ops) -> tuple:
+    """Campurile comenzii folosite de operatii (pentru cheia din cache-ul de bonuri)."""
+    names = set()
+    for op in ops:
+        if op[0] == "text":
+            names.update(TEMPLATE_FIELD_RE.findall(op[3]))
+        elif op[0] == "flow":
+            for item in op[3]:
+                if item[0] == "line":
+                    names.update(TEMPLATE_FIELD_RE.findall(item[1]))
+                    if item[3]:
+                        names.add(item[3])
+                elif item[0] == "printers":
+                    names.update(LEGACY_PRINTER_FIELDS)
+                elif item[0] == "wrap":
+                    names.add(item[1])
+    return tuple(sorted(names))
+
+
+WORD_WIDTH_CACHE_SIZE = 20000  # cuvinte per font si marime
+WRAP_CACHE_SIZE = 2048
+OVERFLOW_MARK = "..."
+
+
+@st.cache_resource
+def text_layout_caches() -> tuple:
+    """Latimile de cuvinte si liniile impartite: per proces, nu per rerun (scriptul se re-executa la fiecare rerun)."""
+    return {}, OrderedDict(), threading.Lock()
+
+
+_word_widths, _wrap_cache, _wrap_lock = text_layout_caches()
+
+
+def word_width(word: str, font: str, size: float) -> float:
+    """Latimea unui cuvant, memorata per (font, marime)."""
+    widths = _word_widths.get((font, size))
+    if widths is None:
+        widths = _word_widths.setdefault((font, size), {})
+    width = widths.get(word)
+    if width is None:
+        from reportlab.pdfbase import pdfmetrics
+
+        if len(widths) >= WORD_WIDTH_CACHE_SIZE:
+            widths.clear()
+        width = widths[word] = pdfmetrics.stringWidth(word, font, size)
+    return width
+
+
+def break_word(word: str, font: str, size: float, width: float) -> list:
+    """Rupe un cuvant in bucati mai inguste decat `width` (cel putin un caracter per bucata)."""
+    pieces = []
+    start = 0
+    acc = 0.0
+    for k, ch in enumerate(word):
+        w = word_width(ch, font, size)
+        if acc + w >= width and k > start:
+            pieces.append(word[start:k])
+            start, acc = k, 0.0
+        acc += w
+    pieces.append(word[start:])
+    return pieces
+
+
+class WrappedText:
+    """Liniile care incap si textul ramas (rest) cand s-a atins limita de linii."""
+
+    __slots__ = ("lines", "rest")
+
+    def __init__(self, lines: list, rest: str = ""):
+        self.lines = lines
+        self.rest = rest
+
+    @property
+    def overflow(self) -> bool:
+        return bool(self.rest)
+
+
+def wrap_text(text: str, font: str, size: float, width: float, max_lines: Optional[int] = None) -> WrappedText:
+    """
+    Greedy word wrap in timp liniar: o linie primeste cuvinte cat timp latimea ei (cu spatiul
+    de dupa fiecare cuvant) ramane sub `width`. Latimile cuvintelor si rezultatele sunt memorate,
+    deci cele doua copii ale bonului si re-randarile aceleiasi comenzi nu mai masoara nimic.
+    """
+    key = (text, font, size, width, max_lines)
+    with _wrap_lock:
+        wrapped = _wrap_cache.get(key)
+        if wrapped is not None:
+            _wrap_cache.move_to_end(key)
+            return wrapped
+
+    space = word_width(" ", font, size)
+    words = text.split()
+    lines = []
+    line = []
+    line_width = 0.0
+    rest = ""
+    for i, word in enumerate(words):
+        w = word_width(word, font, size) + space
+        if line_width + w < width:
+            line.append(word)
+            line_width += w
+            continue
+        # un cuvant mai lat decat toata linia (serie, email) se rupe pe caractere
+        pieces = [word] if w < width else break_word(word, font, size, width - space)
+        for j, piece in enumerate(pieces):
+            if line:
+                lines.append(" ".join(line))
+                if max_lines and len(lines) >= max_lines:
+                    rest = " ".join(["".join(pieces[j:])] + words[i + 1:])
+                    line = []
+                    break
+            line = [piece]
+            line_width = word_width(piece, font, size) + space
+        if rest:
+            break
+    if line:
+        lines.append(" ".join(line))
+    wrapped = WrappedText(lines, rest)
+
+    with _wrap_lock:
+        _wrap_cache[key] = wrapped
+        if len(_wrap_cache) > WRAP_CACHE_SIZE:
+            _wrap_cache.popitem(last=False)
+    return wrapped
+
+
+def printer_lines(printers: list, fields: TemplateFields):
+    if printers:
+        for idx, p in enumerate(printers, start=1):
+            brand = remove_diacritics(safe_text(p.get("brand", "")))
+            model = remove_diacritics(safe_text(p.get("model", "")))
+            serial = safe_text(p.get("serial", ""))
+
+            line = f"{idx}. {brand} {model}"
+            if serial:
+                line += f" (SN: {serial})"
+            yield line
+    else:
+        # fallback daca totusi nu exista nicio imprimanta
+        yield f"Imprimanta: {fields['printer_brand']} {fields['printer_model']}"
+        if fields["printer_serial"]:
+            yield f"Serie: {fields['printer_serial']}"
+
+
+def draw_logo_placeholder(c, logo_x: float, logo_y: float):
+    from reportlab.lib import colors
+
+    c.setFillColor(colors.HexColor('#f0f0f0'))
+    c.rect(logo_x, logo_y, 40 * mm, 25 * mm, fill=1, stroke=1)
+    c.setFillColor(colors.black)
+    c.setFont("Helvetica-Bold", 10)
+    c.drawCentredString(logo_x + 20 * mm, logo_y + 12.5 * mm, "[LOGO]")
+
+
+def run_ops(c, ops, fields: TemplateFields, logo: Optional[LogoAsset] = None, printers=()) -> list:
+    """Executa operatiile compilate pe canvas (in coordonatele copiei curente); intoarce textele taiate."""
+    from reportlab.lib import colors
+
+    font = None
+    overflow = []
+    for op in ops:
+        kind = op[0]
+        if kind == "text":
+            _, x, y, text, dynamic, face, size, align, color = op
+            if dynamic:
+                text = text.format_map(fields)
+            if font != (face, size):
+                c.setFont(face, size)
+                font = (face, size)
+            if color:
+                c.setFillColor(color)
+            if align == "center":
+                c.drawCentredString(x, y, text)
+            else:
+                c.drawString(x, y, text)
+            if color:
+                c.setFillColor(colors.black)
+        elif kind == "rect":
+            _, x, y, w, h, fill = op
+            if fill:
+                c.setFillColor(fill)
+                c.rect(x, y, w, h, fill=1)
+                c.setFillColor(colors.black)
+            else:
+                c.rect(x, y, w, h)
+        elif kind == "line":
+            _, x1, y1, x2, y2, dash = op
+            if dash:
+                c.setDash(*dash)
+            c.line(x1, y1, x2, y2)
+            if dash:
+                c.setDash()
+        elif kind == "logo":
+            _, x, y = op
             try:
-                logo_image.seek(0)
-                img = Image.open(logo_image)
-
-                target_width_mm = 40
-                aspect_ratio = img.height / img.width
-                target_height_mm = target_width_mm * aspect_ratio
-
-                if target_height_mm > 25:
-                    target_height_mm = 25
-                    target_width_mm = target_height_mm / aspect_ratio
-
-                logo_image.seek(0)
-                c.drawImage(
-                    ImageReader(logo_image),
-                    logo_x,
-                    logo_y,
-                    width=target_width_mm * mm,
-                    height=target_height_mm * mm,
-                    preserveAspectRatio=True,
-                    mask='auto'
-                )
+                if not logo:
+                    raise ValueError("no logo")
+                logo.draw(c, x, y)
             except Exception:
-                c.setFillColor(colors.HexColor('#f0f0f0'))
-                c.rect(logo_x, logo_y, 40 * mm, 25 * mm, fill=1, stroke=1)
-                c.setFillColor(colors.black)
-                c.setFont("Helvetica-Bold", 10)
-                c.drawCentredString(logo_x + 20 * mm, logo_y + 12.5 * mm, "[LOGO]")
-        else:
-            c.setFillColor(colors.HexColor('#f0f0f0'))
-            c.rect(logo_x, logo_y, 40 * mm, 25 * mm, fill=1, stroke=1)
-            c.setFillColor(colors.black)
-            c.setFont("Helvetica-Bold", 10)
-            c.drawCentredString(logo_x + 20 * mm, logo_y + 12.5 * mm, "[LOGO]")
-
-        # Client info - right side
-        c.setFillColor(colors.black)
-        x_client = 155 * mm
-        y_pos = header_y_start
-        c.setFont("Helvetica-Bold", 8)
-        c.drawString(x_client, y_pos, "CLIENT")
-        y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 7)
-        c.drawString(x_client, y_pos, f"Nume: {remove_diacritics(safe_text(order.get('client_name', '')))}")
-        y_pos -= 3 * mm
-        c.drawString(x_client, y_pos, f"Tel: {safe_text(order.get('client_phone', ''))}")
-
-        # Title
-        title_y = top - 38 * mm
-        c.setFont("Helvetica-Bold", 12)
-        c.drawCentredString(105 * mm, title_y, "DOVADA PREDARE ECHIPAMENT IN SERVICE")
-        c.setFont("Helvetica-Bold", 10)
-        c.setFillColor(colors.HexColor('#E5283A'))
-        c.drawCentredString(105 * mm, title_y - 6 * mm, f"Nr. Comanda: {safe_text(order.get('order_id', ''))}")
-        c.setFillColor(colors.black)
-
-        # Equipment details (MULTIPLE PRINTERS)
-        y_pos = top - 50 * mm
+                draw_logo_placeholder(c, x, y)
+            font = None
+        elif kind == "flow":
+            overflow.extend(run_flow(c, op[1], op[2], op[3], fields, printers))
+            font = None
+    return overflow
+
+
+def layout_flow(x: float, y: float, items, fields: TemplateFields, printers) -> tuple:
+    """Pozitiile liniilor unei coloane: ([(x, y, font, size, text)], [(label, text complet)])."""
+    drawn = []
+    overflow = []
+    for item in items:
+        kind = item[0]
+        if kind == "gap":
+            y -= item[1]
+        elif kind == "line":
+            _, text, dynamic, condition, face, size, step = item
+            if condition and not fields[condition].strip():
+                continue
+            drawn.append((x, y, face, size, text.format_map(fields) if dynamic else text))
+            y -= step
+        elif kind == "printers":
+            _, face, size, step = item
+            for line in printer_lines(printers, fields):
+                drawn.append((x, y, face, size, line))
+                y -= step
+        elif kind == "wrap":
+            _, field, default, face, size, measure_size, width, leading, max_lines, bottom, label = item
+            if bottom is not None:
+                fit = max(1, int((y - bottom) // leading) + 1)
+                max_lines = min(max_lines, fit) if max_lines else fit
+            text = fields.get(field, default)
+            wrapped = wrap_text(text, face, measure_size, width, max_lines)
+            lines = wrapped.lines
+            if wrapped.overflow:
+                lines = lines[:-1] + [f"{lines[-1]} {OVERFLOW_MARK}".lstrip()]
+                overflow.append((label, text))
+            for line in lines:
+                drawn.append((x, y, face, size, line))
+                y -= leading
+    return drawn, overflow
+
+
+def run_flow(c, x: float, y: float, items, fields: TemplateFields, printers) -> list:
+    drawn, overflow = layout_flow(x, y, items, fields, printers)
+    font = None
+    for line_x, line_y, face, size, text in drawn:
+        if font != (face, size):
+            c.setFont(face, size)
+            font = (face, size)
+        c.drawString(line_x, line_y, text)
+    return overflow
+
+
+def flow_overflow(ops, fields: TemplateFields, printers=()) -> list:
+    """Textele care nu incap in coloanele lor, fara a desena nimic."""
+    overflow = []
+    for op in ops:
+        if op[0] == "flow":
+            overflow.extend(layout_flow(op[1], op[2], op[3], fields, printers)[1])
+    return overflow
+
+
+def draw_continuation(c, order_id: str, overflow: list, pagesize: tuple):
+    """Pagina (sau paginile) de continuare cu textul complet al campurilor care nu au incaput."""
+    page_w, page_h = pagesize
+    x = 10 * mm
+    top = page_h - 15 * mm
+    leading = 8 * 1.2
+
+    c.showPage()
+    y = top
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(x, y, f"CONTINUARE - Nr. Comanda: {order_id}")
+    y -= 10 * mm
+    for label, text in overflow:
+        if y < 25 * mm:
+            c.showPage()
+            y = top
         c.setFont("Helvetica-Bold", 9)
-        c.drawString(10 * mm, y_pos, "DETALII ECHIPAMENT:")
-        y_pos -= 5 * mm
+        c.drawString(x, y, f"{label}:")
+        y -= 5 * mm
         c.setFont("Helvetica", 8)
+        for line in wrap_text(text, "Helvetica", 8, page_w - 2 * x).lines:
+            if y < 15 * mm:
+                c.showPage()
+                c.setFont("Helvetica", 8)
+                y = top
+            c.drawString(x, y, line)
+            y -= leading
+        y -= 4 * mm
 
-        printers = load_printers_from_order(order)
 
-        if printers:
-            for idx, p in enumerate(printers, start=1):
-                brand = remove_diacritics(safe_text(p.get("brand", "")))
-                model = remove_diacritics(safe_text(p.get("model", "")))
-                serial = safe_text(p.get("serial", ""))
+def receipt_form_name(kind: str, company_info: dict, logo: Optional[LogoAsset]) -> str:
+    """Numele form-ului static: se schimba doar cand se schimba datele firmei sau logo-ul."""
+    payload = json.dumps([kind, company_info, logo.digest if logo else ""], sort_keys=True, default=str)
+    return f"receipt_{kind}_{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}"
 
-                line = f"{idx}. {brand} {model}"
-                if serial:
-                    line += f" (SN: {serial})"
 
-                c.drawString(10 * mm, y_pos, line)
-                y_pos -= 4 * mm
-        else:
-            # fallback daca totusi nu exista nicio imprimanta
-            printer_info = f"{remove_diacritics(safe_text(order.get('printer_brand', '')))} {remove_diacritics(safe_text(order.get('printer_model', '')))}"
-            c.drawString(10 * mm, y_pos, f"Imprimanta: {printer_info}")
-            y_pos -= 4 * mm
-            serial = safe_text(order.get('printer_serial', ''))
-            if serial:
-                c.drawString(10 * mm, y_pos, f"Serie: {serial}")
-                y_pos -= 4 * mm
+class ReceiptPlan:
+    """
+    Un template compilat: operatii in puncte, impartite in stratul static (form XObject,
+    definit o data per document si versiune firma/logo) si campurile comenzii.
+    """
 
-        # Data si accesorii - la nivel de comanda
-        c.drawString(10 * mm, y_pos, f"Data predarii: {safe_text(order.get('date_received', ''))}")
-        y_pos -= 4 * mm
+    def __init__(self, kind: str, template: dict):
+        self.kind = kind
+        page_w, page_h = template["page"]
+        self.pagesize = (page_w * mm, page_h * mm)
+        self.copies = tuple(y * mm for y in template["copies"])
+        self.static_ops = compile_blocks(template["static"])
+        self.field_ops = compile_blocks(template["fields"])
+        self.fields = template_field_names(self.field_ops)
+
+    def static_form(self, c, company_info: dict, logo: Optional[LogoAsset]) -> str:
+        name = receipt_form_name(self.kind, company_info, logo)
+        if not c.hasForm(name):
+            c.beginForm(name, 0, 0, *self.pagesize)
+            c.saveState()
+            run_ops(c, self.static_ops, template_fields(company_info), logo=logo)
+            c.restoreState()
+            c.endForm()
+        return name
+
+    def draw_page(self, c, order: dict, company_info: dict, logo: Optional[LogoAsset] = None) -> list:
+        """
+        Deseneaza pe pagina curenta toate copiile documentului pentru o comanda. Daca un text nu
+        incape, adauga pagini de continuare; intoarce etichetele campurilor taiate.
+        """
+        form = self.static_form(c, company_info, logo)
+        fields = order_template_fields(order)
+        printers = order_printers(order)  # o singura data pentru toate copiile
+        overflow = []
+        for offset_y in self.copies:
+            c.saveState()
+            c.translate(0, offset_y)
+            c.doForm(form)
+            overflow = run_ops(c, self.field_ops, fields, printers=printers)  # identic pentru fiecare copie
+            c.restoreState()
+        if overflow:
+            draw_continuation(c, fields["order_id"], overflow, self.pagesize)
+        return [label for label, _ in overflow]
+
+    def overflow(self, order: dict) -> list:
+        """Etichetele campurilor comenzii care nu incap pe document."""
+        fields = order_template_fields(order)
+        return [label for label, _ in flow_overflow(self.field_ops, fields, order_printers(order))]
+
+    def render(self, order: dict, company_info: dict, logo_image=None) -> io.BytesIO:
+        buffer = io.BytesIO()
+        c = new_canvas(buffer, self.pagesize)
+        self.draw_page(c, order, company_info, as_logo_asset(logo_image))
+        c.save()
+        buffer.seek(0)
+        return buffer
 
-        accessories = safe_text(order.get('accessories', ''))
-        if accessories and accessories.strip():
-            c.drawString(10 * mm, y_pos, f"Accesorii: {remove_diacritics(accessories)}")
-            y_pos -= 4 * mm
 
-        # Issue description
-        y_pos -= 2 * mm
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(10 * mm, y_pos, "PROBLEMA RAPORTATA:")
-        y_pos -= 4 * mm
-        c.setFont("Helvetica", 8)
+@st.cache_resource
+def get_receipt_plan(kind: str) -> ReceiptPlan:
+    """Template-ul compilat o singura data per proces (supravietuieste rerun-urilor, ca logo-ul)."""
+    return ReceiptPlan(kind, RECEIPT_TEMPLATES[kind])
 
-        issue_text = remove_diacritics(safe_text(order.get('issue_description', '')))
-        text_object = c.beginText(10 * mm, y_pos)
-        text_object.setFont("Helvetica", 8)
-        words = issue_text.split()
-        line = ""
-        for word in words:
-            test_line = line + word + " "
-            if c.stringWidth(test_line, "Helvetica", 8) < 190 * mm:
-                line = test_line
-            else:
-                text_object.textLine(line)
-                line = word + " "
-        if line:
-            text_object.textLine(line)
-        c.drawText(text_object)
-
-        # Signature boxes
-        sig_y = offset_y + 22 * mm
-        sig_height = 18 * mm
-
-        c.rect(10 * mm, sig_y, 85 * mm, sig_height)
-        c.setFont("Helvetica-Bold", 8)
-        c.drawString(12 * mm, sig_y + sig_height - 3 * mm, "OPERATOR SERVICE")
-        c.setFont("Helvetica", 7)
-        c.drawString(12 * mm, sig_y + 2 * mm, "Semnatura")
-
-        c.rect(115 * mm, sig_y, 85 * mm, sig_height)
-        c.setFont("Helvetica-Bold", 8)
-        c.drawString(117 * mm, sig_y + sig_height - 3 * mm, "CLIENT")
-        c.setFont("Helvetica", 7)
-        c.drawString(117 * mm, sig_y + sig_height - 7 * mm, "Am luat la cunostinta")
-        c.drawString(117 * mm, sig_y + 2 * mm, "Semnatura")
-
-        # more info (footer text for aceasta jumatate A5)
-        c.setFont("Helvetica-Bold", 7)
-        c.drawCentredString(105 * mm, offset_y + 18 * mm,
-                            "Avand in vedere ca dispozitivele din prezenta fisa nu au putut fi testate in momentul preluarii lor, acestea sunt considerate ca fiind nefunctionale.")
-        c.setFont("Helvetica", 7)
-        c.drawCentredString(105 * mm, offset_y + 15 * mm,
-                            "Aveti obligatia ca, la finalizarea reparatiei echipamentului aflat in service, sa va prezentati in termen de 30 de zile de la data anuntarii de catre")
-        c.setFont("Helvetica", 7)
-        c.drawCentredString(105 * mm, offset_y + 12 * mm,
-                            "reprezentantul SC PRINTHEAD COMPLETE SOLUTIONS SRL pentru a ridica echipamentul.In cazul neridicarii echipamentului")
-        c.setFont("Helvetica", 7)
-        c.drawCentredString(105 * mm, offset_y + 9 * mm,
-                            "in intervalul specificat mai sus, ne rezervam dreptul de valorificare a acestuia")
-
-        # Footer
-        c.setFont("Helvetica", 6)
-        c.drawCentredString(105 * mm, offset_y + 3 * mm,
-                            "Acest document constituie dovada predarii echipamentului in service.")
-        c.setDash(3, 3)
-        c.line(5 * mm, offset_y + 1 * mm, 205 * mm, offset_y + 1 * mm)
-        c.setDash()
-
-    # Desenam doua jumatati A5 pe aceeasi pagina A4
-    draw_half(0)            # jumatatea de jos
-    draw_half(a5_height)    # jumatatea de sus
 
-    c.save()
-    buffer.seek(0)
-    return buffer
+def receipt_overflow(kind: str, order: dict) -> list:
+    return get_receipt_plan(kind).overflow(order)
 
 
+def generate_initial_receipt_pdf(order, company_info, logo_image=None):
+    """Generate A4 PDF with TWO identical A5 receipts (top + bottom)."""
+    return get_receipt_plan("initial").render(order, company_info, logo_image)
 
 
 def generate_completion_receipt_pdf(order, company_info, logo_image=None):
     """Generate A4 PDF with TWO identical A5 completion receipts (top + bottom)."""
-    buffer = io.BytesIO()
+    return get_receipt_plan("completion").render(order, company_info, logo_image)
+
+
+# ============================================================================
+# RECEIPT PDF CACHE
+# ============================================================================
+RECEIPT_GENERATORS = {
+    "initial": generate_initial_receipt_pdf,
+    "completion": generate_completion_receipt_pdf,
+}
+
+
+def logo_digest(logo_image) -> str:
+    if not logo_image:
+        return ""
+    if hasattr(logo_image, "digest"):
+        return logo_image.digest
+    return hashlib.sha256(logo_image.getbuffer()).hexdigest()
+
+
+def receipt_cache_key(kind: str, order: dict, company_info: dict, logo_image=None) -> str:
+    """Hash of exactly what the receipt shows: its order fields, printers, company info and logo."""
+    content = {
+        "kind": kind,
+        "order": {f: safe_text(order.get(f)) for f in get_receipt_plan(kind).fields},
+        "printers": order_printers(order),
+        "company": {k: safe_text(v) for k, v in sorted((company_info or {}).items())},
+        "logo": logo_digest(logo_image),
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ReceiptCache:
+    """LRU of rendered receipt PDFs, bounded by total bytes and entry count; shared by all sessions."""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_entries: int = 500):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> bytes, cel mai recent folosit la final
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+@st.cache_resource
+def get_receipt_cache() -> ReceiptCache:
+    """[storage] receipt_cache_mb / receipt_cache_entries size the process-wide receipt cache."""
+    config = storage_config()
+    return ReceiptCache(
+        max_bytes=int(float(config.get("receipt_cache_mb", 32)) * 1024 * 1024),
+        max_entries=int(config.get("receipt_cache_entries", 500)),
+    )
+
+
+def render_receipt_pdf(kind: str, order: dict, company_info: dict, logo_image=None) -> bytes:
+    """Receipt PDF bytes ("initial" / "completion"), rendered only when its content changed."""
+    cache = get_receipt_cache()
+    key = receipt_cache_key(kind, order, company_info, logo_image)
+    data = cache.get(key)
+    if data is None:
+        data = RECEIPT_GENERATORS[kind](order, company_info, logo_image).getvalue()
+        cache.put(key, data)
+    return data
+
+
+# ============================================================================
+# BATCH RECEIPTS
+# ============================================================================
+BATCH_DIR = Path(tempfile.gettempdir()) / "crm_receipts"
+BATCH_MAX_AGE = timedelta(hours=6)  # exporturile mai vechi se sterg la urmatorul export
+BATCH_MAX_WORKERS = 8
+# Costuri masurate pe 1 vCPU: un pool "spawn" importa modulul in fiecare proces (~1.3 s pana la primul
+# rezultat); un PDF separat (ZIP) ~8 ms/bon; o pagina in PDF-ul comun ~1 ms, pentru ca stratul static
+# e un singur form XObject; lipirea partilor cu pypdf ~0.6 ms/pagina, in procesul curent. Cu 8 procese
+# pool-ul castiga pentru ZIP de la ~200 de bonuri, pentru PDF-ul comun abia de la cateva mii.
+BATCH_POOL_START_S = 1.3
+BATCH_RENDER_S = {"zip": 0.008, "pdf": 0.001}
+BATCH_MERGE_S = 0.0006
+
+
+def receipt_filename(kind: str, order: dict) -> str:
+    return f"{kind.title()}_{safe_text(order.get('order_id')) or 'order'}.pdf"
+
+
+def batch_output_path(kind: str, suffix: str) -> Path:
+    """Fisier nou in BATCH_DIR (dupa ce sterge exporturile vechi)."""
+    BATCH_DIR.mkdir(parents=True, exist_ok=True)
+    cutoff = time.time() - BATCH_MAX_AGE.total_seconds()
+    for old in BATCH_DIR.iterdir():
+        try:
+            if old.stat().st_mtime < cutoff:
+                old.unlink()
+        except OSError:
+            pass
+    fd, path = tempfile.mkstemp(prefix=f"{kind}_receipts_", suffix=suffix, dir=BATCH_DIR)
+    os.close(fd)
+    return Path(path)
+
+
+def batch_pool_workers(n_orders: int, render_s: float, merge_s: float = 0.0) -> int:
+    """
+    Procese pentru n bonuri (0 = randare in procesul curent): pool-ul se foloseste doar cand pornirea
+    lui plus max(randare / procese, lipirea in procesul curent) e sub randarea seriala.
+    """
+    workers = min(os.cpu_count() or 1, BATCH_MAX_WORKERS, n_orders // 10)
+    if workers < 2:
+        return 0
+    pooled = BATCH_POOL_START_S + n_orders * max(render_s / workers, merge_s)
+    return workers if pooled < n_orders * render_s else 0
+
+
+def batch_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn: procesele nu mostenesc thread-urile si lock-urile serverului
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def render_receipt_chunk(kind: str, orders: list, company_info: dict) -> list:
+    """Worker din pool: [(nume fisier, PDF)] pentru cateva comenzi; logo-ul se incarca o data per proces."""
+    plan, logo = get_receipt_plan(kind), get_logo_asset()
+    return [(receipt_filename(kind, order), plan.render(order, company_info, logo).getvalue()) for order in orders]
+
+
+def export_receipts_zip(kind: str, orders: list, company_info: dict, progress=None,
+                        path: Optional[Path] = None) -> Path:
+    """
+    Un ZIP cu cate un PDF per comanda, scris pe disc pe masura ce bonurile sunt gata. Bonurile
+    din cache se copiaza direct; restul se randeaza intr-un pool de procese cand sunt destule.
+    """
+    path = path or batch_output_path(kind, ".zip")
+    logo = get_logo_asset()
+    cache = get_receipt_cache()
+    total, done = len(orders), 0
+
+    def report():
+        if progress:
+            progress(done, total)
+
+    pending = []
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for order in orders:
+            data = cache.get(receipt_cache_key(kind, order, company_info, logo))
+            if data is None:
+                pending.append(order)
+                continue
+            zf.writestr(receipt_filename(kind, order), data)
+            done += 1
+        report()
+
+        workers = batch_pool_workers(len(pending), BATCH_RENDER_S["zip"])
+        if workers:
+            chunk = max(1, math.ceil(len(pending) / (workers * 4)))
+            with batch_pool(workers) as pool:
+                futures = [
+                    pool.submit(render_receipt_chunk, kind, pending[i:i + chunk], company_info)
+                    for i in range(0, len(pending), chunk)
+                ]
+                for future in as_completed(futures):
+                    for name, data in future.result():
+                        zf.writestr(name, data)
+                        done += 1
+                    report()
+        else:
+            plan = get_receipt_plan(kind)
+            for order in pending:
+                zf.writestr(receipt_filename(kind, order), plan.render(order, company_info, logo).getvalue())
+                done += 1
+                report()
+    return path
+
+
+def render_receipt_part(kind: str, orders: list, company_info: dict, path: Path, progress=None) -> Path:
+    """Paginile unor comenzi consecutive intr-un PDF (in procesul curent sau ca worker din pool)."""
+    plan, logo = get_receipt_plan(kind), get_logo_asset()
+    c = new_canvas(str(path), plan.pagesize, pageCompression=1)
+    total = len(orders)
+    for done, order in enumerate(orders, start=1):
+        plan.draw_page(c, order, company_info, logo)
+        c.showPage()
+        if progress:
+            progress(done, total)
+    c.save()
+    return path
+
+
+def export_receipts_pdf(kind: str, orders: list, company_info: dict, progress=None,
+                        path: Optional[Path] = None) -> Path:
+    """
+    Un singur PDF cu o pagina per comanda; paginile impart acelasi strat static (un singur form
+    XObject si un singur logo). Pentru loturi mari, procesele din pool randeaza parti consecutive
+    care se lipesc apoi in ordine, pe masura ce sunt gata.
+    """
+    path = path or batch_output_path(kind, ".pdf")
+    total = len(orders)
+    workers = batch_pool_workers(total, BATCH_RENDER_S["pdf"], BATCH_MERGE_S)
+    if not workers:
+        return render_receipt_part(kind, orders, company_info, path, progress)
+
+    from pypdf import PdfWriter
+
+    chunk = max(1, math.ceil(total / (workers * 2)))
+    starts = range(0, total, chunk)
+    parts = [batch_output_path(kind, ".part.pdf") for _ in starts]
+    merged = PdfWriter()
+    try:
+        with batch_pool(workers) as pool:
+            futures = [
+                pool.submit(render_receipt_part, kind, orders[i:i + chunk], company_info, part)
+                for i, part in zip(starts, parts)
+            ]
+            for i, future in zip(starts, futures):
+                merged.append(str(future.result()))
+                if progress:
+                    progress(min(i + chunk, total), total)
+        with open(path, "wb") as f:
+            merged.write(f)
+    finally:
+        for part in parts:
+            part.unlink(missing_ok=True)
+    return path
+
+
+# ============================================================================
+# STORAGE BACKENDS
+# ============================================================================
+ORDER_COLUMNS = [
+    "order_id", "client_name", "client_phone", "client_email",
+    "printer_brand", "printer_model", "printer_serial",
+    "printers_json",
+    "issue_description", "accessories", "notes",
+    "date_received", "date_pickup_scheduled", "date_completed", "date_picked_up",
+    "status", "technician", "repair_details", "parts_used",
+    "labor_cost", "parts_cost", "total_cost",
+    "revision", "updated_at",
+]
+
+NUMERIC_COLUMNS = ("labor_cost", "parts_cost", "total_cost")
+INTEGER_COLUMNS = ("revision",)
+
+
+@st.cache_resource
+def _order_conflict_error() -> type:
+    # clasa e creata o singura data per proces: store-ul din cache (creat la primul rerun) si
+    # `except OrderConflictError` din rerun-urile urmatoare trebuie sa vada aceeasi clasa
+    class OrderConflictError(Exception):
+        """The order changed in storage since the caller read it (revision mismatch)."""
 
-    width = 210 * mm           # A4 width
-    a5_height = 148.5 * mm     # A5 height
-    total_height = 2 * a5_height
+        def __init__(self, order_id: str, current: Optional[dict]):
+            super().__init__(f"Order {order_id} was changed by someone else.")
+            self.order_id = order_id
+            self.current = current
 
-    c = canvas.Canvas(buffer, pagesize=(width, total_height))
-    SHIFT_BOXES = -15 * mm
-    
+    return OrderConflictError
 
-    def draw_half(offset_y: float):
+
+OrderConflictError = _order_conflict_error()
+
+
+def sql_ident(name: str) -> str:
+    """Quote a table/column name for SQLite."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def now_stamp() -> str:
+    """UTC timestamp for updated_at; ISO text so it sorts as a string and Sheets keeps it as text."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def shift_stamp(stamp: str, seconds: float) -> str:
+    """Move an updated_at stamp by `seconds` (stamps that don't parse are returned unchanged)."""
+    try:
+        moved = datetime.strptime(stamp, "%Y-%m-%dT%H:%M:%S.%fZ") + timedelta(seconds=seconds)
+    except ValueError:
+        return stamp
+    return moved.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def to_cell_value(value):
+    """Valoare sigura pentru o celula Sheets / SQLite (fara NaN / tipuri numpy)."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and math.isnan(value):
+        return ""
+    if isinstance(value, (datetime, date)) or value is pd.NaT:
+        return safe_text(value)
+    if hasattr(value, "item"):  # numpy scalar
+        return value.item()
+    return value
+
+
+# ----------------------------------------------------------------------------
+# Order schema (typed, parse-once frame)
+# ----------------------------------------------------------------------------
+DATE_COLUMNS = ("date_received", "date_pickup_scheduled", "date_completed", "date_picked_up")
+CATEGORY_COLUMNS = ("status", "technician", "printer_brand")
+
+
+def _as_text(col: pd.Series) -> pd.Series:
+    """Text column without NaN; whole numbers read from Sheets (e.g. phones) lose the '.0'."""
+    if pd.api.types.is_numeric_dtype(col.dtype):
+        numbers = pd.to_numeric(col, errors="coerce")
+        if ((numbers.dropna() % 1) == 0).all():
+            return numbers.astype("Int64").astype(str).replace("<NA>", "")
+    return col.fillna("").astype(str)
+
+
+def coerce_orders_df(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tipuri o singura data, la incarcare: costuri float, date datetime64, status/tehnician/brand
+    categorical, restul text fara NaN. Functioneaza si pe cadre partiale (doar coloanele prezente).
+    """
+    out = {}
+    for col in df.columns:
+        values = df[col]
+        if col in NUMERIC_COLUMNS:
+            out[col] = pd.to_numeric(values, errors="coerce").fillna(0.0).astype("float64")
+        elif col in INTEGER_COLUMNS:
+            out[col] = pd.to_numeric(values, errors="coerce").fillna(0).astype("int64")
+        elif col in DATE_COLUMNS:
+            text = _as_text(values).str.strip()
+            out[col] = pd.to_datetime(text.where(text != ""), errors="coerce", format="mixed")
+        elif col in CATEGORY_COLUMNS:
+            out[col] = _as_text(values).str.strip().astype("category")
+        else:
+            out[col] = _as_text(values)
+    return pd.DataFrame(out, index=df.index)
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum()) if df is not None else 0
+
+
+def concat_orders(frames: list) -> pd.DataFrame:
+    """pd.concat for typed order frames that keeps categorical columns categorical."""
+    frames = [f for f in frames if f is not None]
+    for col in CATEGORY_COLUMNS:
+        cats = [f[col].cat.categories for f in frames if col in f.columns and isinstance(f[col].dtype, pd.CategoricalDtype)]
+        if len(cats) > 1:
+            union = cats[0].union(pd.Index([c for idx in cats[1:] for c in idx]))
+            frames = [
+                f.assign(**{col: f[col].cat.set_categories(union)}) if col in f.columns else f
+                for f in frames
+            ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def assign_order_values(df: pd.DataFrame, pos: int, values: dict):
+    """Set values on row `pos` of a typed frame in place, coercing them to the column types."""
+    values = {k: v for k, v in values.items() if k in df.columns}
+    if not values:
+        return
+    typed = coerce_orders_df(pd.DataFrame([values]))
+    for col in values:
+        value = typed.at[0, col]
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and value not in df[col].cat.categories:
+            df[col] = df[col].cat.add_categories([value])
+        df.iat[pos, df.columns.get_loc(col)] = value
+
+
+# ----------------------------------------------------------------------------
+# Printers table (one row per printer of an order)
+# ----------------------------------------------------------------------------
+PRINTER_TABLE_COLUMNS = ["order_id", "position", "brand", "model", "serial"]
+PRINTER_FIELDS = ("printers_json", "printer_brand", "printer_model", "printer_serial")
+
+
+def _parse_printers_json(raw: str) -> list:
+    try:
+        printers = json.loads(raw)
+    except Exception:
+        return []
+    return [p for p in printers if isinstance(p, dict)] if isinstance(printers, list) else []
+
+
+def build_printers_table(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tabelul normalizat de imprimante (order_id, position, brand, model, serial), construit
+    dintr-o singura trecere peste comenzi. Randurile fara printers_json folosesc campurile legacy.
+    """
+    if df.empty or "order_id" not in df.columns:
+        return pd.DataFrame({c: pd.Series(dtype="int64" if c == "position" else "str") for c in PRINTER_TABLE_COLUMNS})
+
+    def column(name):
+        return df[name].astype(str).str.strip() if name in df.columns else pd.Series("", index=df.index)
+
+    raw = column("printers_json")
+    parsed = raw[raw != ""].map(_parse_printers_json)
+    parsed = parsed[parsed.map(len) > 0].explode()
+    from_json = pd.DataFrame(parsed.tolist(), index=parsed.index).reindex(columns=["brand", "model", "serial"])
+
+    legacy = pd.DataFrame({
+        "brand": column("printer_brand"),
+        "model": column("printer_model"),
+        "serial": column("printer_serial"),
+    })
+    legacy = legacy[~legacy.index.isin(parsed.index) & (legacy != "").any(axis=1)]
+
+    table = pd.concat([from_json, legacy]).sort_index(kind="stable")
+    table = table.fillna("").astype(str).apply(lambda c: c.str.strip())
+    table.insert(0, "order_id", df["order_id"].astype(str).reindex(table.index))
+    table.insert(1, "position", table.groupby(level=0).cumcount().astype("int64") + 1)
+    return table.reset_index(drop=True)
+
+
+def printer_positions(table: pd.DataFrame) -> dict:
+    """order_id -> row positions in a printers table (one pass; groupby.indices is slow on string ids)."""
+    index = {}
+    for pos, order_id in enumerate(table["order_id"].tolist()):
+        index.setdefault(order_id, []).append(pos)
+    return index
+
+
+def serial_index(table: pd.DataFrame) -> dict:
+    """normalized serial -> order ids (in table order) for a printers table."""
+    if table.empty:
+        return {}
+    keys = table["serial"].map(normalize_serial)
+    keyed = table.assign(key=keys)[keys != ""]
+    return {key: list(dict.fromkeys(ids)) for key, ids in keyed.groupby("key", sort=False)["order_id"]}
+
+
+def legacy_printer_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Comenzile vechi care au doar printer_brand/model/serial, fara printers_json."""
+    if df.empty or "printers_json" not in df.columns:
+        return df.iloc[0:0]
+    no_json = df["printers_json"].astype(str).str.strip().isin(["", "[]"])
+    legacy = pd.Series(False, index=df.index)
+    for col in ("printer_brand", "printer_model", "printer_serial"):
+        if col in df.columns:
+            legacy |= df[col].astype(str).str.strip() != ""
+    return df[no_json & legacy]
+
+
+class OrderBackend:
+    """
+    Interfata de stocare folosita de PrinterServiceCRM.
+    Un rand de comanda este un dict {coloana: valoare} cu cheile din ORDER_COLUMNS.
+    """
+
+    name = "base"
+    label = "Storage"
+
+    def ensure_schema(self) -> Optional[pd.DataFrame]:
+        """Create/upgrade the orders schema and return all orders (None if unreadable)."""
+        raise NotImplementedError
+
+    def read_all(self, ttl: int = 0) -> Optional[pd.DataFrame]:
+        raise NotImplementedError
+
+    def get(self, order_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def has_order(self, order_id: str) -> bool:
+        """Whether order_id is already stored (checked before a new id is handed out)."""
+        return self.get(order_id) is not None
+
+    def insert(self, row: dict) -> bool:
+        raise NotImplementedError
+
+    def patch(self, order_id: str, changes: dict, expected_revision: Optional[int] = None) -> bool:
+        """
+        Write `changes` to one order. With expected_revision set, the write is a
+        compare-and-swap on the revision column and raises OrderConflictError on mismatch.
+        A "revision" in changes is the lowest new revision: the backend writes
+        max(stored + 1, changes["revision"]), so a writer with a stale copy never lowers it,
+        and puts the value it wrote back into `changes`.
+        """
+        raise NotImplementedError
+
+    def query(self, **filters) -> pd.DataFrame:
+        """Orders whose columns equal the given values, e.g. query(status="Received")."""
+        df = self.read_all()
+        if df is None or df.empty:
+            return pd.DataFrame(columns=ORDER_COLUMNS)
+        mask = pd.Series(True, index=df.index)
+        for col, value in filters.items():
+            if col in df.columns:
+                mask &= df[col] == value
+        return df[mask]
+
+    def changed_since(self, watermark: str, known_ids) -> Optional[tuple]:
         """
-        Deseneaza un bon de ridicare A5 complet, pornind de la offset_y.
-        Layout-ul ramane identic cu cel vechi.
+        Incremental sync: (rows with updated_at >= watermark or not in known_ids, all live order ids).
+        None means the caller must do a full reload (schema changed / not supported).
         """
-        top = offset_y + a5_height
+        return None
 
-        header_y_start = top - 10 * mm
-        x_business = 10 * mm
-        y_pos = header_y_start
+    def rewrite(self, df: pd.DataFrame) -> bool:
+        """Replace every stored order with `df` (repair / migration only)."""
+        raise NotImplementedError
 
-        # Company info - left side
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(x_business, y_pos, remove_diacritics(company_info.get('company_name', '')))
-        y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 7)
-        c.drawString(x_business, y_pos, remove_diacritics(company_info.get('company_address', '')))
-        y_pos -= 3 * mm
-        c.drawString(x_business, y_pos, f"CUI: {company_info.get('cui', '')}")
-        y_pos -= 3 * mm
-        c.drawString(x_business, y_pos, f"Reg.Com: {company_info.get('reg_com', '')}")
-        y_pos -= 3 * mm
-        c.drawString(x_business, y_pos, f"Tel: {company_info.get('phone', '')}")
-        y_pos -= 3 * mm
-        c.drawString(x_business, y_pos, f"Email: {company_info.get('email', '')}")
-
-        # Logo middle
-        logo_x = 85 * mm
-        logo_y = header_y_start - 20 * mm
-
-        if logo_image:
+    # ------------------------------------------------------------------
+    # Archive partitions (Completed orders moved out of the hot set)
+    # ------------------------------------------------------------------
+    def archive_partitions(self) -> list:
+        """Names of the yearly archive partitions, oldest first."""
+        return []
+
+    def read_partition(self, name: str) -> Optional[pd.DataFrame]:
+        raise NotImplementedError
+
+    def archived_order_ids(self) -> list:
+        """Every order_id in the archive partitions (keeps the id allocator from reusing them)."""
+        return []
+
+    def archive(self, ids_by_year: dict) -> bool:
+        """Move the given orders from the hot set into their {year: [order_id, ...]} partitions."""
+        notify("error", f"❌ {self.label} does not support archiving.")
+        return False
+
+    def repair(self) -> bool:
+        """Explicit repair: re-read everything and rewrite it with the full column set."""
+        df = self.read_all()
+        if df is None or df.empty or "order_id" not in df.columns:
+            notify("error", f"❌ Cannot repair: no data found in {self.label}.")
+            return False
+        df = df.dropna(how="all")
+        for col in ORDER_COLUMNS:
+            if col not in df.columns:
+                df[col] = ""
+        return self.rewrite(df)
+
+
+class GSheetsBackend(OrderBackend):
+    """Orders worksheet in Google Sheets; writes are row appends and cell patches."""
+
+    name = "gsheets"
+    label = "Google Sheets"
+
+    def __init__(self, conn: "GSheetsConnection", worksheet: str = "Orders"):
+        self.conn = conn
+        self.worksheet = worksheet
+        self._ws = None
+        self._lock = threading.RLock()
+        self._columns = list(ORDER_COLUMNS)
+        self._row_index = {}  # order_id -> numarul randului din sheet (1 = header)
+        self._last_row = 1  # ultimul rand pe care l-am vazut; randurile de dupa el sunt scrise de altii
+
+    def read_all(self, ttl: int = 0) -> Optional[pd.DataFrame]:
+        """Read Google Sheets into DataFrame safely."""
+        try:
+            return self.conn.read(
+                worksheet=self.worksheet,
+                ttl=ttl
+            )
+        except Exception as e:
+            notify("error", f"❌ Error reading Google Sheets: {e}")
+            return None
+
+    def rewrite(self, df: pd.DataFrame, allow_empty: bool = False) -> bool:
+        """Write entire DataFrame to Sheets. Prevents accidental data loss."""
+        try:
+            if df is None:
+                notify("error", "❌ Tried to write None DataFrame to Sheets.")
+                return False
+            if df.empty and not allow_empty:
+                notify("error", "⚠️ Refusing to write empty DataFrame to prevent data loss.")
+                return False
+            with self._lock:
+                self.conn.update(worksheet=self.worksheet, data=df)
+                self._columns = list(df.columns)
+                self._build_row_index()
+            notify("success", "💾 Saved to Google Sheets!")
+            return True
+        except Exception as e:
+            notify("error", f"❌ Error saving to Google Sheets: {e}")
+            return False
+
+    def ensure_schema(self) -> Optional[pd.DataFrame]:
+        df = self.read_all(ttl=0)
+
+        # CASE 1 — Sheet could not be read
+        if df is None:
+            return None
+
+        # CASE 2 — order_id column is missing → write the header, but only on a blank sheet
+        if "order_id" not in df.columns:
+            self.rewrite(pd.DataFrame(columns=ORDER_COLUMNS), allow_empty=df.empty)
+            return None
+
+        # CASE 3 — Ensure newer columns (printers_json, revision, ...) exist
+        missing = [col for col in ORDER_COLUMNS if col not in df.columns]
+        with self._lock:
+            self._columns = list(df.columns)
+            if missing and self._add_columns(missing):
+                for col in missing:
+                    df[col] = ""
+            self._build_row_index()
+        return df
+
+    # ------------------------------------------------------------------
+    # Row-level (delta) access
+    # ------------------------------------------------------------------
+    def _worksheet_handle(self):
+        """gspread Worksheet behind the connection, or None (public sheets are read-only)."""
+        if self._ws is None:
+            select = getattr(getattr(self.conn, "client", None), "_select_worksheet", None)
+            if select is None:
+                return None
             try:
-                logo_image.seek(0)
-                img = Image.open(logo_image)
-
-                target_width_mm = 40
-                aspect_ratio = img.height / img.width
-                target_height_mm = target_width_mm * aspect_ratio
-
-                if target_height_mm > 25:
-                    target_height_mm = 25
-                    target_width_mm = target_height_mm / aspect_ratio
-
-                logo_image.seek(0)
-                c.drawImage(
-                    ImageReader(logo_image),
-                    logo_x,
-                    logo_y,
-                    width=target_width_mm * mm,
-                    height=target_height_mm * mm,
-                    preserveAspectRatio=True,
-                    mask='auto'
-                )
-            except Exception:
-                c.setFillColor(colors.HexColor('#f0f0f0'))
-                c.rect(logo_x, logo_y, 40 * mm, 25 * mm, fill=1, stroke=1)
-                c.setFillColor(colors.black)
-                c.setFont("Helvetica-Bold", 10)
-                c.drawCentredString(logo_x + 20 * mm, logo_y + 12.5 * mm, "[LOGO]")
-        else:
-            c.setFillColor(colors.HexColor('#f0f0f0'))
-            c.rect(logo_x, logo_y, 40 * mm, 25 * mm, fill=1, stroke=1)
-            c.setFillColor(colors.black)
-            c.setFont("Helvetica-Bold", 10)
-            c.drawCentredString(logo_x + 20 * mm, logo_y + 12.5 * mm, "[LOGO]")
-
-        # Client info - right side
-        c.setFillColor(colors.black)
-        x_client = 155 * mm
-        y_pos = header_y_start
-        c.setFont("Helvetica-Bold", 8)
-        c.drawString(x_client, y_pos, "CLIENT")
-        y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 7)
-        c.drawString(x_client, y_pos, f"Nume: {remove_diacritics(safe_text(order.get('client_name', '')))}")
-        y_pos -= 3 * mm
-        c.drawString(x_client, y_pos, f"Tel: {safe_text(order.get('client_phone', ''))}")
-
-        # Title
-        title_y = top - 38 * mm
-        c.setFont("Helvetica-Bold", 12)
-        c.drawCentredString(105 * mm, title_y, "DOVADA RIDICARE ECHIPAMENT DIN SERVICE")
-        c.setFont("Helvetica-Bold", 10)
-        c.setFillColor(colors.HexColor('#00aa00'))
-        c.drawCentredString(105 * mm, title_y - 6 * mm, f"Nr. Comanda: {safe_text(order.get('order_id', ''))}")
-        c.setFillColor(colors.black)
-
-        # Three columns section
-        y_start = top - 50 * mm
-        col_width = 63 * mm
-
-        # LEFT COLUMN - Equipment details (MULTIPLE PRINTERS)
-        x_left = 10 * mm
-        y_pos = y_start
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(x_left, y_pos, "DETALII ECHIPAMENT:")
-        y_pos -= 5 * mm
-        c.setFont("Helvetica", 8)
+                self._ws = select(worksheet=self.worksheet)
+            except Exception as e:
+                notify("error", f"❌ Cannot open worksheet '{self.worksheet}': {e}")
+                return None
+        return self._ws
 
-        printers = load_printers_from_order(order)
-        if printers:
-            for idx, p in enumerate(printers, start=1):
-                brand = remove_diacritics(safe_text(p.get("brand", "")))
-                model = remove_diacritics(safe_text(p.get("model", "")))
-                serial = safe_text(p.get("serial", ""))
+    def _add_columns(self, columns: list) -> bool:
+        """Append new header cells after the last column; existing rows stay untouched."""
+        ws = self._worksheet_handle()
+        if ws is None:
+            return False
+        try:
+            first_col = len(self._columns) + 1
+            needed = len(self._columns) + len(columns) - ws.col_count
+            if needed > 0:
+                ws.add_cols(needed)
+            ws.batch_update(
+                [{"range": rowcol_to_a1(1, first_col), "values": [list(columns)]}],
+                value_input_option="RAW",
+            )
+        except Exception as e:
+            notify("error", f"❌ Error adding columns {columns} to Google Sheets: {e}")
+            return False
+        self._columns.extend(columns)
+        return True
+
+    def _build_row_index(self) -> bool:
+        """Rebuild order_id -> row number from the order_id column only."""
+        ws = self._worksheet_handle()
+        if ws is None or "order_id" not in self._columns:
+            self._row_index = {}
+            return False
+        try:
+            ids = ws.col_values(self._columns.index("order_id") + 1)
+        except Exception as e:
+            notify("error", f"❌ Error indexing Google Sheets rows: {e}")
+            return False
+        # ids[0] este header-ul, deci randul de date i are numarul i + 1
+        self._row_index = {
+            oid: row for row, oid in enumerate(ids, start=1)
+            if row > 1 and isinstance(oid, str) and oid.strip()
+        }
+        self._last_row = max(len(ids), 1)
+        return True
 
-                line = f"{idx}. {brand} {model}"
-                if serial:
-                    line += f" (SN: {serial})"
+    def _locate_row(self, ws, order_id: str):
+        """Return (row_number, current_values) for order_id, re-indexing if the index is stale."""
+        id_pos = self._columns.index("order_id")
+        for attempt in range(2):
+            row_number = self._row_index.get(order_id)
+            if row_number is not None:
+                current = ws.row_values(row_number)
+                if len(current) > id_pos and current[id_pos] == order_id:
+                    return row_number, current
+            if attempt == 0 and not self._build_row_index():
+                break
+        return None, None
 
-                c.drawString(x_left, y_pos, line)
-                y_pos -= 4 * mm
-        else:
-            printer_info = f"{remove_diacritics(safe_text(order.get('printer_brand', '')))} {remove_diacritics(safe_text(order.get('printer_model', '')))}"
-            c.drawString(x_left, y_pos, f"Imprimanta: {printer_info}")
-            y_pos -= 4 * mm
-            serial = safe_text(order.get('printer_serial', ''))
-            if serial:
-                c.drawString(x_left, y_pos, f"Serie: {serial}")
-                y_pos -= 4 * mm
-
-        c.drawString(x_left, y_pos, f"Data predarii: {safe_text(order.get('date_received', ''))}")
-        if order.get('date_picked_up'):
-            y_pos -= 4 * mm
-            c.drawString(x_left, y_pos, f"Ridicare: {safe_text(order.get('date_picked_up', ''))}")
-        accessories = safe_text(order.get('accessories', ''))
-        if accessories and accessories.strip():
-            y_pos -= 4 * mm
-            c.drawString(x_left, y_pos, f"Accesorii: {remove_diacritics(accessories)}")
-
-        # MIDDLE COLUMN - Repairs
-        x_middle = 73 * mm
-        y_pos = y_start
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(x_middle, y_pos, "REPARATII EFECTUATE:")
-        y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 8)
+    def _row_dict(self, values: list) -> dict:
+        values = list(values) + [""] * (len(self._columns) - len(values))
+        return dict(zip(self._columns, values))
 
-        repair_text = remove_diacritics(safe_text(order.get('repair_details', 'N/A')))
-        words = repair_text.split()
-        line = ""
-        line_count = 0
-        max_lines = 5
-        for word in words:
-            test_line = line + word + " "
-            if c.stringWidth(test_line, "Helvetica", 7) < (col_width - 18 * mm):
-                line = test_line
-            else:
-                if line_count < max_lines:
-                    c.drawString(x_middle, y_pos, line.strip())
-                    y_pos -= 2.5 * mm
-                    line_count += 1
-                    line = word + " "
+    def get(self, order_id: str) -> Optional[dict]:
+        ws = self._worksheet_handle()
+        if ws is None:
+            df = self.query(order_id=order_id)
+            return df.iloc[0].to_dict() if not df.empty else None
+        try:
+            with self._lock:
+                row_number, current = self._locate_row(ws, order_id)
+        except Exception as e:
+            notify("error", f"❌ Error reading Google Sheets: {e}")
+            return None
+        return self._row_dict(current) if row_number is not None else None
+
+    def has_order(self, order_id: str) -> bool:
+        # fara re-indexare (ar citi toata coloana order_id la fiecare comanda noua):
+        # un id scris intre timp de altcineva e prins de verificarea de dupa append din insert()
+        return order_id in self._row_index
+
+    def _column_letter(self, name: str) -> str:
+        return rowcol_to_a1(1, self._columns.index(name) + 1)[:-1]
+
+    def _partition_name(self, year: int) -> str:
+        return f"{self.worksheet}_{year}"
+
+    def archive_partitions(self) -> list:
+        ws = self._worksheet_handle()
+        if ws is None:
+            return []
+        try:
+            titles = [w.title for w in ws.spreadsheet.worksheets()]
+        except Exception as e:
+            notify("error", f"❌ Error listing archive worksheets: {e}")
+            return []
+        pattern = re.compile(rf"^{re.escape(self.worksheet)}_\d{{4}}$")
+        return sorted(t for t in titles if pattern.match(t))
+
+    def read_partition(self, name: str) -> Optional[pd.DataFrame]:
+        try:
+            return self.conn.read(worksheet=name, ttl=0)
+        except Exception as e:
+            notify("error", f"❌ Error reading archive '{name}': {e}")
+            return None
+
+    def archived_order_ids(self) -> list:
+        partitions = self.archive_partitions()
+        if not partitions:
+            return []
+        # partitiile sunt create cu acelasi header ca foaia Orders
+        col = self._column_letter("order_id")
+        try:
+            resp = self._worksheet_handle().spreadsheet.values_batch_get(
+                [f"'{name}'!{col}2:{col}" for name in partitions]
+            )
+        except Exception as e:
+            notify("error", f"❌ Error reading archived order ids: {e}")
+            return []
+        return [
+            row[0]
+            for value_range in resp.get("valueRanges", [])
+            for row in value_range.get("values", [])
+            if row
+        ]
+
+    def archive(self, ids_by_year: dict) -> bool:
+        """Append the rows to Orders_<year> worksheets, then delete them from Orders in one request."""
+        ws = self._worksheet_handle()
+        if ws is None:
+            notify("error", "❌ Archiving needs a service-account Google Sheets connection.")
+            return False
+        try:
+            with self._lock:
+                self._build_row_index()
+                existing = set(self.archive_partitions())
+                all_rows = []
+                for year, order_ids in sorted(ids_by_year.items()):
+                    rows = sorted(self._row_index[oid] for oid in order_ids if oid in self._row_index)
+                    if not rows:
+                        continue
+                    values = [v[0] if v else [] for v in ws.batch_get([f"{r}:{r}" for r in rows])]
+                    name = self._partition_name(year)
+                    if name not in existing:
+                        target = ws.spreadsheet.add_worksheet(title=name, rows=len(values) + 1, cols=len(self._columns))
+                        target.append_row(self._columns, value_input_option="RAW", table_range="A1")
+                    else:
+                        target = ws.spreadsheet.worksheet(name)
+                    target.append_rows(values, value_input_option="USER_ENTERED", table_range="A1")
+                    all_rows.extend(rows)
+
+                # stergem de jos in sus, ca numerele randurilor ramase sa nu se mute
+                requests = [
+                    {"deleteDimension": {"range": {
+                        "sheetId": ws.id, "dimension": "ROWS", "startIndex": r - 1, "endIndex": r,
+                    }}}
+                    for r in sorted(all_rows, reverse=True)
+                ]
+                if requests:
+                    ws.spreadsheet.batch_update({"requests": requests})
+                self._build_row_index()
+        except Exception as e:
+            notify("error", f"❌ Error archiving orders in Google Sheets: {e}")
+            return False
+        return True
+
+    MAX_SYNC_ROWS = 200  # peste atat, un read complet e mai ieftin decat rand cu rand
+
+    def changed_since(self, watermark: str, known_ids) -> Optional[tuple]:
+        """Download only the order_id + updated_at columns, then fetch the changed rows."""
+        ws = self._worksheet_handle()
+        if ws is None or "updated_at" not in self._columns:
+            return None
+        try:
+            with self._lock:
+                if ws.row_values(1) != self._columns:
+                    return None  # header schimbat → full reload
+                id_col = self._column_letter("order_id")
+                ts_col = self._column_letter("updated_at")
+                ids, stamps = ws.batch_get([f"{id_col}2:{id_col}", f"{ts_col}2:{ts_col}"])
+                stamps = list(stamps) + [[]] * (len(ids) - len(stamps))
+
+                self._row_index = {}
+                self._last_row = len(ids) + 1
+                changed_rows = []
+                for row_number, (id_cell, ts_cell) in enumerate(zip(ids, stamps), start=2):
+                    oid = id_cell[0] if id_cell else ""
+                    if not oid:
+                        continue
+                    self._row_index[oid] = row_number
+                    ts = ts_cell[0] if ts_cell else ""
+                    if oid not in known_ids or (ts and ts >= watermark):
+                        changed_rows.append(row_number)
+
+                if len(changed_rows) > self.MAX_SYNC_ROWS:
+                    return None
+                values = ws.batch_get([f"{r}:{r}" for r in changed_rows]) if changed_rows else []
+        except Exception as e:
+            notify("error", f"❌ Error syncing from Google Sheets: {e}")
+            return None
+
+        rows = [self._row_dict(v[0] if v else []) for v in values]
+        return pd.DataFrame(rows, columns=self._columns), set(self._row_index)
+
+    def insert(self, row: dict) -> bool:
+        """
+        Append a single order row at the end of the sheet, then read back only the order ids
+        appended since our last known row: if another writer got the same id first, our row is removed.
+        """
+        ws = self._worksheet_handle()
+        if ws is None:
+            notify("error", "❌ Row writes need a service-account Google Sheets connection.")
+            return False
+        order_id = row["order_id"]
+        values = [to_cell_value(row.get(col, "")) for col in self._columns]
+        try:
+            with self._lock:
+                resp = ws.append_row(values, value_input_option="USER_ENTERED", table_range="A1")
+                updated_range = (resp or {}).get("updates", {}).get("updatedRange", "")
+                match = re.search(r"![A-Z]+(\d+)", updated_range)
+                if not match:
+                    self._build_row_index()
                 else:
-                    break
-        if line and line_count < max_lines:
-            c.drawString(x_middle, y_pos, line.strip())
+                    row_number = int(match.group(1))
+                    first = min(self._last_row + 1, row_number)
+                    col = self._column_letter("order_id")
+                    taken = False
+                    for number, cells in enumerate(ws.get(f"{col}{first}:{col}{row_number}"), start=first):
+                        oid = cells[0] if cells else ""
+                        if oid and number < row_number:
+                            taken = taken or oid == order_id
+                            self._row_index[oid] = number
+                    if taken:
+                        ws.delete_rows(row_number)
+                        self._last_row = row_number - 1
+                        notify("warning", f"⚠️ Order id {order_id} was just taken by another session.")
+                        return False
+                    self._row_index[order_id] = row_number
+                    self._last_row = row_number
+        except Exception as e:
+            notify("error", f"❌ Error saving to Google Sheets: {e}")
+            return False
+        notify("success", "💾 Saved to Google Sheets!")
+        return True
 
-        # RIGHT COLUMN - Parts used
-        x_right = 136 * mm
-        y_pos = y_start
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(x_right, y_pos, "PIESE UTILIZATE:")
-        y_pos -= 3.5 * mm
-        c.setFont("Helvetica", 8)
+    def patch(self, order_id: str, changes: dict, expected_revision: Optional[int] = None) -> bool:
+        """Write only the cells of `changes` that differ from the current row."""
+        ws = self._worksheet_handle()
+        if ws is None:
+            notify("error", "❌ Row writes need a service-account Google Sheets connection.")
+            return False
+        try:
+            with self._lock:
+                row_number, current = self._locate_row(ws, order_id)
+                if row_number is None:
+                    notify("error", f"❌ Order {order_id} not found in sheet.")
+                    return False
+                current = self._row_dict(current)
+                if expected_revision is not None and order_revision(current) != expected_revision:
+                    raise OrderConflictError(order_id, current)
+                if "revision" in changes:
+                    changes["revision"] = max(order_revision(current) + 1, int(changes["revision"]))
+
+                data = []
+                for key, value in changes.items():
+                    if key not in self._columns:
+                        continue
+                    value = to_cell_value(value)
+                    if safe_text(current.get(key)) == safe_text(value):
+                        continue
+                    if isinstance(value, (int, float)) and safe_float(current.get(key), None) == value:
+                        continue
+                    col = self._columns.index(key) + 1
+                    data.append({"range": rowcol_to_a1(row_number, col), "values": [[value]]})
+
+                if data:
+                    ws.batch_update(data, value_input_option="USER_ENTERED")
+            notify("success", "💾 Saved to Google Sheets!")
+            return True
+        except OrderConflictError:
+            raise
+        except Exception as e:
+            notify("error", f"❌ Error saving to Google Sheets: {e}")
+            return False
+
+
+class SQLiteBackend(OrderBackend):
+    """Local SQLite file with indexes on the columns the counter filters by."""
+
+    name = "sqlite"
+    label = "SQLite"
+    table = "orders"
+    INDEXED_COLUMNS = ("status", "client_phone", "date_received")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+
+    @staticmethod
+    def _column_type(col: str) -> str:
+        if col in NUMERIC_COLUMNS:
+            return "REAL DEFAULT 0"
+        if col in INTEGER_COLUMNS:
+            return "INTEGER DEFAULT 0"
+        return "TEXT DEFAULT ''"
+
+    def _columns(self, table: Optional[str] = None) -> list:
+        # conexiunea e partajata intre fire (check_same_thread=False): orice citire trece prin lock
+        with self._lock:
+            return [r[1] for r in self._db.execute(f"PRAGMA table_info({sql_ident(table or self.table)})")]
+
+    def _ensure_table(self, table: str):
+        col_defs = ", ".join(
+            f'"{c}" TEXT PRIMARY KEY' if c == "order_id" else f'"{c}" {self._column_type(c)}'
+            for c in ORDER_COLUMNS
+        )
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {sql_ident(table)} ({col_defs})")
+        existing = self._columns(table)
+        for col in ORDER_COLUMNS:
+            if col not in existing:
+                self._db.execute(f'ALTER TABLE {sql_ident(table)} ADD COLUMN "{col}" {self._column_type(col)}')
+        # order_id este PRIMARY KEY, deci are deja index unic
+        for col in self.INDEXED_COLUMNS:
+            self._db.execute(
+                f'CREATE INDEX IF NOT EXISTS {sql_ident(f"idx_{table}_{col}")} ON {sql_ident(table)} ("{col}")'
+            )
+
+    def ensure_schema(self) -> Optional[pd.DataFrame]:
+        with self._lock, self._db:
+            for table in [self.table] + self.archive_partitions():
+                self._ensure_table(table)
+        return self.read_all()
+
+    def read_all(self, ttl: int = 0) -> Optional[pd.DataFrame]:
+        try:
+            with self._lock:
+                return pd.read_sql_query(f'SELECT * FROM "{self.table}" ORDER BY rowid', self._db)
+        except Exception as e:
+            notify("error", f"❌ Error reading SQLite database: {e}")
+            return None
 
-        parts_text = remove_diacritics(safe_text(order.get('parts_used', 'N/A')))
-        words = parts_text.split()
-        line = ""
-        line_count = 0
-        max_lines = 5
-        for word in words:
-            test_line = line + word + " "
-            if c.stringWidth(test_line, "Helvetica", 7) < (col_width - 2 * mm):
-                line = test_line
+    def get(self, order_id: str) -> Optional[dict]:
+        df = self.query(order_id=order_id)
+        return df.iloc[0].to_dict() if not df.empty else None
+
+    def query(self, **filters) -> pd.DataFrame:
+        try:
+            with self._lock:
+                columns = self._columns()
+                where = [(col, value) for col, value in filters.items() if col in columns]
+                sql = f'SELECT * FROM "{self.table}"'
+                if where:
+                    sql += " WHERE " + " AND ".join(f'"{col}" = ?' for col, _ in where)
+                sql += " ORDER BY rowid"
+                return pd.read_sql_query(sql, self._db, params=[to_cell_value(v) for _, v in where])
+        except Exception as e:
+            notify("error", f"❌ Error reading SQLite database: {e}")
+            return pd.DataFrame(columns=ORDER_COLUMNS)
+
+    def changed_since(self, watermark: str, known_ids) -> Optional[tuple]:
+        try:
+            with self._lock:
+                live_ids = {r[0] for r in self._db.execute(f'SELECT "order_id" FROM "{self.table}"')}
+                new_ids = list(live_ids - set(known_ids))
+                df = pd.read_sql_query(
+                    f'SELECT * FROM "{self.table}" WHERE "updated_at" >= ? '
+                    f'OR "order_id" IN (SELECT value FROM json_each(?)) ORDER BY rowid',
+                    self._db,
+                    params=[watermark, json.dumps(new_ids)],
+                )
+        except Exception as e:
+            notify("error", f"❌ Error syncing from SQLite database: {e}")
+            return None
+        return df, live_ids
+
+    def insert(self, row: dict) -> bool:
+        try:
+            with self._lock, self._db:
+                cols = [c for c in self._columns() if c in row]
+                sql = (
+                    f'INSERT INTO "{self.table}" ({", ".join(map(sql_ident, cols))}) '
+                    f'VALUES ({", ".join("?" for _ in cols)})'
+                )
+                self._db.execute(sql, [to_cell_value(row[c]) for c in cols])
+            return True
+        except Exception as e:
+            notify("error", f"❌ Error saving to SQLite database: {e}")
+            return False
+
+    def patch(self, order_id: str, changes: dict, expected_revision: Optional[int] = None) -> bool:
+        try:
+            with self._lock, self._db:
+                columns = self._columns()
+                sets = [(col, value) for col, value in changes.items() if col in columns and col != "order_id"]
+                if not sets:
+                    return True
+                # revizia se calculeaza din valoarea stocata, in acelasi UPDATE
+                assignments = [
+                    '"revision" = MAX(COALESCE("revision", 0) + 1, ?)' if c == "revision" else f"{sql_ident(c)} = ?"
+                    for c, _ in sets
+                ]
+                sql = f'UPDATE "{self.table}" SET {", ".join(assignments)} WHERE "order_id" = ?'
+                params = [to_cell_value(v) for _, v in sets] + [order_id]
+                if expected_revision is not None:
+                    sql += ' AND COALESCE("revision", 0) = ?'
+                    params.append(expected_revision)
+                cur = self._db.execute(sql, params)
+                if cur.rowcount and "revision" in changes and "revision" in columns:
+                    changes["revision"] = self._db.execute(
+                        f'SELECT "revision" FROM "{self.table}" WHERE "order_id" = ?', (order_id,)
+                    ).fetchone()[0]
+        except Exception as e:
+            notify("error", f"❌ Error saving to SQLite database: {e}")
+            return False
+        if cur.rowcount == 0:
+            current = self.get(order_id)
+            if current is not None and expected_revision is not None:
+                raise OrderConflictError(order_id, current)
+            notify("error", f"❌ Order {order_id} not found in database.")
+            return False
+        return True
+
+    def archive_partitions(self) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name",
+                (f"{self.table}_[0-9][0-9][0-9][0-9]",),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def read_partition(self, name: str) -> Optional[pd.DataFrame]:
+        try:
+            with self._lock:
+                return pd.read_sql_query(f"SELECT * FROM {sql_ident(name)} ORDER BY rowid", self._db)
+        except Exception as e:
+            notify("error", f"❌ Error reading archive '{name}': {e}")
+            return None
+
+    def archived_order_ids(self) -> list:
+        partitions = self.archive_partitions()
+        if not partitions:
+            return []
+        sql = " UNION ALL ".join(f'SELECT "order_id" FROM {sql_ident(name)}' for name in partitions)
+        with self._lock:
+            return [r[0] for r in self._db.execute(sql)]
+
+    def archive(self, ids_by_year: dict) -> bool:
+        try:
+            with self._lock, self._db:
+                for year, order_ids in ids_by_year.items():
+                    target = f"{self.table}_{year}"
+                    self._ensure_table(target)
+                    cols = ", ".join(map(sql_ident, self._columns()))
+                    params = [json.dumps(list(order_ids))]
+                    self._db.execute(
+                        f'INSERT OR REPLACE INTO {sql_ident(target)} ({cols}) SELECT {cols} FROM "{self.table}" '
+                        f'WHERE "order_id" IN (SELECT value FROM json_each(?))',
+                        params,
+                    )
+                    self._db.execute(
+                        f'DELETE FROM "{self.table}" WHERE "order_id" IN (SELECT value FROM json_each(?))',
+                        params,
+                    )
+        except Exception as e:
+            notify("error", f"❌ Error archiving orders in SQLite database: {e}")
+            return False
+        return True
+
+    def rewrite(self, df: pd.DataFrame) -> bool:
+        if df is None:
+            notify("error", "❌ Tried to write None DataFrame to SQLite.")
+            return False
+        rows = df.astype(object).where(df.notna(), None).to_dict("records")
+        try:
+            with self._lock, self._db:
+                self._db.execute(f'DELETE FROM "{self.table}"')
+                columns = self._columns()
+                for row in rows:
+                    cols = [c for c in columns if c in row]
+                    self._db.execute(
+                        f'INSERT OR REPLACE INTO "{self.table}" ({", ".join(map(sql_ident, cols))}) '
+                        f'VALUES ({", ".join("?" for _ in cols)})',
+                        [to_cell_value(row[c]) for c in cols],
+                    )
+            return True
+        except Exception as e:
+            notify("error", f"❌ Error saving to SQLite database: {e}")
+            return False
+
+
+class MirroredBackend(OrderBackend):
+    """Primary backend for reads and writes, with every write replayed on a mirror."""
+
+    def __init__(self, primary: OrderBackend, mirror: OrderBackend):
+        self.primary = primary
+        self.mirror = mirror
+        self.name = f"{primary.name}+{mirror.name}"
+        self.label = f"{primary.label} (mirror: {mirror.label})"
+
+    def ensure_schema(self) -> Optional[pd.DataFrame]:
+        df = self.primary.ensure_schema()
+        mirror_df = self.mirror.ensure_schema()
+        # Prima pornire: copiem comenzile existente din mirror in baza locala
+        if (df is None or df.empty) and mirror_df is not None and not mirror_df.empty:
+            if self.primary.rewrite(mirror_df.dropna(how="all")):
+                df = self.primary.read_all()
+        return df
+
+    def read_all(self, ttl: int = 0) -> Optional[pd.DataFrame]:
+        return self.primary.read_all(ttl=ttl)
+
+    def get(self, order_id: str) -> Optional[dict]:
+        return self.primary.get(order_id)
+
+    def has_order(self, order_id: str) -> bool:
+        return self.primary.has_order(order_id)
+
+    def query(self, **filters) -> pd.DataFrame:
+        return self.primary.query(**filters)
+
+    def changed_since(self, watermark: str, known_ids) -> Optional[tuple]:
+        return self.primary.changed_since(watermark, known_ids)
+
+    def insert(self, row: dict) -> bool:
+        if not self.primary.insert(row):
+            return False
+        if not self.mirror.insert(row):
+            notify("warning", f"⚠️ Order saved, but {self.mirror.label} mirror is behind.")
+        return True
+
+    def patch(self, order_id: str, changes: dict, expected_revision: Optional[int] = None) -> bool:
+        if not self.primary.patch(order_id, changes, expected_revision=expected_revision):
+            return False
+        # mirror-ul primeste revizia scrisa in primary; o copie, ca sa nu o modifice pentru store
+        if not self.mirror.patch(order_id, dict(changes)):
+            notify("warning", f"⚠️ Order saved, but {self.mirror.label} mirror is behind.")
+        return True
+
+    def rewrite(self, df: pd.DataFrame) -> bool:
+        return self.primary.rewrite(df) and self.mirror.rewrite(df)
+
+    def archive_partitions(self) -> list:
+        return self.primary.archive_partitions()
+
+    def read_partition(self, name: str) -> Optional[pd.DataFrame]:
+        return self.primary.read_partition(name)
+
+    def archived_order_ids(self) -> list:
+        return self.primary.archived_order_ids()
+
+    def archive(self, ids_by_year: dict) -> bool:
+        if not self.primary.archive(ids_by_year):
+            return False
+        if not self.mirror.archive(ids_by_year):
+            notify("warning", f"⚠️ Orders archived, but {self.mirror.label} mirror is behind.")
+        return True
+
+    def push_to_mirror(self) -> bool:
+        """Rewrite the mirror's orders from the primary (catches up after a 'mirror is behind' warning)."""
+        df = self.primary.read_all()
+        if df is None:
+            return False
+        return self.mirror.rewrite(df.dropna(how="all"))
+
+    def pull_from_mirror(self) -> bool:
+        """Rebuild the primary's orders from the mirror (e.g. a fresh local SQLite copy of the sheet)."""
+        df = self.mirror.read_all(ttl=0)
+        if df is None or "order_id" not in df.columns:
+            notify("error", f"❌ Cannot read orders from {self.mirror.label}.")
+            return False
+        return self.primary.rewrite(df.dropna(how="all"))
+
+
+def storage_config() -> dict:
+    """
+    [storage] section from secrets:
+    backend = "gsheets" | "sqlite", sqlite_path, mirror = "gsheets",
+    id_policy = "next" | "fill_gaps", sync_interval = seconds between incremental syncs (0 = off),
+    archive_after_days = age after which Completed orders move to Orders_<year>,
+    receipt_cache_mb / receipt_cache_entries = limits of the rendered receipt cache,
+    warm_up = false to skip the background receipt warm-up after login.
+    """
+    try:
+        return dict(st.secrets.get("storage", {}))
+    except Exception:
+        return {}
+
+
+@st.cache_resource
+def get_storage_backend() -> Optional[OrderBackend]:
+    """Build the configured storage backend once per process."""
+    config = storage_config()
+    kind = config.get("backend", "gsheets")
+
+    if kind == "sqlite":
+        backend = SQLiteBackend(config.get("sqlite_path", "crm_orders.db"))
+        if config.get("mirror") == "gsheets":
+            conn = get_sheets_connection()
+            if conn:
+                backend = MirroredBackend(backend, GSheetsBackend(conn))
+        return backend
+
+    conn = get_sheets_connection()
+    return GSheetsBackend(conn) if conn else None
+
+
+# ============================================================================
+# CLIENT DIRECTORY
+# ============================================================================
+class PrefixIndex:
+    """Sorted (key, ref) pairs: prefix lookups by bisect, add/remove without a rebuild."""
+
+    def __init__(self, pairs=()):
+        self._items = sorted(set(pairs))
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, key: str, ref):
+        item = (key, ref)
+        i = bisect.bisect_left(self._items, item)
+        if i == len(self._items) or self._items[i] != item:
+            self._items.insert(i, item)
+
+    def remove(self, key: str, ref):
+        item = (key, ref)
+        i = bisect.bisect_left(self._items, item)
+        if i < len(self._items) and self._items[i] == item:
+            del self._items[i]
+
+    def count(self, prefix: str) -> int:
+        """How many (key, ref) pairs have a key starting with prefix (two bisects, no scan)."""
+        if not prefix:
+            return 0
+        return (bisect.bisect_left(self._items, (prefix + "\uffff",))
+                - bisect.bisect_left(self._items, (prefix,)))
+
+    def search(self, prefix: str) -> list:
+        """Refs whose key starts with prefix, in key order (no duplicates)."""
+        if not prefix:
+            return []
+        i = bisect.bisect_left(self._items, (prefix,))
+        refs = {}
+        while i < len(self._items) and self._items[i][0].startswith(prefix):
+            refs.setdefault(self._items[i][1], None)
+            i += 1
+        return list(refs)
+
+
+def client_key(name, phone) -> str:
+    """Cheia unui client: telefonul normalizat; fara telefon, numele normalizat."""
+    phone_key = normalize_phone(phone)
+    if phone_key:
+        return phone_key
+    name_key = fold_text(name)
+    return f"name:{name_key}" if name_key else ""
+
+
+def client_keys(df: pd.DataFrame) -> pd.Series:
+    """client_key for every order row; each distinct phone / name is normalized only once."""
+    if df.empty:
+        return pd.Series(dtype="str")
+    phones = df["client_phone"].astype(str)
+    keys = phones.map({p: normalize_phone(p) for p in phones.unique()})
+    no_phone = keys == ""
+    if no_phone.any():
+        names = df.loc[no_phone, "client_name"].astype(str)
+        keys[no_phone] = names.map({n: client_key(n, "") for n in names.unique()})
+    return keys
+
+
+def _name_terms(name: str) -> set:
+    folded = fold_text(name)
+    return set(folded.split()) | ({folded} if folded else set())
+
+
+class ClientDirectory:
+    """
+    Clientii derivati din comenzi (un client = un telefon normalizat), cu index de prefix
+    pe telefon si pe numele fara diacritice. Se actualizeaza pe loc, doar pentru comenzile
+    modificate, sub un lock scurt pe care il ia si cautarea, deci nu vede stari partiale.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clients = {}  # key -> {"client_name", "client_phone", "client_email", "orders", "last_received", "order_ids"}
+        self._order_client = {}  # order_id -> key
+        self._phones = PrefixIndex()
+        self._names = PrefixIndex()
+
+    def __len__(self):
+        return len(self.clients)
+
+    @staticmethod
+    def _latest(rows: pd.DataFrame) -> pd.Series:
+        return rows.sort_values(["date_received", "order_id"], na_position="first").iloc[-1]
+
+    def _entry(self, key: str, rows: pd.DataFrame) -> dict:
+        latest = self._latest(rows)
+        return {
+            "client_name": safe_text(latest["client_name"]).strip(),
+            "client_phone": safe_text(latest["client_phone"]).strip(),
+            "client_email": safe_text(latest.get("client_email")).strip(),
+            "orders": len(rows),
+            "last_received": safe_text(latest["date_received"]),
+            "order_ids": list(rows["order_id"]),
+        }
+
+    def rebuild(self, df: pd.DataFrame):
+        if df.empty:
+            with self._lock:
+                self.clients, self._order_client = {}, {}
+                self._phones, self._names = PrefixIndex(), PrefixIndex()
+            return
+        keys = client_keys(df)
+        keyed = df.assign(_client=keys)[keys != ""]
+        keyed = keyed.sort_values(["date_received", "order_id"], na_position="first", kind="stable")
+        order_ids = {}
+        for oid, key in zip(keyed["order_id"], keyed["_client"]):
+            order_ids.setdefault(key, []).append(oid)
+        clients = {
+            key: {
+                "client_name": safe_text(name).strip(),
+                "client_phone": safe_text(phone).strip(),
+                "client_email": safe_text(email).strip(),
+                "orders": len(order_ids[key]),
+                "last_received": safe_text(received),
+                "order_ids": order_ids[key],
+            }
+            for key, name, phone, email, received in keyed[
+                ["_client", "client_name", "client_phone", "client_email", "date_received"]
+            ].drop_duplicates("_client", keep="last").itertuples(index=False)
+        }
+        order_client = dict(zip(keyed["order_id"], keyed["_client"]))
+        phones = PrefixIndex((key, key) for key in clients if not key.startswith("name:"))
+        names = PrefixIndex((term, key) for key, c in clients.items() for term in _name_terms(c["client_name"]))
+        with self._lock:
+            self._order_client, self._phones, self._names, self.clients = order_client, phones, names, clients
+
+    def refresh(self, df: pd.DataFrame, positions: dict, order_ids):
+        """Recompute only the clients of these orders (before and after the change)."""
+        name_col, phone_col = df.columns.get_loc("client_name"), df.columns.get_loc("client_phone")
+        new_keys = {}
+        for oid in order_ids:
+            pos = positions.get(oid)
+            if pos is not None:
+                new_keys[oid] = client_key(df.iat[pos, name_col], df.iat[pos, phone_col])
+        with self._lock:
+            order_client, clients = self._order_client, self.clients
+            affected = set()
+            for oid in order_ids:
+                old = order_client.pop(oid, None)
+                if old:
+                    affected.add(old)
+                key = new_keys.get(oid)
+                if key:
+                    order_client[oid] = key
+                    affected.add(key)
+
+            members = {key: [] for key in affected}
+            for key in affected:
+                for oid in clients.get(key, {}).get("order_ids", []):
+                    if order_client.get(oid) == key:
+                        members[key].append(oid)
+            for oid in order_ids:
+                key = order_client.get(oid)
+                if key in members and oid not in members[key]:
+                    members[key].append(oid)
+
+            for key in affected:
+                old = clients.pop(key, None)
+                if old:
+                    self._phones.remove(key, key)
+                    for term in _name_terms(old["client_name"]):
+                        self._names.remove(term, key)
+                ids = [oid for oid in members[key] if oid in positions]
+                if not ids:
+                    continue
+                entry = clients[key] = self._entry(key, df.iloc[[positions[oid] for oid in ids]])
+                if not key.startswith("name:"):
+                    self._phones.add(key, key)
+                for term in _name_terms(entry["client_name"]):
+                    self._names.add(term, key)
+
+    def search(self, text: str, limit: int = 8) -> list:
+        """Autocomplete: phone prefix if the text looks like a phone, else name-word prefixes (all must match)."""
+        text = safe_text(text).strip()
+        if not text:
+            return []
+        with self._lock:
+            if re.fullmatch(r"[\d\s+\-().]+", text):
+                keys = self._phones.search(normalize_phone(text))
             else:
-                if line_count < max_lines:
-                    c.drawString(x_right, y_pos, line.strip())
-                    y_pos -= 2.5 * mm
-                    line_count += 1
-                    line = word + " "
-                else:
+                terms = fold_text(text).split()
+                keys = None
+                for term in terms:
+                    found = self._names.search(term)
+                    if keys is None:
+                        keys = found
+                    else:
+                        found = set(found)
+                        keys = [k for k in keys if k in found]
+                keys = keys or []
+            clients = self.clients
+            matches = [clients[k] for k in keys if k in clients]
+        return heapq.nsmallest(limit, matches, key=lambda c: (-c["orders"], c["client_name"]))
+
+
+# ============================================================================
+# ORDER SEARCH
+# ============================================================================
+SEARCH_FIELDS = {  # coloana -> pondere in scor
+    "client_name": 3.0,
+    "client_phone": 3.0,
+    "issue_description": 1.0,
+    "repair_details": 1.0,
+    "parts_used": 1.0,
+    "accessories": 0.5,
+    "notes": 0.5,
+}
+PRINTER_SEARCH_WEIGHT = {"brand": 2.0, "model": 2.0, "serial": 3.0}
+
+
+def search_terms(text) -> list:
+    """Termenii de cautare ai unui text: fold_text, apoi secvente de litere / cifre."""
+    return re.findall(r"[a-z0-9]+", fold_text(text))
+
+
+def phone_terms(phone) -> list:
+    """Un telefon se poate cauta ca +40..., 40..., 07... sau 7..., cu sau fara separatori."""
+    key = normalize_phone(phone).lstrip("+")
+    terms = search_terms(phone)
+    if key:
+        terms.append(key)
+        if key.startswith("40"):
+            terms += ["0" + key[2:], key[2:]]
+    return list(dict.fromkeys(terms))
+
+
+class OrderSearchIndex:
+    """
+    Index inversat termen -> {doc: scor} peste campurile text ale comenzilor active
+    (plus imprimantele lor). Se construieste la prima cautare, apoi se actualizeaza doar
+    pentru comenzile scrise; orice termen din cerere se potriveste si ca prefix.
+    Listele de postari sunt convertite la array-uri numpy la prima folosire, astfel incat
+    scorarea si intersectia termenilor frecventi nu itereaza in Python.
+
+    Prefixele scurte ("07", "po") se extind la zeci de mii de termeni: acestea se rezolva
+    dintr-o copie compacta a tuturor postarilor (termeni sortati + array-uri plate), unde
+    un prefix e o singura felie; termenii scrisi dupa compactare se citesc din dictionare.
+    Termenii cererii se rezolva de la cel mai selectiv, iar urmatorii se scoreaza doar pe
+    comenzile ramase candidate.
+    """
+
+    MIN_PREFIX = 2  # termenii de o litera se cauta doar exact
+    WIDE_PREFIX_TERMS = 64  # peste atatea expansiuni, prefixul se citeste din copia compacta
+    COMPACT_DIRTY_MIN = 2000  # recompactare cand s-au schimbat atatia termeni (sau 5% din total)
+
+    def __init__(self):
+        self._reset()
+        self._lock = threading.Lock()
+        self.built = False
+
+    def _reset(self):
+        self._postings = {}  # term -> {doc: weight}
+        self._arrays = {}  # term -> (docs, weights) ca numpy, reconstruite cand termenul se schimba
+        self._doc_ids = {}  # order_id -> doc (intreg stabil)
+        self._order_ids = []  # doc -> order_id
+        self._numbers = []  # doc -> numarul comenzii (departajare: cele noi primele)
+        self._numbers_array = None
+        self._doc_terms = {}  # doc -> termenii indexati (pentru stergere)
+        self._terms = PrefixIndex()
+        self._compact = None  # (termeni sortati, starts, docs, weights) la ultima compactare
+        self._dirty = set()  # termeni schimbati dupa compactare (felia lor din _compact e veche)
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    @staticmethod
+    def _document(row: dict, printers, terms_of=None) -> dict:
+        """term -> weight for one order; terms_of(field, value) lets build() reuse tokenized values."""
+        if terms_of is None:
+            terms_of = lambda field, value: phone_terms(value) if field == "client_phone" else search_terms(value)
+        weights = {}
+        for field, weight in SEARCH_FIELDS.items():
+            for term in terms_of(field, row.get(field)):
+                weights[term] = weights.get(term, 0.0) + weight
+        for p in printers:
+            for field, weight in PRINTER_SEARCH_WEIGHT.items():
+                for term in terms_of(field, p.get(field)):
+                    weights[term] = weights.get(term, 0.0) + weight
+        number = parse_order_number(row.get("order_id"))
+        if number is not None:
+            # "SRV-00012" se gaseste cu 00012 sau 12 (prefixul SRV e comun tuturor, nu se indexeaza)
+            for term in {f"{number:05d}", str(number)}:
+                weights[term] = weights.get(term, 0.0) + 3.0
+        return weights
+
+    def _doc(self, order_id: str) -> int:
+        doc = self._doc_ids.get(order_id)
+        if doc is None:
+            doc = self._doc_ids[order_id] = len(self._order_ids)
+            self._order_ids.append(order_id)
+            self._numbers.append(parse_order_number(order_id) or 0)
+            self._numbers_array = None
+        return doc
+
+    def _add(self, order_id: str, weights: dict, new_terms: list):
+        doc = self._doc(order_id)
+        for term, weight in weights.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = {}
+                new_terms.append(term)
+            posting[doc] = weight
+            self._arrays.pop(term, None)
+            self._dirty.add(term)
+        self._doc_terms[doc] = tuple(weights)
+
+    def _drop(self, order_id: str):
+        doc = self._doc_ids.get(order_id)
+        for term in self._doc_terms.pop(doc, ()):
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(doc, None)
+                self._arrays.pop(term, None)
+                self._dirty.add(term)
+                if not posting:
+                    del self._postings[term]
+                    self._terms.remove(term, term)
+
+    def build(self, df: pd.DataFrame, printers: pd.DataFrame):
+        """Index every order of the frame; `printers` is the store's normalized printers table."""
+        by_order = {}
+        for order_id, brand, model, serial in zip(printers["order_id"], printers["brand"],
+                                                  printers["model"], printers["serial"]):
+            by_order.setdefault(order_id, []).append({"brand": brand, "model": model, "serial": serial})
+        with self._lock:
+            self._reset()
+            new_terms = []
+            columns = ["order_id"] + [c for c in SEARCH_FIELDS if c in df.columns]
+            cache = {}  # (field, value) -> termeni; valorile se repeta mult (nume, defecte, branduri)
+
+            def terms_of(field, value):
+                key = (field == "client_phone", value)
+                terms = cache.get(key)
+                if terms is None:
+                    terms = cache[key] = phone_terms(value) if key[0] else search_terms(value)
+                return terms
+
+            for values in zip(*(df[c].tolist() for c in columns)):
+                row = dict(zip(columns, values))
+                order_id = safe_text(row["order_id"])
+                self._add(order_id, self._document(row, by_order.get(order_id, ()), terms_of), new_terms)
+            self._terms = PrefixIndex((term, term) for term in new_terms)
+            self._compact_postings()
+            self.built = True
+
+    def invalidate(self):
+        """Full reload: rebuild lazily on the next search."""
+        with self._lock:
+            self.built = False
+            self._reset()
+
+    def refresh(self, df: pd.DataFrame, positions: dict, order_ids, printers_for):
+        if not self.built:
+            return
+        with self._lock:
+            new_terms = []
+            for order_id in order_ids:
+                self._drop(order_id)
+                pos = positions.get(order_id)
+                if pos is not None:
+                    row = df.iloc[pos].to_dict()
+                    self._add(order_id, self._document(row, printers_for(order_id)), new_terms)
+            for term in new_terms:
+                self._terms.add(term, term)
+
+    def _posting_arrays(self, term: str):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self._postings[term]
+            arrays = self._arrays[term] = (
+                np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                np.fromiter(posting.values(), dtype=np.float64, count=len(posting)),
+            )
+        return arrays
+
+    def _compact_postings(self):
+        """Flatten every posting list into one CSR block (terms sorted, so a prefix is one slice)."""
+        terms = sorted(self._postings)
+        postings = [self._postings[term] for term in terms]
+        starts = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, postings), dtype=np.int64, count=len(terms)), out=starts[1:])
+        size = int(starts[-1])
+        docs = np.fromiter((doc for posting in postings for doc in posting), dtype=np.int64, count=size)
+        weights = np.fromiter((w for posting in postings for w in posting.values()), dtype=np.float64, count=size)
+        self._compact = (terms, starts, docs, weights)
+        self._dirty = set()
+
+    def _wide_span(self, term: str) -> tuple:
+        """(lo, hi) term range of a prefix in the compact block, recompacting first if it is too stale."""
+        if self._compact is None or len(self._dirty) > max(self.COMPACT_DIRTY_MIN, len(self._postings) // 20):
+            self._compact_postings()
+        terms = self._compact[0]
+        return bisect.bisect_left(terms, term), bisect.bisect_left(terms, term + "\uffff")
+
+    def _estimate(self, term: str) -> int:
+        """Roughly how many postings a query term touches (cheap: no prefix expansion)."""
+        if len(term) < self.MIN_PREFIX:
+            return len(self._postings.get(term, ()))
+        if self._terms.count(term) <= self.WIDE_PREFIX_TERMS:
+            return sum(len(self._postings[t]) for t in self._terms.search(term))
+        lo, hi = self._wide_span(term)
+        starts = self._compact[1]
+        return int(starts[hi] - starts[lo])
+
+    def _wide_matches(self, term: str, total: int, candidates=None):
+        """(docs, scores) entries of a wide prefix: one slice of the compact block plus the dirty terms."""
+        terms, starts, flat_docs, flat_weights = self._compact
+        lo, hi = self._wide_span(term)
+        a, b = starts[lo], starts[hi]
+        lengths = np.diff(starts[lo:hi + 1])
+        boost = np.log(1 + total / np.maximum(lengths, 1))
+        if lo < hi and terms[lo] == term:
+            boost[0] *= 2.0
+        docs, scores = flat_docs[a:b], flat_weights[a:b] * np.repeat(boost, lengths)
+        keep = np.ones(len(docs), dtype=bool)
+        extra_docs, extra_scores = [], []
+        for indexed in (t for t in self._dirty if t.startswith(term)):
+            i = bisect.bisect_left(terms, indexed, lo, hi)
+            if i < hi and terms[i] == indexed:
+                keep[starts[i] - a:starts[i + 1] - a] = False  # felie veche
+            posting = self._postings.get(indexed)
+            if posting:
+                weight = (2.0 if indexed == term else 1.0) * math.log(1 + total / len(posting))
+                extra_docs.extend(posting.keys())
+                extra_scores.extend(w * weight for w in posting.values())
+        docs = np.concatenate([docs[keep], np.asarray(extra_docs, dtype=np.int64)])
+        scores = np.concatenate([scores[keep], np.asarray(extra_scores, dtype=np.float64)])
+        if candidates is not None:
+            inside = np.isin(docs, candidates)
+            docs, scores = docs[inside], scores[inside]
+        return docs, scores
+
+    def _matches(self, term: str, total: int, candidates=None):
+        """
+        (docs, scores) for one query term, docs sorted; exact matches count double, rarer terms
+        weigh more. With candidates (sorted docs) only those docs are scored.
+        """
+        if len(term) >= self.MIN_PREFIX and self._terms.count(term) > self.WIDE_PREFIX_TERMS:
+            docs, scores = self._wide_matches(term, total, candidates)
+            order = np.lexsort((-scores, docs))
+            docs, scores = docs[order], scores[order]
+            first = np.ones(len(docs), dtype=bool)
+            first[1:] = docs[1:] != docs[:-1]
+            return docs[first], scores[first]
+        expansions = [term] if len(term) < self.MIN_PREFIX else self._terms.search(term)
+        docs, scores = [], []
+        small_docs, small_scores = [], []  # termeni rari (ex. telefoane, seriale): fara array per termen
+        for indexed in expansions:
+            posting = self._postings.get(indexed)
+            if not posting:
+                continue
+            boost = (2.0 if indexed == term else 1.0) * math.log(1 + total / len(posting))
+            if len(posting) <= 16:
+                small_docs.extend(posting.keys())
+                small_scores.extend(weight * boost for weight in posting.values())
+                continue
+            d, w = self._posting_arrays(indexed)
+            docs.append(d)
+            scores.append(w * boost)
+        if small_docs:
+            docs.append(np.asarray(small_docs, dtype=np.int64))
+            scores.append(np.asarray(small_scores, dtype=np.float64))
+        if not docs:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        docs, scores = np.concatenate(docs), np.concatenate(scores)
+        order = np.lexsort((-scores, docs))  # pe doc, apoi cel mai bun scor primul
+        docs, scores = docs[order], scores[order]
+        if len(expansions) > 1:
+            first = np.ones(len(docs), dtype=bool)
+            first[1:] = docs[1:] != docs[:-1]
+            docs, scores = docs[first], scores[first]
+        return docs, scores
+
+    def search(self, text: str, limit: int = 50) -> list:
+        """Order ids matching ALL query terms (each as a prefix), best score first."""
+        prefix = fold_text(ORDER_ID_PREFIX).strip("-")
+        terms = [t for t in dict.fromkeys(search_terms(text)) if t != prefix]
+        if not terms:
+            return []
+        with self._lock:
+            total = max(len(self._doc_terms), 1)
+            # cel mai selectiv termen primul; ceilalti se scoreaza doar pe candidatii ramasi
+            terms.sort(key=self._estimate)
+            docs, scores = self._matches(terms[0], total)
+            for term in terms[1:]:
+                if not len(docs):
                     break
-        if line and line_count < max_lines:
-            c.drawString(x_right, y_pos, line.strip())
+                other_docs, other_scores = self._matches(term, total, candidates=docs)
+                docs, mine, theirs = np.intersect1d(docs, other_docs, assume_unique=True, return_indices=True)
+                scores = scores[mine] + other_scores[theirs]
+            if not len(docs):
+                return []
+            if self._numbers_array is None:
+                self._numbers_array = np.asarray(self._numbers, dtype=np.int64)
+            # la scor egal, comenzile mai noi primele
+            top = np.lexsort((self._numbers_array[docs], scores))[::-1][:limit]
+            order_ids = self._order_ids
+            return [order_ids[doc] for doc in docs[top]]
+
+
+# ============================================================================
+# ORDER QUERY INDEXES
+# ============================================================================
+ORDER_STATUSES = ["Received", "In Progress", "Ready for Pickup", "Completed"]
+OPEN_STATUSES = ("Received", "In Progress", "Ready for Pickup")
+
+
+def _as_set(value) -> set:
+    if value is None:
+        return set()
+    if isinstance(value, str):
+        return {value}
+    return set(value)
+
+
+class OrderIndexes:
+    """
+    Indexuri intretinute pentru filtrele uzuale: status -> comenzi, tehnician -> comenzi,
+    brand -> comenzi (orice imprimanta din comanda) si lista sortata (data primirii, comanda).
+    Se actualizeaza pe loc, doar pentru comenzile scrise, sub un lock scurt pe care il iau si
+    cititorii, deci o scriere nu copiaza bucket-uri si cititorii nu vad o stare partiala.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = {}  # status -> set(order_id)
+        self.technician = {}  # tehnician (fold_text) -> set(order_id)
+        self.brand = {}  # brand (fold_text) -> set(order_id)
+        self._received = []  # [(YYYY-MM-DD, order_id)] sortat
+        self._keys = {}  # order_id -> (status, tehnician, branduri, data) indexate
+
+    @staticmethod
+    def _order_keys(status, technician, brands, received, fold=fold_text) -> tuple:
+        return (
+            safe_text(status).strip(),
+            fold(technician),
+            tuple(sorted({fold(b) for b in brands} - {""})),
+            safe_text(received)[:10],
+        )
+
+    def counts(self, bucket: str = "status") -> dict:
+        with self._lock:
+            return {key: len(ids) for key, ids in getattr(self, bucket).items() if ids}
+
+    def rebuild(self, df: pd.DataFrame, printers: pd.DataFrame):
+        brands = {}
+        for order_id, brand in zip(printers["order_id"], printers["brand"]):
+            brands.setdefault(order_id, []).append(brand)
+        keys, folded = {}, {}
+
+        def fold(value):  # tehnicienii / brandurile se repeta: fold_text o data per valoare
+            key = folded.get(value)
+            if key is None:
+                key = folded[value] = fold_text(value)
+            return key
+
+        if not df.empty:
+            received_text = df["date_received"].dt.strftime("%Y-%m-%d").fillna("")
+            for order_id, status, technician, received in zip(
+                df["order_id"], df["status"].astype(str), df["technician"].astype(str), received_text
+            ):
+                keys[order_id] = self._order_keys(status, technician, brands.get(order_id, ()), received, fold)
+        status, technician, brand = {}, {}, {}
+        for order_id, (s, t, bs, _) in keys.items():
+            status.setdefault(s, set()).add(order_id)
+            if t:
+                technician.setdefault(t, set()).add(order_id)
+            for b in bs:
+                brand.setdefault(b, set()).add(order_id)
+        received = sorted((d, oid) for oid, (_, _, _, d) in keys.items() if d)
+        with self._lock:
+            self.status, self.technician, self.brand, self._keys, self._received = status, technician, brand, keys, received
+
+    def refresh(self, df: pd.DataFrame, positions: dict, order_ids, printers_for):
+        fresh = {}
+        for order_id in order_ids:
+            pos = positions.get(order_id)
+            if pos is not None:
+                row = df.iloc[pos]
+                brands = [p["brand"] for p in printers_for(order_id)]
+                fresh[order_id] = self._order_keys(row["status"], row["technician"], brands, row["date_received"])
+        with self._lock:
+            keys, received = self._keys, self._received
+            for order_id in order_ids:
+                old = keys.pop(order_id, None)
+                if old:
+                    s, t, bs, d = old
+                    self._discard(self.status, s, order_id)
+                    if t:
+                        self._discard(self.technician, t, order_id)
+                    for b in bs:
+                        self._discard(self.brand, b, order_id)
+                    if d:
+                        i = bisect.bisect_left(received, (d, order_id))
+                        if i < len(received) and received[i] == (d, order_id):
+                            del received[i]
+                new = fresh.get(order_id)
+                if new is None:
+                    continue
+                keys[order_id] = new
+                s, t, bs, d = new
+                self.status.setdefault(s, set()).add(order_id)
+                if t:
+                    self.technician.setdefault(t, set()).add(order_id)
+                for b in bs:
+                    self.brand.setdefault(b, set()).add(order_id)
+                if d:
+                    bisect.insort(received, (d, order_id))
+
+    @staticmethod
+    def _discard(buckets: dict, key: str, order_id: str):
+        ids = buckets.get(key)
+        if ids is not None:
+            ids.discard(order_id)
+            if not ids:
+                del buckets[key]
+
+    def select(self, status=None, received_between=None, technician=None, brand=None) -> Optional[set]:
+        """
+        Order ids matching every given filter (None = no filter). Only the most selective filter
+        is read from its index; the others are checked per candidate against the indexed keys,
+        so the cost follows the smallest candidate set, not the number of orders.
+        """
+        with self._lock:
+            return self._select(status, received_between, technician, brand)
+
+    def _select(self, status, received_between, technician, brand) -> Optional[set]:
+        filters = []  # (marime estimata, candidati(), verificare(keys))
+        if status is not None:
+            wanted_status = _as_set(status)
+            buckets = [self.status.get(s, ()) for s in wanted_status]
+            filters.append((sum(map(len, buckets)), lambda b=buckets: set().union(*b),
+                            lambda k: k[0] in wanted_status))
+        if technician is not None:
+            wanted_tech = {fold_text(t) for t in _as_set(technician)}
+            buckets = [self.technician.get(t, ()) for t in wanted_tech]
+            filters.append((sum(map(len, buckets)), lambda b=buckets: set().union(*b),
+                            lambda k: k[1] in wanted_tech))
+        if brand is not None:
+            wanted_brand = {fold_text(b) for b in _as_set(brand)}
+            buckets = [self.brand.get(b, ()) for b in wanted_brand]
+            filters.append((sum(map(len, buckets)), lambda b=buckets: set().union(*b),
+                            lambda k: not wanted_brand.isdisjoint(k[2])))
+        if received_between is not None:
+            start, end = received_between
+            start, end = safe_text(start)[:10], safe_text(end)[:10]
+            received = self._received
+            lo = bisect.bisect_left(received, (start,)) if start else 0
+            hi = bisect.bisect_left(received, (end + "\uffff",)) if end else len(received)
+            filters.append((max(hi - lo, 0), lambda: {oid for _, oid in received[lo:hi]},
+                            lambda k: bool(k[3]) and (not start or k[3] >= start) and (not end or k[3] <= end)))
+        if not filters:
+            return None
+        filters.sort(key=lambda f: f[0])
+        candidates = filters[0][1]()
+        checks = [f[2] for f in filters[1:]]
+        if not checks:
+            return candidates
+        keys = self._keys
+        return {oid for oid in candidates if (k := keys.get(oid)) is not None and all(check(k) for check in checks)}
+
+
+def filter_orders_frame(df: pd.DataFrame, status=None, received_between=None, technician=None, brand=None) -> np.ndarray:
+    """Same filters as OrderIndexes.select, as a boolean mask over a frame (used for the archive)."""
+    mask = np.ones(len(df), dtype=bool)
+    if df.empty:
+        return mask
+    if status is not None:
+        mask &= df["status"].astype(str).str.strip().isin(_as_set(status)).to_numpy()
+    if technician is not None:
+        wanted = {fold_text(t) for t in _as_set(technician)}
+        mask &= df["technician"].astype(str).map(fold_text).isin(wanted).to_numpy()
+    if brand is not None:
+        wanted = {fold_text(b) for b in _as_set(brand)}
+        table = build_printers_table(df)
+        ids = set(table.loc[table["brand"].map(fold_text).isin(wanted), "order_id"])
+        mask &= df["order_id"].isin(ids).to_numpy()
+    if received_between is not None:
+        start, end = received_between
+        received = df["date_received"]
+        if start:
+            mask &= (received >= pd.Timestamp(start)).to_numpy()
+        if end:
+            mask &= (received <= pd.Timestamp(end)).to_numpy()
+    return mask
+
+
+# ============================================================================
+# REPORT ROLLUPS
+# ============================================================================
+ROLLUP_DIMENSIONS = ("day", "month", "technician", "brand", "status", "technician_day")
 
-        # ------------------------------
-        # COST TABLE (shifted down 15mm)
-        # ------------------------------
-        y_cost = top - 78 * mm + SHIFT_BOXES
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(10 * mm, y_cost, "COSTURI:")
-        y_cost -= 4 * mm
 
-        table_x = 10 * mm
-        table_width = 70 * mm
-        row_height = 5 * mm
+class OrderRollups:
+    """
+    Agregate materializate pentru Reports: (comenzi, venit in bani, comenzi cu cost > 0) pe zi, luna,
+    tehnician, brand, status si (tehnician, zi) pentru filtrele combinate. Ziua e data primirii.
+    O comanda cu imprimante de mai multe branduri intra la fiecare brand. Ca la OrderIndexes,
+    la fiecare scriere se scade contributia veche a comenzii si se adauga cea noua; dictionarele
+    atinse sunt inlocuite, nu modificate.
+    """
 
-        c.rect(table_x, y_cost - (4 * row_height), table_width, 4 * row_height)
+    def __init__(self):
+        self.buckets = {dim: {} for dim in ROLLUP_DIMENSIONS}  # dim -> cheie -> (comenzi, bani, platite)
+        self.names = {"technician": {}, "brand": {}}  # fold_text -> prima grafie vazuta
+        self._keys = {}  # order_id -> (perechi (dim, cheie), bani)
+
+    @staticmethod
+    def _order_entry(status, technician, brands, received, total, names) -> tuple:
+        day = safe_text(received)[:10]
+        tech = fold_text(technician)
+        if tech:
+            names["technician"].setdefault(tech, safe_text(technician).strip())
+        pairs = [("status", safe_text(status).strip()), ("technician", tech)]
+        if day:
+            pairs += [("day", day), ("month", day[:7]), ("technician_day", (tech, day))]
+        for brand in {safe_text(b).strip() for b in brands} - {""}:
+            names["brand"].setdefault(fold_text(brand), brand)
+            pairs.append(("brand", fold_text(brand)))
+        return tuple(pairs), int(round(safe_float(total) * 100))
+
+    @staticmethod
+    def _add(buckets, pairs, cents: int, sign: int):
+        for dim, key in pairs:
+            orders, revenue, paid = buckets[dim].get(key, (0, 0, 0))
+            orders, revenue, paid = orders + sign, revenue + sign * cents, paid + sign * (cents > 0)
+            if orders:
+                buckets[dim][key] = (orders, revenue, paid)
+            else:
+                buckets[dim].pop(key, None)
+
+    def rebuild(self, df: pd.DataFrame, printers: pd.DataFrame):
+        brands = {}
+        for order_id, brand in zip(printers["order_id"], printers["brand"]):
+            brands.setdefault(order_id, []).append(brand)
+        buckets = {dim: {} for dim in ROLLUP_DIMENSIONS}
+        names = {"technician": {}, "brand": {}}
+        keys = {}
+        if not df.empty:
+            received_text = df["date_received"].dt.strftime("%Y-%m-%d").fillna("")
+            for order_id, status, technician, received, total in zip(
+                df["order_id"], df["status"].astype(str), df["technician"].astype(str), received_text, df["total_cost"]
+            ):
+                entry = keys[order_id] = self._order_entry(
+                    status, technician, brands.get(order_id, ()), received, total, names
+                )
+                self._add(buckets, *entry, 1)
+        self.buckets, self.names, self._keys = buckets, names, keys
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "OrderRollups":
+        rollups = cls()
+        rollups.rebuild(df, build_printers_table(df))
+        return rollups
+
+    def refresh(self, df: pd.DataFrame, positions: dict, order_ids, printers_for):
+        buckets = {dim: dict(values) for dim, values in self.buckets.items()}
+        names = {dim: dict(values) for dim, values in self.names.items()}
+        keys = self._keys
+        for order_id in order_ids:
+            old = keys.pop(order_id, None)
+            if old:
+                self._add(buckets, *old, -1)
+            pos = positions.get(order_id)
+            if pos is None:
+                continue
+            row = df.iloc[pos]
+            brands = [p["brand"] for p in printers_for(order_id)]
+            entry = keys[order_id] = self._order_entry(
+                row["status"], row["technician"], brands, row["date_received"], row["total_cost"], names
+            )
+            self._add(buckets, *entry, 1)
+        self.buckets, self.names, self._keys = buckets, names, keys
 
-        c.setFillColor(colors.HexColor('#e0e0e0'))
-        c.rect(table_x, y_cost - row_height, table_width, row_height, fill=1)
-        c.setFillColor(colors.black)
-        c.setFont("Helvetica-Bold", 8)
-        c.drawString(table_x + 2 * mm, y_cost - row_height + 1.5 * mm, "Descriere")
-        c.drawString(table_x + table_width - 22 * mm, y_cost - row_height + 1.5 * mm, "Suma (RON)")
-        c.line(table_x, y_cost - row_height, table_x + table_width, y_cost - row_height)
 
-        y_cost -= row_height
+def rollup_totals(sources, dim: str, received_between=None, technician=None) -> dict:
+    """
+    cheie -> (comenzi, bani, platite) adunate din mai multe OrderRollups (active + arhiva), pentru
+    dim = "month" / "technician" / "status" / "brand" / "day"; received_between si technician
+    restrang rezultatul (luna si tehnicianul se calculeaza atunci din bucket-urile pe zi).
+    """
+    start, end = received_between or (None, None)
+    start, end = safe_text(start)[:10], safe_text(end)[:10]
+    tech = fold_text(technician) if technician is not None else None
+    ranged = bool(start or end)
+    pick = {"month": lambda t, day: day[:7], "technician": lambda t, day: t, "day": lambda t, day: day}.get(dim)
+    totals = {}
+
+    def add(key, value):
+        orders, revenue, paid = totals.get(key, (0, 0, 0))
+        totals[key] = (orders + value[0], revenue + value[1], paid + value[2])
+
+    for rollups in sources:
+        buckets = rollups.buckets
+        if dim in ("month", "technician", "day") and (ranged or (tech is not None and dim != "technician")):
+            for (t, day), value in buckets["technician_day"].items():
+                if (tech is None or t == tech) and (not start or day >= start) and (not end or day <= end):
+                    add(pick(t, day), value)
+        elif dim == "technician" and tech is not None:
+            if tech in buckets["technician"]:
+                add(tech, buckets["technician"][tech])
+        elif not ranged and tech is None:
+            for key, value in buckets[dim].items():
+                add(key, value)
+        else:
+            raise ValueError(f"Rollup {dim!r} cannot be filtered by date / technician")
+    return totals
 
-        c.setFont("Helvetica", 8)
-        c.drawString(table_x + 2 * mm, y_cost - row_height + 1.5 * mm, "Manopera")
-        labor = safe_float(order.get('labor_cost', 0))
-        c.drawString(table_x + table_width - 22 * mm, y_cost - row_height + 1.5 * mm, f"{labor:.2f}")
-        c.line(table_x, y_cost - row_height, table_x + table_width, y_cost - row_height)
-        y_cost -= row_height
-
-        c.drawString(table_x + 2 * mm, y_cost - row_height + 1.5 * mm, "Piese")
-        parts = safe_float(order.get('parts_cost', 0))
-        c.drawString(table_x + table_width - 22 * mm, y_cost - row_height + 1.5 * mm, f"{parts:.2f}")
-        c.line(table_x, y_cost - row_height, table_x + table_width, y_cost - row_height)
-        y_cost -= row_height
-
-        c.setFillColor(colors.HexColor('#f0f0f0'))
-        c.rect(table_x, y_cost - row_height, table_width, row_height, fill=1)
-        c.setFillColor(colors.black)
-        c.setFont("Helvetica-Bold", 9)
-        c.drawString(table_x + 2 * mm, y_cost - row_height + 1.5 * mm, "TOTAL")
-        total = safe_float(order.get('total_cost', labor + parts))
-        c.drawString(table_x + table_width - 22 * mm, y_cost - row_height + 1.5 * mm, f"{total:.2f}")
-
-        # ------------------------------
-        # SIGNATURE BOXES (shifted down)
-        # ------------------------------
-        sig_y = offset_y + 22 * mm + SHIFT_BOXES
-        sig_height = 18 * mm
-
-        c.rect(10 * mm, sig_y, 85 * mm, sig_height)
-        c.setFont("Helvetica-Bold", 8)
-        c.drawString(12 * mm, sig_y + sig_height - 3 * mm, "OPERATOR SERVICE")
-        c.setFont("Helvetica", 7)
-        c.drawString(12 * mm, sig_y + 2 * mm, "Semnatura")
-
-        c.rect(115 * mm, sig_y, 85 * mm, sig_height)
-        c.setFont("Helvetica-Bold", 8)
-        c.drawString(117 * mm, sig_y + sig_height - 3 * mm, "CLIENT")
-        c.setFont("Helvetica", 7)
-        c.drawString(117 * mm, sig_y + sig_height - 7 * mm, "Am luat la cunostinta")
-        c.drawString(117 * mm, sig_y + 2 * mm, "Semnatura")
-
-        # footer unchanged
-        c.setFont("Helvetica", 6)
-        c.drawCentredString(105 * mm, offset_y + 3 * mm,
-                            "Acest document constituie dovada ridicarii echipamentului din service.")
-        c.setDash(3, 3)
-        c.line(5 * mm, offset_y + 1 * mm, 205 * mm, offset_y + 1 * mm)
-        c.setDash()
-
-    draw_half(0)
-    draw_half(a5_height)
 
-    c.save()
-    buffer.seek(0)
-    return buffer
+def rollup_frame(totals: dict, names: Optional[dict] = None, label: str = "key") -> pd.DataFrame:
+    """rollup_totals() as a table: label, orders, revenue (RON), avg_ticket (RON, orders with a cost only)."""
+    names = names or {}
+    rows = [
+        {
+            label: names.get(key, key) if key else "(unassigned)",
+            "orders": orders,
+            "revenue": revenue / 100,
+            "avg_ticket": revenue / paid / 100 if paid else 0.0,
+        }
+        for key, (orders, revenue, paid) in sorted(totals.items())
+    ]
+    return pd.DataFrame(rows, columns=[label, "orders", "revenue", "avg_ticket"])
 
 
 # ============================================================================
-# CRM CLASS - GOOGLE SHEETS BACKEND
+# SHARED ORDER STORE
 # ============================================================================
-class PrinterServiceCRM:
-    def __init__(self, conn: GSheetsConnection):
-        self.conn = conn
-        self.worksheet = "Orders"
-        self.next_order_id = 1
-        self._init_sheet()
+ORDER_ID_PREFIX = "SRV-"
+ORDER_ID_ATTEMPTS = 3  # id-uri incercate la o comanda noua cand alta sesiune le ia inainte
 
-    def _read_df(self, raw: bool = True, ttl: int = 0) -> Optional[pd.DataFrame]:
-        """Read Google Sheets into DataFrame safely."""
+
+def parse_order_number(order_id) -> Optional[int]:
+    """SRV-00042 -> 42; None for anything that is not an order id."""
+    if isinstance(order_id, str) and order_id.startswith(ORDER_ID_PREFIX):
         try:
-            df = self.conn.read(
-                worksheet=self.worksheet,
-                ttl=ttl
-            )
-            if df is None:
-                return None
-            if raw:
-                return df
-            return df.fillna("")
-        except Exception as e:
-            st.sidebar.error(f"❌ Error reading Google Sheets: {e}")
+            return int(order_id[len(ORDER_ID_PREFIX):])
+        except ValueError:
             return None
+    return None
 
-    def _write_df(self, df: pd.DataFrame, allow_empty: bool = False) -> bool:
-        """Write entire DataFrame to Sheets. Prevents accidental data loss."""
-        try:
+
+def format_order_id(number: int) -> str:
+    return f"{ORDER_ID_PREFIX}{number:05d}"
+
+
+class OrderIdAllocator:
+    """
+    Numere de comanda unice pentru tot procesul.
+    Implicit da max + 1; cu fill_gaps=True refoloseste intai golurile (cel mai mic primul).
+    """
+
+    def __init__(self, fill_gaps: bool = False):
+        self.fill_gaps = fill_gaps
+        self._lock = threading.Lock()
+        self._used = set()
+        self._reserved = set()  # rezervate dar inca nescrise; supravietuiesc unui reset
+        self._next = 1
+        self._gaps = []  # heap cu numere libere < _next (doar pentru fill_gaps)
+
+    def reset(self, order_ids):
+        """Rebuild from the ids in storage, keeping numbers reserved by inserts still in flight."""
+        numbers = {n for n in map(parse_order_number, order_ids) if n}
+        with self._lock:
+            numbers |= self._reserved
+            self._used = numbers
+            self._next = max(numbers, default=0) + 1
+            self._gaps = sorted(set(range(1, self._next)) - numbers) if self.fill_gaps else []
+
+    def mark_used(self, order_id):
+        number = parse_order_number(order_id)
+        if not number:
+            return
+        with self._lock:
+            self._used.add(number)
+            self._reserved.discard(number)
+            if number >= self._next:
+                if self.fill_gaps:
+                    for n in range(self._next, number):
+                        heapq.heappush(self._gaps, n)
+                self._next = number + 1
+
+    def reserve(self) -> int:
+        with self._lock:
+            while self._gaps:
+                number = heapq.heappop(self._gaps)
+                if number not in self._used:
+                    break
+            else:
+                number = self._next
+                self._next += 1
+            self._used.add(number)
+            self._reserved.add(number)
+            return number
+
+    def release(self, number: int):
+        """Give back a reserved number whose order was never written."""
+        with self._lock:
+            self._used.discard(number)
+            self._reserved.discard(number)
+            if number == self._next - 1:
+                self._next = number
+            elif self.fill_gaps:
+                heapq.heappush(self._gaps, number)
+
+
+def archive_candidates(df: pd.DataFrame, older_than_days: int) -> dict:
+    """{year: [order_id, ...]} for Completed orders picked up more than older_than_days ago."""
+    if df.empty or "status" not in df.columns:
+        return {}
+    when = df["date_picked_up"].fillna(df["date_completed"]).fillna(df["date_received"])
+    cutoff = pd.Timestamp(date.today() - timedelta(days=older_than_days))
+    due = (df["status"] == "Completed") & (when < cutoff)
+    if not due.any():
+        return {}
+    return {
+        int(year): ids.tolist()
+        for year, ids in df.loc[due, "order_id"].groupby(when[due].dt.year)
+    }
+
+
+class OrderStore:
+    """
+    Snapshot-ul comenzilor, unic per proces si partajat de toate sesiunile.
+    Scrierile trec prin store (write-through catre backend) si cresc `version`;
+    snapshot-ul este inlocuit, nu modificat, deci cititorii nu vad stari partiale.
+    """
+
+    SYNC_OVERLAP = 10  # secunde
+    PRINTER_OVERLAY_MIN = 1000  # comenzi rescrise dupa care overlay-ul de imprimante se pliaza (sau 5%)
+
+    def __init__(self, backend: OrderBackend, fill_id_gaps: bool = False, sync_interval: float = 30,
+                 archive_after_days: int = 180):
+        self.backend = backend
+        self.archive_after_days = archive_after_days
+        self.version = 0
+        self.ids = OrderIdAllocator(fill_gaps=fill_id_gaps)
+        self.sync_interval = sync_interval
+        self.watermark = ""  # cel mai nou updated_at vazut
+        self.last_sync = 0.0
+        self._lock = threading.RLock()
+        self._df = None
+        self._positions = {}  # order_id -> pozitia randului in snapshot
+        self._archive_df = None  # partitiile de arhiva, citite doar la cerere
+        # tabelul normalizat de imprimante de la ultima reconstruire + order_id -> pozitiile randurilor;
+        # o singura tupla, ca cititorii sa nu vada un tabel nou cu un index vechi
+        self._printer_base = (build_printers_table(pd.DataFrame()), {})
+        self._printer_overlay = {}  # order_id -> imprimantele scrise dupa reconstruire ([] = fara)
+        self._serial_index = {}  # serial normalizat -> order ids (comenzi active)
+        self._archive_serials = {}  # la fel, pentru arhiva
+        self._archive_positions = {}
+        self.clients = ClientDirectory()
+        self.search_index = OrderSearchIndex()
+        self.indexes = OrderIndexes()  # status / tehnician / brand / data primirii
+        self.rollups = OrderRollups()  # venit / comenzi pe zi, luna, tehnician, brand, status
+        self._archive_rollups = None  # (snapshot arhiva, OrderRollups), construit la cerere
+        self._archive_search = None  # (snapshot arhiva, OrderSearchIndex), construit la prima cautare
+        self.status_counts = {}  # status -> numar de comenzi active, intretinut la fiecare scriere
+        self._views = {}  # (include_archive, sort_by, ascending) -> pozitii sortate
+        self.memory_report = {"raw_bytes": 0, "typed_bytes": 0}
+
+    def _publish(self, df: pd.DataFrame, changed=None, printers: bool = True, appended=None):
+        """
+        Publish a new snapshot and bring the derived indexes up to date: for the orders in
+        `changed` only, or rebuilt from scratch when changed is None. `appended` says the rows
+        kept their positions and these order ids were added at the end ([] = same rows), so the
+        position map is extended instead of rebuilt; None means rows may have moved.
+        """
+        added = {}
+        if changed is None or appended is None:
+            positions = {oid: pos for pos, oid in enumerate(df["order_id"].tolist())} if "order_id" in df.columns else {}
+        else:
+            start = len(df) - len(appended)
+            added = {oid: start + i for i, oid in enumerate(appended)}
+            # randurile noi se vad doar prin ChainMap pana la publicare; apoi intra in dict pe loc
+            positions = ChainMap(added, self._positions) if added else self._positions
+        if printers:
+            self._refresh_printers(df, positions, changed)
+        if changed is None:
+            printers_table = self._printer_base[0]
+            self.indexes.rebuild(df, printers_table)
+            self.rollups.rebuild(df, printers_table)
+            self.clients.rebuild(df)
+            self.search_index.invalidate()
+        else:
+            self.indexes.refresh(df, positions, changed, self.printers_for)
+            self.rollups.refresh(df, positions, changed, self.printers_for)
+            self.clients.refresh(df, positions, changed)
+            self.search_index.refresh(df, positions, changed, self.printers_for)
+        self.status_counts = self.indexes.counts("status")
+        self._df = df
+        if isinstance(positions, ChainMap):
+            self._positions.update(added)
+        else:
+            self._positions = positions
+        if "updated_at" in df.columns:
+            stamps = df["updated_at"] if changed is None else df["updated_at"].iloc[
+                [positions[oid] for oid in changed if oid in positions]]
+            self.watermark = max(self.watermark, max(map(safe_text, stamps), default=""))
+        self._views = {}  # ordinile de afisare sunt valabile doar pentru snapshot-ul curent
+        self.version += 1
+
+    def _refresh_printers(self, df: pd.DataFrame, positions: dict, order_ids=None):
+        """
+        Re-read the printers of `order_ids` from the order frame (all orders when None). Only the
+        touched orders are replaced, in an overlay over the printers table; the overlay is folded
+        back into the table once it holds more than 5% of the orders.
+        """
+        if order_ids is None:
+            table = build_printers_table(df)
+            self._printer_base = (table, printer_positions(table))
+            self._printer_overlay = {}
+            self._serial_index = serial_index(table)
+            return
+        ids = list(dict.fromkeys(order_ids))
+        old_serials = {normalize_serial(p["serial"]) for oid in ids for p in self.printers_for(oid)} - {""}
+        fresh = build_printers_table(df.iloc[[positions[oid] for oid in ids if oid in positions]])
+        rows = {oid: [] for oid in ids}
+        for order_id, brand, model, serial in zip(fresh["order_id"], fresh["brand"], fresh["model"], fresh["serial"]):
+            rows[order_id].append({"brand": brand, "model": model, "serial": serial})
+        # overlay-ul e mic (maxim 5% din comenzi), deci se inlocuieste: cititorii il parcurg fara lock
+        overlay = self._printer_overlay = {**self._printer_overlay, **rows}
+        # index incremental, pe loc: doar cheile atinse; listele lor sunt inlocuite, nu modificate
+        touched = set(ids)
+        serials = self._serial_index
+        for key in old_serials:
+            remaining = [oid for oid in serials.get(key, []) if oid not in touched]
+            if remaining:
+                serials[key] = remaining
+            else:
+                serials.pop(key, None)
+        for key, fresh_ids in serial_index(fresh).items():
+            serials[key] = serials.get(key, []) + fresh_ids
+        if len(overlay) > max(self.PRINTER_OVERLAY_MIN, len(df) // 20):
+            table = self._merged_printers()
+            self._printer_base = (table, printer_positions(table))
+            self._printer_overlay = {}
+
+    def _merged_printers(self) -> pd.DataFrame:
+        """Printers table with the overlay applied (orders written since the rebuild go last)."""
+        table, _ = self._printer_base
+        overlay = self._printer_overlay
+        if not overlay:
+            return table
+        fresh = pd.DataFrame(
+            [{"order_id": oid, "position": n, **p} for oid, printers in overlay.items()
+             for n, p in enumerate(printers, start=1)],
+            columns=PRINTER_TABLE_COLUMNS,
+        ).astype(table.dtypes.to_dict())
+        kept = table[~table["order_id"].isin(list(overlay))]
+        return pd.concat([kept, fresh], ignore_index=True)
+
+    def reload(self) -> pd.DataFrame:
+        """Full read from the backend (first use, or on demand)."""
+        with self._lock:
+            df = self.backend.ensure_schema()
             if df is None:
-                st.sidebar.error("❌ Tried to write None DataFrame to Sheets.")
+                df = pd.DataFrame(columns=ORDER_COLUMNS)
+            df = df.dropna(how="all").reset_index(drop=True)
+            typed = coerce_orders_df(df.reindex(columns=list(dict.fromkeys(ORDER_COLUMNS + list(df.columns)))))
+            self.memory_report = {"raw_bytes": frame_memory(df), "typed_bytes": frame_memory(typed)}
+            self.watermark = ""
+            self._publish(typed)
+            self.warm_search_index()
+            self._archive_df = None
+            self.ids.reset(list(self._positions) + self.backend.archived_order_ids())
+            self.last_sync = time.monotonic()
+            return self._df
+
+    def sync(self) -> bool:
+        """Merge rows changed in storage since the watermark; full reload only if the backend asks for it."""
+        with self._lock:
+            if self._df is None:
+                self.reload()
+                return True
+            # suprapunere de cateva secunde: scrieri din alte procese pot avea ceasul putin in urma
+            since = shift_stamp(self.watermark, -self.SYNC_OVERLAP) if self.watermark else ""
+            result = self.backend.changed_since(since, self._positions.keys())
+            if result is None:
+                self.reload()
+                return True
+            changed, live_ids = result
+            self.last_sync = time.monotonic()
+            removed = set(self._positions) - live_ids
+            if changed.empty and not removed:
                 return False
-            if df.empty and not allow_empty:
-                st.sidebar.error("⚠️ Refusing to write empty DataFrame to prevent data loss.")
+
+            df = self._df.copy()
+            new_rows, updated = [], 0
+            for row in changed.reindex(columns=df.columns).to_dict("records"):
+                pos = self._positions.get(row["order_id"])
+                if pos is None:
+                    new_rows.append(row)
+                    self.ids.mark_used(row["order_id"])
+                elif safe_text(row["updated_at"]) != safe_text(df.at[pos, "updated_at"]):
+                    assign_order_values(df, pos, row)
+                    updated += 1
+            if not (updated or new_rows or removed):
                 return False
-            self.conn.update(worksheet=self.worksheet, data=df)
-            st.sidebar.success("💾 Saved to Google Sheets!")
+            if removed:
+                # de obicei comenzi arhivate de alt proces
+                df = df[~df["order_id"].isin(removed)]
+                self._archive_df = None
+            if new_rows:
+                df = concat_orders([df, coerce_orders_df(pd.DataFrame(new_rows, columns=df.columns))])
+            df = df.reset_index(drop=True)
+            touched = set(changed["order_id"].astype(str)) if "order_id" in changed.columns else set()
+            appended = None if removed else [safe_text(row["order_id"]) for row in new_rows]
+            self._publish(df, changed=touched | removed, appended=appended)
             return True
-        except Exception as e:
-            st.sidebar.error(f"❌ Error saving to Google Sheets: {e}")
-            return False
-
-    def _init_sheet(self):
-        """Ensure headers exist and compute next_order_id with fill-the-gap logic."""
-        df = self._read_df(raw=True, ttl=0)
 
-        # CASE 1 — Sheet is missing or fully empty → create new sheet
-        if df is None or df.empty:
-            columns = [
-                "order_id", "client_name", "client_phone", "client_email",
-                "printer_brand", "printer_model", "printer_serial",
-                "printers_json",
-                "issue_description", "accessories", "notes",
-                "date_received", "date_pickup_scheduled", "date_completed", "date_picked_up",
-                "status", "technician", "repair_details", "parts_used",
-                "labor_cost", "parts_cost", "total_cost",
-            ]
-            df = pd.DataFrame(columns=columns)
-            self._write_df(df, allow_empty=False)
-            self.next_order_id = 1
-            return
+    def maybe_sync(self) -> bool:
+        """Called once per rerun: sync if sync_interval seconds passed since the last one."""
+        if self.sync_interval <= 0 or time.monotonic() - self.last_sync < self.sync_interval:
+            return False
+        return self.sync()
+
+    def snapshot(self, include_archive: bool = False) -> pd.DataFrame:
+        df = self._df
+        if df is None:
+            df = self.reload()
+        if include_archive:
+            archive = self.archive_snapshot()
+            if not archive.empty:
+                return concat_orders([df, archive])
+        return df
+
+    def combined_snapshot(self) -> pd.DataFrame:
+        """Hot + archived orders (hot rows first, same positions), cached for the current snapshot."""
+        views = self._views
+        frame = views.get("combined")
+        if frame is None:
+            frame = views["combined"] = self.snapshot(include_archive=True)
+        return frame
+
+    def archive_status_counts(self) -> dict:
+        views = self._views
+        counts = views.get("archive_counts")
+        if counts is None:
+            archive = self.archive_snapshot()
+            counts = views["archive_counts"] = {str(k): int(v) for k, v in archive["status"].astype(str).value_counts().items() if v}
+        return counts
+
+    def sorted_positions(self, sort_by: str = "date_received", ascending: bool = False,
+                         include_archive: bool = False) -> np.ndarray:
+        """Row positions of the (hot or combined) snapshot in display order; sorted once per snapshot."""
+        views = self._views
+        key = (include_archive, sort_by, ascending)
+        order = views.get(key)
+        if order is None:
+            frame = self.combined_snapshot() if include_archive else self.snapshot()
+            column = frame[sort_by]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                column = column.astype(str)
+            column = column.reset_index(drop=True)
+            order = views[key] = column.sort_values(ascending=ascending, na_position="last", kind="stable").index.to_numpy()
+        return order
+
+    def archive_snapshot(self) -> pd.DataFrame:
+        """All archive partitions, read once and kept until the next archive run / reload."""
+        archive = self._archive_df
+        if archive is None:
+            with self._lock:
+                frames = [self.backend.read_partition(name) for name in self.backend.archive_partitions()]
+                frames = [f.dropna(how="all") for f in frames if f is not None and not f.empty]
+                columns = self.snapshot().columns
+                archive = coerce_orders_df(
+                    pd.concat(frames, ignore_index=True).reindex(columns=columns)
+                    if frames else pd.DataFrame(columns=columns)
+                )
+                self._archive_serials = serial_index(build_printers_table(archive))
+                self._archive_positions = {oid: pos for pos, oid in enumerate(archive["order_id"])}
+                self._archive_df = archive
+        return archive
+
+    def rollup_sources(self, include_archive: bool = False) -> list:
+        """The maintained rollups of the hot orders, plus the archive's (built once per archive snapshot)."""
+        self.snapshot()
+        sources = [self.rollups]
+        if include_archive:
+            archive = self.archive_snapshot()
+            cached = self._archive_rollups
+            if cached is None or cached[0] is not archive:
+                cached = self._archive_rollups = (archive, OrderRollups.from_frame(archive))
+            sources.append(cached[1])
+        return sources
+
+    def rebuild_rollups(self):
+        """Full rebuild of the report rollups from the snapshot (the incremental path keeps them current)."""
+        with self._lock:
+            df = self.snapshot()
+            self.rollups.rebuild(df, self.printers_table)
+            self._archive_rollups = None
+
+    def get(self, order_id: str, include_archive: bool = False) -> Optional[dict]:
+        df = self.snapshot()
+        pos = self._positions.get(order_id)
+        if pos is not None:
+            return {**df.iloc[pos].to_dict(), "printers": self.printers_for(order_id)}
+        if include_archive:
+            archive = self.archive_snapshot()
+            match = archive[archive["order_id"] == order_id]
+            if not match.empty:
+                order = match.iloc[0].to_dict()
+                return {**order, "printers": load_printers_from_order(order)}
+        return None
 
-        # CASE 2 — Sheet exists but order_id column is missing → recreate sheet header
-        if "order_id" not in df.columns:
-            columns = [
-                "order_id", "client_name", "client_phone", "client_email",
-                "printer_brand", "printer_model", "printer_serial",
-                "printers_json",
-                "issue_description", "accessories", "notes",
-                "date_received", "date_pickup_scheduled", "date_completed", "date_picked_up",
-                "status", "technician", "repair_details", "parts_used",
-                "labor_cost", "parts_cost", "total_cost",
+    @property
+    def printers_table(self) -> pd.DataFrame:
+        """
+        Normalized printers of the hot orders (order_id, position, brand, model, serial); read-only.
+        After writes it is merged from the overlay on first use, once per snapshot.
+        """
+        self.snapshot()
+        views = self._views
+        table = views.get("printers")
+        if table is None:
+            table = views["printers"] = self._merged_printers()
+        return table
+
+    def printers_for(self, order_id: str) -> list:
+        """Printers of one hot order (the overlay for orders written since the last rebuild)."""
+        printers = self._printer_overlay.get(order_id)
+        if printers is not None:
+            return [dict(p) for p in printers]
+        table, index = self._printer_base
+        rows = index.get(order_id)
+        if rows is None:
+            return []
+        return table.iloc[rows][["brand", "model", "serial"]].to_dict("records")
+
+    def build_search_index(self):
+        """Index the hot orders for search (writes wait meanwhile, so no update is missed)."""
+        with self._lock:
+            if not self.search_index.built:
+                self.search_index.build(self.snapshot(), self.printers_table)
+
+    def warm_search_index(self):
+        """Build the search index on a background thread after a full load."""
+        threading.Thread(target=self.build_search_index, name="order-search-index", daemon=True).start()
+
+    def search(self, text: str, limit: int = 50, include_archive: bool = False) -> list:
+        """Ranked order ids for a free-text query over the active orders, then the archived ones."""
+        if not self.search_index.built:
+            self.build_search_index()
+        order_ids = self.search_index.search(text, limit=limit)
+        if include_archive and len(order_ids) < limit:
+            order_ids += self.archive_search_index().search(text, limit=limit - len(order_ids))
+        return order_ids
+
+    def archive_search_index(self) -> OrderSearchIndex:
+        """Search index over the archive partitions, built once per archive snapshot."""
+        archive = self.archive_snapshot()
+        cached = self._archive_search
+        if cached is None or cached[0] is not archive:
+            index = OrderSearchIndex()
+            index.build(archive, build_printers_table(archive))
+            cached = self._archive_search = (archive, index)
+        return cached[1]
+
+    def positions_of(self, order_ids, include_archive: bool = False) -> np.ndarray:
+        """
+        Row positions of these orders in the hot snapshot (or the combined one, archive rows
+        after the hot ones), in the given order; unknown ids are skipped.
+        """
+        df = self.snapshot()
+        positions = self._positions
+        if not include_archive:
+            return np.asarray([positions[oid] for oid in order_ids if oid in positions], dtype=np.int64)
+        self.archive_snapshot()
+        offset, archived = len(df), self._archive_positions
+        return np.asarray(
+            [positions[oid] if oid in positions else offset + archived[oid]
+             for oid in order_ids if oid in positions or oid in archived],
+            dtype=np.int64,
+        )
+
+    def query_positions(self, include_archive: bool = False, **filters) -> Optional[np.ndarray]:
+        """
+        Sorted row positions (hot snapshot, or hot + archive) matching the filters of
+        OrderIndexes.select; None when no filter is set. Hot orders are answered from the indexes,
+        archived ones by a mask over the archive frame, cached until the snapshot changes.
+        """
+        filters = {k: v for k, v in filters.items() if v is not None}
+        if not filters:
+            return None
+        positions = np.sort(self.positions_of(self.indexes.select(**filters)))
+        if include_archive:
+            views = self._views
+            key = ("archive_query", repr(sorted(filters.items())))
+            archived = views.get(key)
+            if archived is None:
+                archived = views[key] = np.flatnonzero(filter_orders_frame(self.archive_snapshot(), **filters))
+            positions = np.concatenate([positions, archived + len(self.snapshot())])
+        return positions
+
+    def rows(self, order_ids, include_archive: bool = False) -> pd.DataFrame:
+        """Orders by id (hot, or hot + archive), in the given order (unknown ids are skipped)."""
+        df = self.combined_snapshot() if include_archive else self.snapshot()
+        return df.iloc[self.positions_of(order_ids, include_archive)]
+
+    def device_history(self, serial: str, include_archive: bool = True, exclude: Optional[str] = None) -> pd.DataFrame:
+        """Every order that contained this serial number, newest first (index lookup, no scan)."""
+        key = normalize_serial(serial)
+        df = self.snapshot()
+        if not key:
+            return df.iloc[0:0]
+        positions = [self._positions[oid] for oid in self._serial_index.get(key, []) if oid in self._positions]
+        frames = [df.iloc[positions]]
+        if include_archive:
+            archive = self.archive_snapshot()
+            archived = [self._archive_positions[oid] for oid in self._archive_serials.get(key, [])
+                        if oid in self._archive_positions]
+            if archived:
+                frames.append(archive.iloc[archived])
+        history = concat_orders(frames) if len(frames) > 1 else frames[0]
+        if exclude:
+            history = history[history["order_id"] != exclude]
+        return history.sort_values("date_received", ascending=False, na_position="last")
+
+    def migrate_legacy_printers(self) -> int:
+        """
+        One-time admin migration: orders that only have printer_brand/model/serial get
+        printers_json built from those columns. All rows are converted in memory and written
+        with a single rewrite. Returns how many orders were converted.
+        """
+        with self._lock:
+            self.sync()  # rescriem tot tabelul: pornim de la ultima stare din storage
+            df = self.snapshot()
+            legacy = legacy_printer_rows(df)
+            if legacy.empty:
+                return 0
+            df = df.copy()
+            df.loc[legacy.index, "printers_json"] = [
+                printer_fields([{"brand": brand, "model": model, "serial": serial}])["printers_json"]
+                for brand, model, serial in zip(
+                    legacy["printer_brand"].astype(str), legacy["printer_model"], legacy["printer_serial"]
+                )
             ]
-            new_df = pd.DataFrame(columns=columns)
-            self._write_df(new_df, allow_empty=False)
-            self.next_order_id = 1
-            return
+            df.loc[legacy.index, "revision"] = legacy["revision"] + 1
+            df.loc[legacy.index, "updated_at"] = now_stamp()
+            if not self.backend.rewrite(df.astype(object).apply(lambda col: col.map(to_cell_value))):
+                return 0
+            # schimbare in masa: reconstruirea indecsilor e mai ieftina decat actualizarea pe rand
+            self._publish(df)
+            self.warm_search_index()
+            return len(legacy)
+
+    def archive_completed(self, older_than_days: int) -> int:
+        """Move Completed orders older than the cutoff into yearly partitions; returns how many moved."""
+        with self._lock:
+            df = self.snapshot()
+            due = archive_candidates(df, older_than_days)
+            if not due or not self.backend.archive(due):
+                return 0
+            moved = {oid for ids in due.values() for oid in ids}
+            df = df[~df["order_id"].isin(moved)].reset_index(drop=True)
+            self._publish(df, changed=moved)
+            self._archive_df = None
+            return len(moved)
+
+    def allocate_order_id(self) -> str:
+        """Reserve the next order id, skipping ids that already exist in storage."""
+        with self._lock:
+            self.snapshot()
+            while True:
+                order_id = format_order_id(self.ids.reserve())
+                # re-verificare: id-ul poate fi scris de alt proces sau adaugat manual in sheet
+                if order_id not in self._positions and not self.backend.has_order(order_id):
+                    return order_id
+
+    def release_order_id(self, order_id: str):
+        number = parse_order_number(order_id)
+        if number:
+            self.ids.release(number)
+
+    def insert(self, row: dict) -> bool:
+        row = {**row, "updated_at": now_stamp()}
+        with self._lock:
+            df = self.snapshot()
+            if not self.backend.insert(row):
+                return False
+            new_row = coerce_orders_df(pd.DataFrame([row]).reindex(columns=df.columns))
+            df = concat_orders([df, new_row])
+            self._publish(df, changed=[row["order_id"]], appended=[row["order_id"]])
+            self.ids.mark_used(row["order_id"])
+            return True
 
-        # CASE 3 — Ensure printers_json exists
-        if "printers_json" not in df.columns:
-            df["printers_json"] = ""
-            self._write_df(df, allow_empty=False)
+    def insert_new(self, row: dict) -> Optional[str]:
+        """Allocate the next order id and insert the row in one critical section; None if the write failed."""
+        with self._lock:
+            for _ in range(ORDER_ID_ATTEMPTS):
+                order_id = self.allocate_order_id()
+                if self.insert({"order_id": order_id, **row}):
+                    return order_id
+                self.release_order_id(order_id)
+                # id-ul a fost luat intre timp de alta sesiune: incercam urmatorul
+                if not self.backend.has_order(order_id):
+                    return None
+                self.ids.mark_used(order_id)
+            return None
 
-        # CASE 4 — Determine next order ID with fill-the-gap logic
-        existing = []
-        for oid in df["order_id"]:
+    def _replace_values(self, pos: int, values: dict):
+        # snapshot nou cu aceleasi coloane; se copiaza doar coloanele scrise (cititorii il pastreaza pe cel vechi)
+        df = self._df.copy(deep=False)
+        for col in values:
+            if col in df.columns:
+                df[col] = df[col].copy()
+        assign_order_values(df, pos, {k: to_cell_value(v) for k, v in values.items()})
+        self._publish(df, changed=[df.at[pos, "order_id"]], appended=[],
+                      printers=any(field in values for field in PRINTER_FIELDS))
+
+    def patch(self, order_id: str, changes: dict, expected_revision: Optional[int] = None) -> bool:
+        """Write-through patch that bumps the order revision (compare-and-swap when expected_revision is set)."""
+        with self._lock:
+            df = self.snapshot()
+            pos = self._positions.get(order_id)
+            local_revision = order_revision(df.iloc[pos]) if pos is not None else 0
+            if expected_revision is not None and pos is not None and local_revision != expected_revision:
+                raise OrderConflictError(order_id, self.get(order_id))
+
+            base = expected_revision if expected_revision is not None else local_revision
+            # backend-ul ridica revizia peste cea stocata daca alt proces a scris intre timp
+            changes = {**changes, "revision": base + 1, "updated_at": now_stamp()}
             try:
-                if isinstance(oid, str) and oid.startswith("SRV-"):
-                    num = int(oid.split("-")[1])
-                    existing.append(num)
-            except Exception:
-                continue
+                if not self.backend.patch(order_id, changes, expected_revision=expected_revision):
+                    return False
+            except OrderConflictError as e:
+                # alt proces a scris intre timp; aducem snapshot-ul la zi cu varianta din storage
+                if pos is not None and e.current:
+                    self._replace_values(pos, e.current)
+                raise
+            if pos is None:
+                # comanda scrisa din alt proces; o vom vedea la urmatorul reload
+                return True
+            self._replace_values(pos, changes)
+            return True
 
-        # CASE 4A — No existing IDs → start fresh
-        if not existing:
-            self.next_order_id = 1
-            return
 
-        existing_sorted = sorted(existing)
+@st.cache_resource
+def get_order_store() -> Optional[OrderStore]:
+    """Single OrderStore per server process, shared across browser sessions."""
+    backend = get_storage_backend()
+    if not backend:
+        return None
+    config = storage_config()
+    store = OrderStore(
+        backend,
+        fill_id_gaps=config.get("id_policy", "next") == "fill_gaps",
+        sync_interval=float(config.get("sync_interval", 30)),
+        archive_after_days=int(config.get("archive_after_days", 180)),
+    )
+    return store
 
-        # CASE 4B — Find the first missing ID
-        missing = None
-        for i in range(1, existing_sorted[-1] + 1):
-            if i not in existing_sorted:
-                missing = i
-                break
 
-        if missing:
-            self.next_order_id = missing
-        else:
-            # No gaps → next is max + 1
-            self.next_order_id = existing_sorted[-1] + 1
+# ============================================================================
+# CRM CLASS
+# ============================================================================
+class PrinterServiceCRM:
+    def __init__(self, store: OrderStore):
+        self.store = store
+        self.backend = store.backend
+
+    @property
+    def version(self) -> int:
+        """Version of the shared order snapshot; bumps on every write from any session."""
+        return self.store.version
 
     def create_service_order(
         self,
@@ -809,20 +3776,6 @@ class PrinterServiceCRM:
         date_received,
         date_pickup
     ):
-        order_id = f"SRV-{self.next_order_id:05d}"
-
-        # First printer for legacy columns
-        first_brand = ""
-        first_model = ""
-        first_serial = ""
-
-        if printers_list:
-            first_brand = safe_text(printers_list[0].get("brand", ""))
-            first_model = safe_text(printers_list[0].get("model", ""))
-            first_serial = safe_text(printers_list[0].get("serial", ""))
-
-        printers_json = json.dumps(printers_list, ensure_ascii=False)
-
         def to_date_str(d):
             if isinstance(d, date):
                 return d.strftime("%Y-%m-%d")
@@ -830,15 +3783,11 @@ class PrinterServiceCRM:
                 return d
             return ""
 
-        new_order = pd.DataFrame([{
-            "order_id": order_id,
+        new_order = {
             "client_name": client_name,
             "client_phone": client_phone,
             "client_email": client_email,
-            "printer_brand": first_brand,
-            "printer_model": first_model,
-            "printer_serial": first_serial,
-            "printers_json": printers_json,
+            **printer_fields(printers_list),  # printers_json + first printer for legacy columns
             "issue_description": issue_description,
             "accessories": accessories,
             "notes": notes,
@@ -853,66 +3802,732 @@ class PrinterServiceCRM:
             "labor_cost": 0.0,
             "parts_cost": 0.0,
             "total_cost": 0.0,
-        }])
+            "revision": 1,
+        }
+
+        return self.store.insert_new(new_order)
+
+    def list_orders_df(self, include_archive: bool = False) -> pd.DataFrame:
+        """Shared snapshot of the hot orders (plus the archive if asked); treat it as read-only."""
+        return self.store.snapshot(include_archive=include_archive)
+
+    def get_order(self, order_id: str, include_archive: bool = False) -> Optional[dict]:
+        """Current copy of a single order from the shared snapshot."""
+        return self.store.get(order_id, include_archive=include_archive)
+
+    def archive_completed(self, older_than_days: Optional[int] = None) -> int:
+        if older_than_days is None:
+            older_than_days = self.store.archive_after_days
+        return self.store.archive_completed(older_than_days)
+
+    def status_counts(self, include_archive: bool = False) -> dict:
+        """Orders per status from the store's maintained counters (no scan of the table)."""
+        self.store.snapshot()
+        counts = dict(self.store.status_counts)
+        if include_archive:
+            for status, n in self.store.archive_status_counts().items():
+                counts[status] = counts.get(status, 0) + n
+        return counts
+
+    def query(self, status=None, received_between=None, technician=None, brand=None,
+              include_archive: bool = False) -> pd.DataFrame:
+        """
+        Orders matching all the given filters, answered from the store's maintained indexes.
+        status / technician / brand take one value or a list; received_between is (start, end),
+        inclusive, either side may be None. Treat the result as read-only.
+        """
+        frame = self.store.combined_snapshot() if include_archive else self.store.snapshot()
+        positions = self.store.query_positions(include_archive, status=status, received_between=received_between,
+                                               technician=technician, brand=brand)
+        return frame if positions is None else frame.iloc[positions]
+
+    def count(self, status=None, received_between=None, technician=None, brand=None,
+              include_archive: bool = False) -> int:
+        """Like query(), but only the count (e.g. open orders of a technician this week)."""
+        filters = dict(status=status, received_between=received_between, technician=technician, brand=brand)
+        if include_archive:
+            positions = self.store.query_positions(True, **filters)
+            return len(self.store.combined_snapshot()) if positions is None else len(positions)
+        self.store.snapshot()
+        ids = self.store.indexes.select(**filters)
+        return len(self.store.snapshot()) if ids is None else len(ids)
+
+    def report_totals(self, received_between=None, technician=None, include_archive: bool = False) -> dict:
+        """Orders, revenue and average ticket (orders with a cost) from the rollups, no scan of the orders."""
+        totals = rollup_totals(self.store.rollup_sources(include_archive), "technician",
+                               received_between=received_between, technician=technician)
+        orders, revenue, paid = (sum(values) for values in zip((0, 0, 0), *totals.values()))
+        return {"orders": orders, "revenue": revenue / 100, "avg_ticket": revenue / paid / 100 if paid else 0.0}
+
+    def report_rollup(self, dim: str, received_between=None, technician=None,
+                      include_archive: bool = False) -> pd.DataFrame:
+        """Orders / revenue / average ticket per month, day, technician, brand or status (see rollup_totals)."""
+        sources = self.store.rollup_sources(include_archive)
+        # aceleasi grafii ca in filtre; arhiva completeaza numele care nu mai apar in comenzile active
+        current = {"technician": self.technicians, "brand": self.brands}.get(dim)
+        names = {fold_text(name): name for name in current()} if current else {}
+        for rollups in sources:
+            for key, name in rollups.names.get(dim, {}).items():
+                names.setdefault(key, name)
+        totals = rollup_totals(sources, dim, received_between=received_between, technician=technician)
+        return rollup_frame(totals, names, label=dim)
+
+    def technicians(self) -> list:
+        """Technician names as typed on the active orders (one spelling per person)."""
+        indexed, names = self.store.indexes.technician, {}
+        for name in self.store.snapshot()["technician"].cat.categories:
+            name = safe_text(name).strip()
+            if fold_text(name) in indexed:
+                names.setdefault(fold_text(name), name)
+        return sorted(names.values(), key=fold_text)
+
+    def brands(self) -> list:
+        indexed, names = self.store.indexes.brand, {}
+        for name in self.store.printers_table["brand"].unique():
+            name = safe_text(name).strip()
+            if fold_text(name) in indexed:
+                names.setdefault(fold_text(name), name)
+        return sorted(names.values(), key=fold_text)
+
+    def orders_page(self, page: int = 1, page_size: int = 50, sort_by: str = "date_received",
+                    ascending: bool = False, search: str = "", include_archive: bool = False,
+                    **filters) -> tuple:
+        """
+        One page of the orders list, filtered (query() filters + search) and sorted server-side.
+        Returns (rows of the page, number of matching orders). sort_by="relevance" keeps the
+        search ranking (active orders first, then archived ones when include_archive is set).
+        """
+        store = self.store
+        frame = store.combined_snapshot() if include_archive else store.snapshot()
+        positions = None
+        if search.strip():
+            positions = store.positions_of(
+                store.search(search, limit=max(len(frame), 1), include_archive=include_archive), include_archive
+            )
+        matched = store.query_positions(include_archive, **filters)
+        if matched is not None:
+            positions = matched if positions is None else positions[np.isin(positions, matched)]
+        if positions is None:
+            positions = store.sorted_positions("date_received" if sort_by == "relevance" else sort_by,
+                                               ascending, include_archive)
+        elif not (search.strip() and sort_by == "relevance"):
+            if sort_by == "relevance":
+                sort_by = "date_received"
+            rank = np.empty(len(frame), dtype=np.int64)
+            rank[store.sorted_positions(sort_by, ascending, include_archive)] = np.arange(len(frame))
+            positions = positions[np.argsort(rank[positions], kind="stable")]
+        total = len(positions)
+        start = (max(page, 1) - 1) * page_size
+        return frame.iloc[positions[start:start + page_size]], total
+
+    def receipt_orders(self, frame: pd.DataFrame) -> list:
+        """Order dicts with their printers for the rows of a query / page result (e.g. batch receipts)."""
+        orders = []
+        for order in frame.to_dict("records"):
+            printers = self.store.printers_for(order["order_id"]) or load_printers_from_order(order)
+            orders.append({**order, "printers": printers})
+        return orders
+
+    def search_orders(self, text: str, limit: int = 200, include_archive: bool = False) -> pd.DataFrame:
+        """Orders matching a free-text query (client, phone, issue, repair, printers...), best first."""
+        return self.store.rows(self.store.search(text, limit=limit, include_archive=include_archive), include_archive)
+
+    def find_clients(self, text: str, limit: int = 8) -> list:
+        """Returning clients matching a phone / name prefix, most frequent first."""
+        self.store.snapshot()
+        return self.store.clients.search(text, limit=limit)
+
+    def device_history(self, serial: str, exclude: Optional[str] = None) -> pd.DataFrame:
+        """Past orders (hot + archive) for a printer serial number."""
+        return self.store.device_history(serial, exclude=exclude)
+
+    def client_count(self) -> int:
+        """Distinct clients (normalized phones) among the hot orders."""
+        self.store.snapshot()
+        return len(self.store.clients)
+
+    def update_order(self, order_id: str, expected_revision: Optional[int] = None, **kwargs) -> bool:
+        """
+        Update ONLY the matching row, patching just the fields that changed.
+        Pass the revision the user started editing from as expected_revision;
+        if the order changed meanwhile, OrderConflictError is raised and nothing is written.
+        """
+        if "labor_cost" in kwargs or "parts_cost" in kwargs:
+            if "labor_cost" in kwargs and "parts_cost" in kwargs:
+                current = {}
+            else:
+                current = self.store.get(order_id)
+                if current is None:
+                    notify("error", f"❌ Order {order_id} not found in {self.backend.label}.")
+                    return False
+            labor = safe_float(kwargs.get("labor_cost", current.get("labor_cost")))
+            parts = safe_float(kwargs.get("parts_cost", current.get("parts_cost")))
+            kwargs["total_cost"] = labor + parts
+        return self.store.patch(order_id, kwargs, expected_revision=expected_revision)
+
+
+# ============================================================================
+# TAB DATA
+# ============================================================================
+# Ce citeste fiecare tab din CRM si daca vrea un sync inainte. New Order nu afiseaza liste partajate:
+# clientii / istoricul vin din indexurile store-ului, deci un rerun acolo nu face niciun apel de retea.
+TAB_DATA_PLANS = {
+    0: {"sync": False, "reads": ("get_order", "find_clients", "device_history")},
+    1: {"sync": True, "reads": ("status_counts", "technicians", "brands", "orders_page", "get_order", "receipt_orders")},
+    2: {"sync": True, "reads": ("count", "search_orders", "query", "get_order", "device_history")},
+    3: {"sync": True, "reads": ("technicians", "query", "count", "report_totals", "report_rollup", "client_count")},
+}
+
+
+class TabData:
+    """
+    Request-scoped reads for the active tab: only the CRM reads its plan declares, each run at most once
+    per rerun. Memo keys carry the store version, so a write earlier in the same run is never hidden.
+    Fragments get the TabData of the run that drew them and read through it too.
+    """
+
+    def __init__(self, crm: PrinterServiceCRM, tab: int):
+        self.crm = crm
+        self.plan = TAB_DATA_PLANS[tab]
+        self._memo = {}
+
+    def sync(self) -> bool:
+        """Incremental store sync (when sync_interval passed), only for tabs whose plan asks for it."""
+        return self.plan["sync"] and self.crm.store.maybe_sync()
+
+    def __getattr__(self, name: str):
+        if name not in self.plan["reads"]:
+            raise AttributeError(f"{name!r} is not in this tab's data plan")
+        read = getattr(self.crm, name)
+
+        def memoized(*args, **kwargs):
+            # un DataFrame nu are o cheie stabila (repr-ul e trunchiat): citirea ruleaza de fiecare data
+            if any(isinstance(arg, pd.DataFrame) for arg in args):
+                return read(*args, **kwargs)
+            key = (name, self.crm.store.version, repr(args), repr(sorted(kwargs.items())))
+            if key not in self._memo:
+                self._memo[key] = read(*args, **kwargs)
+            return self._memo[key]
+
+        return memoized
+
+
+# ============================================================================
+# UPDATE TAB HELPERS
+# ============================================================================
+def reset_update_form(order_id: str):
+    """Forget every Update-tab widget / edit state kept for this order."""
+    for key in list(st.session_state.keys()):
+        if key.startswith(("upd_", "update_")) and (key.endswith(f"_{order_id}") or f"_{order_id}_" in key):
+            del st.session_state[key]
+
+
+def save_order_update(crm: PrinterServiceCRM, order_id: str, updates: dict,
+                      expected_revision: Optional[int] = None) -> bool:
+    """
+    Save from the Update tab as compare-and-swap on the revision the form was opened at.
+    On conflict the attempt is kept in session state for render_order_conflict().
+    """
+    if expected_revision is None:
+        expected_revision = st.session_state.get(f"upd_rev_{order_id}")
+    try:
+        ok = crm.update_order(order_id, expected_revision=expected_revision, **updates)
+    except OrderConflictError as e:
+        st.session_state[f"upd_conflict_{order_id}"] = {"theirs": e.current or {}, "mine": updates}
+        return False
+    if ok:
+        # urmatoarea editare porneste de la revizia tocmai scrisa
+        st.session_state.pop(f"upd_rev_{order_id}", None)
+        st.session_state.pop(f"upd_base_{order_id}", None)
+        st.session_state.pop(f"upd_conflict_{order_id}", None)
+    return ok
+
+
+def _same_value(a, b) -> bool:
+    if safe_text(a).strip() == safe_text(b).strip():
+        return True
+    fa, fb = safe_float(a, None), safe_float(b, None)
+    return fa is not None and fb is not None and fa == fb
+
+
+def render_order_conflict(crm: PrinterServiceCRM, order_id: str):
+    """Retry / merge prompt shown when a save lost the compare-and-swap."""
+    conflict = st.session_state[f"upd_conflict_{order_id}"]
+    theirs, mine = conflict["theirs"], conflict["mine"]
+    base = st.session_state.get(f"upd_base_{order_id}") or {}
+
+    st.warning(
+        f"⚠️ **{order_id}** was changed by someone else while you were editing "
+        f"(now at revision {order_revision(theirs)}). Your changes were NOT saved."
+    )
+
+    rows = [
+        {
+            "Field": field,
+            "When you opened it": safe_text(base.get(field)),
+            "Saved by someone else": safe_text(theirs.get(field)),
+            "Yours": safe_text(value),
+        }
+        for field, value in mine.items()
+        if not _same_value(value, theirs.get(field))
+    ]
+    if rows:
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+    # campurile modificate efectiv de utilizator fata de varianta de la deschidere
+    touched = {k: v for k, v in mine.items() if not _same_value(v, base.get(k))}
+    both_changed = [k for k in touched if not _same_value(theirs.get(k), base.get(k))]
+    if both_changed:
+        st.caption("Changed by both of you: " + ", ".join(both_changed) + " (merge keeps yours).")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("🔀 Merge (keep their other changes)", key=f"upd_conflict_merge_{order_id}"):
+            if save_order_update(crm, order_id, touched, expected_revision=order_revision(theirs)):
+                reset_update_form(order_id)
+                st.success("✅ Your changes were merged.")
+                st.rerun()
+    with col2:
+        if st.button("💾 Overwrite with mine", key=f"upd_conflict_overwrite_{order_id}"):
+            if save_order_update(crm, order_id, mine, expected_revision=order_revision(theirs)):
+                reset_update_form(order_id)
+                st.success("✅ Order updated with your version.")
+                st.rerun()
+    with col3:
+        if st.button("🔄 Discard mine & reload", key=f"upd_conflict_discard_{order_id}"):
+            reset_update_form(order_id)
+            st.rerun()
+
 
-        df = self._read_df(raw=True, ttl=0)
-        updated_df = pd.concat([df, new_order], ignore_index=True) if df is not None and not df.empty else new_order
+@st.fragment
+def render_printer_editor(crm: PrinterServiceCRM, data: TabData, order_id: str):
+    """
+    Printer list of the order being edited (+ device history). Adding a row reruns only this fragment;
+    "Remove selected" saves right away and reruns the app so the header and receipts show the write.
+    """
+    state_key = f"upd_printers_{order_id}"
+    current_printers = st.session_state[state_key]
+
+    remove_flags = []
+    for i, p in enumerate(current_printers):
+        st.markdown(f"**Printer #{i+1}**")
+        colA, colB, colC, colD = st.columns([1.2, 1.2, 1.2, 0.6])
+        with colA:
+            p["brand"] = st.text_input(f"Brand #{i+1}", value=p["brand"], key=f"upd_brand_{order_id}_{i}")
+        with colB:
+            p["model"] = st.text_input(f"Model #{i+1}", value=p["model"], key=f"upd_model_{order_id}_{i}")
+        with colC:
+            p["serial"] = st.text_input(f"Serial #{i+1}", value=p["serial"], key=f"upd_serial_{order_id}_{i}")
+        with colD:
+            remove_flags.append(
+                st.checkbox("Remove", key=f"upd_remove_printer_{order_id}_{i}")
+            )
+
+    colp_r1, colp_r2 = st.columns(2)
+    with colp_r1:
+        if st.button("🗑 Remove selected", key=f"upd_remove_selected_{order_id}"):
+            # 1) Ștergere locală
+            st.session_state[state_key] = [
+                p for p, flag in zip(current_printers, remove_flags) if not flag
+            ]
+            if not st.session_state[state_key]:
+                st.session_state[state_key] = [{"brand": "", "model": "", "serial": ""}]
+            forget_row_widgets(
+                tuple(f"upd_{field}_{order_id}" for field in ("brand", "model", "serial", "remove_printer")),
+                len(current_printers),
+            )
+
+            # 2) JSON + câmpurile legacy, scrise imediat
+            printer_updates = printer_fields(st.session_state[state_key])
+            if save_order_update(crm, order_id, printer_updates):
+                # 3) Reafișăm pagina (store-ul are deja randul nou, fara citire din storage)
+                st.success("🗑 Imprimantele selectate au fost șterse!")
+                st.rerun()
+            elif st.session_state.get(f"upd_conflict_{order_id}"):
+                # panoul de conflict e in afara fragmentului
+                st.rerun()
+
+    with colp_r2:
+        if st.button("➕ Add printer", key=f"upd_add_printer_btn_{order_id}"):
+            printers_list = st.session_state.get(state_key, [])
+            printers_list.append({"brand": "", "model": "", "serial": ""})
+            st.session_state[state_key] = printers_list
+            rerun_fragment()
+
+    render_device_history(data, [p["serial"] for p in current_printers], exclude=order_id)
+
+
+@st.fragment
+def render_cost_inputs(order: dict):
+    """Labor / parts inputs with the live total; the Update button reads them back from session_state."""
+    order_id = order["order_id"]
+    colc1, colc2, colc3 = st.columns(3)
+    labor_cost = colc1.number_input(
+        "Labor cost (RON)",
+        value=safe_float(order.get("labor_cost")),
+        min_value=0.0,
+        step=10.0,
+        key=f"update_labor_cost_{order_id}",
+    )
+    parts_cost = colc2.number_input(
+        "Parts cost (RON)",
+        value=safe_float(order.get("parts_cost")),
+        min_value=0.0,
+        step=10.0,
+        key=f"update_parts_cost_{order_id}",
+    )
+    colc3.metric("💰 Total", f"{labor_cost + parts_cost:.2f} RON")
 
-        if self._write_df(updated_df):
-            self.next_order_id += 1
-            return order_id
+
+# ============================================================================
+# FILTER HELPERS
+# ============================================================================
+def date_range_filter(value) -> Optional[tuple]:
+    """st.date_input range value -> received_between for crm.query() (None when not set)."""
+    if not value:
         return None
+    if isinstance(value, date):
+        return (value, value)
+    start = value[0]
+    end = value[1] if len(value) > 1 else value[0]
+    return (start, end)
 
-    def list_orders_df(self) -> pd.DataFrame:
-        df = self._read_df(raw=False, ttl=60)
-        return df if df is not None else pd.DataFrame()
 
-    def update_order(self, order_id: str, **kwargs) -> bool:
-        """Update ONLY the matching row, write back entire DataFrame."""
-        df = self._read_df(raw=True, ttl=0)
-        if df is None or df.empty or "order_id" not in df.columns:
-            st.sidebar.error("❌ Cannot update: no data found in Google Sheets.")
-            return False
+# ============================================================================
+# NEW ORDER HELPERS
+# ============================================================================
+def fill_client_fields(client: dict):
+    """on_click callback: copy a directory client into the New Order form widgets."""
+    st.session_state["new_client_name"] = client["client_name"]
+    st.session_state["new_client_phone"] = client["client_phone"]
+    st.session_state["new_client_email"] = client["client_email"]
+
+
+def render_client_lookup(data: TabData):
+    """Autocomplete for returning clients, shown above the New Order form (forms don't rerun while typing)."""
+    query = st.text_input(
+        "🔎 Returning client",
+        key="new_client_lookup",
+        placeholder="Start typing a phone number or name",
+    )
+    matches = data.find_clients(query)
+    if query.strip() and not matches:
+        st.caption("No matching client — fill in the form below.")
+    for i, client in enumerate(matches):
+        col_info, col_btn = st.columns([4, 1])
+        col_info.write(
+            f"**{client['client_name']}** · {client['client_phone']}"
+            + (f" · {client['client_email']}" if client["client_email"] else "")
+            + f" · {client['orders']} order(s), last {client['last_received'] or '-'}"
+        )
+        col_btn.button("↩ Use", key=f"new_client_use_{i}", on_click=fill_client_fields, args=(client,))
+
+
+@st.fragment
+def render_new_order_form(crm: PrinterServiceCRM, data: TabData):
+    """
+    New Order form + device history as a fragment: adding / removing printer rows reruns only this part
+    of the page (no sync, no other tabs' widgets); creating the order reruns the whole app.
+    """
+    with st.form(key="new_order_form", clear_on_submit=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Client Information")
+            client_name = st.text_input("Name *", key="new_client_name")
+            client_phone = st.text_input("Phone *", key="new_client_phone")
+            client_email = st.text_input("Email", key="new_client_email")
+        with col2:
+            st.subheader("Order Dates")
+            date_received = st.date_input("Date Received *", value=date.today(), key="new_date_received")
+            # dacă vrei, poți pune aici value=date.today() în loc de None
+            date_pickup = st.date_input("Scheduled Pickup (optional)", value=None, key="new_date_pickup")
+
+        st.subheader("Printers in This Order")
+
+        printers_list = st.session_state["temp_printers"]
+        remove_flags = []
+
+        # Draw each printer row
+        for i, p in enumerate(printers_list):
+            st.markdown(f"**Printer #{i+1}**")
+            colA, colB, colC, colD = st.columns([1.2, 1.2, 1.2, 0.6])
+            with colA:
+                p["brand"] = st.text_input(f"Brand #{i+1} *", value=p["brand"], key=f"new_printer_brand_{i}")
+            with colB:
+                p["model"] = st.text_input(f"Model #{i+1} *", value=p["model"], key=f"new_printer_model_{i}")
+            with colC:
+                p["serial"] = st.text_input(f"Serial #{i+1}", value=p["serial"], key=f"new_printer_serial_{i}")
+            with colD:
+                remove_flags.append(
+                    st.checkbox("Remove", key=f"new_printer_remove_{i}")
+                )
+
+        issue_description = st.text_area("Issue Description *", height=100, key="new_issue_description")
+        accessories = st.text_input("Accessories (cables, cartridges, etc.)", key="new_accessories")
+        notes = st.text_area("Additional Notes", height=60, key="new_notes")
+
+        col_btn1, col_btn2, col_btn3 = st.columns(3)
+        with col_btn1:
+            remove_clicked = st.form_submit_button("🗑 Remove selected printers")
+        with col_btn2:
+            add_clicked = st.form_submit_button("➕ Add another printer")
+        with col_btn3:
+            submit = st.form_submit_button("🎫 Create Order", type="primary", use_container_width=True)
+
+        if remove_clicked:
+            st.session_state["temp_printers"] = [
+                p for p, flag in zip(printers_list, remove_flags) if not flag
+            ]
+            if not st.session_state["temp_printers"]:
+                st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
+            forget_row_widgets(
+                ("new_printer_brand", "new_printer_model", "new_printer_serial", "new_printer_remove"),
+                len(printers_list),
+            )
+            rerun_fragment()
+
+        if add_clicked:
+            st.session_state["temp_printers"].append({"brand": "", "model": "", "serial": ""})
+            rerun_fragment()
+
+        if submit:
+            # Clean printers list
+            printers_clean = []
+            for p in st.session_state["temp_printers"]:
+                brand = safe_text(p.get("brand", "")).strip()
+                model = safe_text(p.get("model", "")).strip()
+                serial = safe_text(p.get("serial", "")).strip()
+                if brand or model or serial:
+                    printers_clean.append({
+                        "brand": brand,
+                        "model": model,
+                        "serial": serial,
+                    })
+
+            if not client_name or not client_phone or not issue_description:
+                st.error("❌ Please fill in all required fields (*) for client and issue.")
+            elif not printers_clean:
+                st.error("❌ Please add at least one printer (brand and model).")
+            else:
+                order_id = crm.create_service_order(
+                    client_name, client_phone, client_email,
+                    printers_clean,
+                    issue_description, accessories, notes, date_received, date_pickup
+                )
+                if order_id:
+                    st.session_state["last_created_order"] = order_id
+                    st.session_state["pdf_downloaded"] = False
+                    # Reset temp printers
+                    st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
+                    st.success(f"✅ Order Created: **{order_id}**")
+                    st.balloons()
+                    # rerun complet: formularul e inlocuit de panoul cu bonul
+                    st.rerun()
+
+    # Istoric service pentru serialele din formular (+ cautare rapida, in afara formularului)
+    serial_lookup = st.text_input(
+        "🔎 Device history by serial",
+        key="new_serial_lookup",
+        placeholder="Type a serial number to see earlier repairs",
+    )
+    render_device_history(data, [serial_lookup] + [p["serial"] for p in st.session_state["temp_printers"]])
 
-        mask = df["order_id"] == order_id
-        if not mask.any():
-            st.sidebar.error(f"❌ Order {order_id} not found in sheet.")
-            return False
 
-        for key, value in kwargs.items():
-            if key in df.columns:
-                df.loc[mask, key] = value
+# ============================================================================
+# DEVICE HISTORY
+# ============================================================================
+DEVICE_HISTORY_COLUMNS = [
+    "order_id", "date_received", "status", "technician", "issue_description",
+    "repair_details", "parts_used", "total_cost",
+]
+
+
+def render_device_history(data: TabData, serials, exclude: Optional[str] = None):
+    """Service history for the serials typed in a printer editor (one expander per known device)."""
+    seen = set()
+    for serial in serials:
+        key = normalize_serial(serial)
+        if len(key) < 3 or key in seen:
+            continue
+        seen.add(key)
+        history = data.device_history(serial, exclude=exclude)
+        if history.empty:
+            continue
+        spent = history["total_cost"].sum()
+        with st.expander(f"🔁 SN {safe_text(serial).strip()}: {len(history)} previous order(s), {spent:.2f} RON total"):
+            st.dataframe(
+                history[DEVICE_HISTORY_COLUMNS],
+                use_container_width=True,
+                hide_index=True,
+                column_config={"date_received": st.column_config.DateColumn(format="YYYY-MM-DD")},
+            )
+
+
+# ============================================================================
+# RECEIPT HELPERS
+# ============================================================================
+def render_overflow_note(kind: str, order: dict):
+    """Warn when some order text does not fit on the receipt and continues on an extra page."""
+    overflow = receipt_overflow(kind, order)
+    if overflow:
+        st.caption(f"⚠️ {', '.join(overflow).title()}: text too long for the receipt, continued on page 2.")
+
+
+@st.fragment
+def render_receipt_downloads(data: TabData, order_id: str):
+    """Initial / completion downloads for the Update tab; a download click reruns only this panel."""
+    order = data.get_order(order_id)
+    if order is None:
+        return
+    logo = get_logo_asset()
+
+    colp1, colp2 = st.columns(2)
+    with colp1:
+        st.markdown("**Initial Receipt**")
+        pdf_init = render_receipt_pdf("initial", order, st.session_state["company_info"], logo)
+        render_overflow_note("initial", order)
+        st.download_button(
+            "📄 Download Initial",
+            pdf_init,
+            f"Initial_{order_id}.pdf",
+            "application/pdf",
+            use_container_width=True,
+            key=f"dl_upd_init_{order_id}",
+        )
+    with colp2:
+        st.markdown("**Completion Receipt**")
+        pdf_comp = render_receipt_pdf("completion", order, st.session_state["company_info"], logo)
+        render_overflow_note("completion", order)
+        st.download_button(
+            "📄 Download Completion",
+            pdf_comp,
+            f"Completion_{order_id}.pdf",
+            "application/pdf",
+            use_container_width=True,
+            key=f"dl_upd_comp_{order_id}",
+        )
+
+
+BATCH_FORMATS = {
+    "Merged PDF": (export_receipts_pdf, "pdf", "application/pdf"),
+    "ZIP of PDFs": (export_receipts_zip, "zip", "application/zip"),
+}
+
+
+def render_batch_receipts(data: TabData, query: dict, total: int):
+    """Receipts for every order matching the All Orders filters, as one merged PDF or a ZIP."""
+    with st.expander(f"🧾 Batch receipts ({total} filtered order(s))"):
+        col1, col2 = st.columns(2)
+        kind = col1.selectbox("Receipt", ["completion", "initial"], format_func=str.title, key="batch_kind")
+        fmt = col2.radio("Format", list(BATCH_FORMATS), horizontal=True, key="batch_format")
+        export, ext, mime = BATCH_FORMATS[fmt]
+
+        if st.button("🧾 Generate receipts", key="batch_generate", use_container_width=True):
+            frame, _ = data.orders_page(page=1, page_size=total, **query)
+            bar = st.progress(0.0, text="Rendering receipts...")
+
+            def progress(done: int, n: int):
+                bar.progress(done / max(n, 1), text=f"Rendering receipts... {done}/{n}")
+
+            try:
+                path = export(kind, data.receipt_orders(frame), st.session_state["company_info"], progress=progress)
+            except Exception as e:
+                st.error(f"❌ Batch export failed: {e}")
+                path = None
+            bar.empty()
+            previous = st.session_state.pop("batch_receipts", None)
+            if previous:
+                Path(previous["path"]).unlink(missing_ok=True)
+            if path:
+                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+                st.session_state["batch_receipts"] = {
+                    "path": str(path), "name": f"{kind.title()}_receipts_{ts}.{ext}", "mime": mime,
+                    "count": len(frame),
+                }
+
+        batch = st.session_state.get("batch_receipts")
+        if batch and Path(batch["path"]).exists():
+            with open(batch["path"], "rb") as f:
+                st.download_button(
+                    f"📥 Download {batch['name']} ({batch['count']} receipt(s))",
+                    f,
+                    batch["name"],
+                    batch["mime"],
+                    key="dl_batch_receipts",
+                    use_container_width=True,
+                )
+
+
+# ============================================================================
+# STARTUP
+# ============================================================================
+def source_release() -> str:
+    """Short digest of this file: tells the startup reports of different releases apart."""
+    try:
+        return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:12]
+    except Exception:
+        return "unknown"
+
+
+@st.cache_resource
+def startup_report() -> dict:
+    """
+    Cold-start timings of this process, in seconds: imports_s (module imports of the first script run),
+    first_run_s (first page, usually the login), first_app_s (first full page after login), warm_up_s.
+    """
+    report = {"release": source_release(), "imports_s": round(IMPORT_SECONDS, 3)}
+    print(f"[startup {report['release']}] imports_s={IMPORT_SECONDS:.3f}", file=sys.stderr)
+    return report
+
 
-        if "labor_cost" in df.columns and "parts_cost" in df.columns:
-            labor = pd.to_numeric(df.loc[mask, "labor_cost"], errors="coerce").fillna(0)
-            parts = pd.to_numeric(df.loc[mask, "parts_cost"], errors="coerce").fillna(0)
-            df.loc[mask, "total_cost"] = labor + parts
+def record_startup(phase: str, seconds: float):
+    """Keep the first measurement of each phase and log it once (container logs track it across releases)."""
+    report = startup_report()
+    value = round(seconds, 3)
+    if report.setdefault(phase, value) is value:
+        print(f"[startup {report['release']}] {phase}={value:.3f}", file=sys.stderr)
 
-        return self._write_df(df)
+
+def warm_up_receipts():
+    """Import reportlab / PIL and build the receipt assets (logo, compiled templates, font metrics) off the request path."""
+    started = time.perf_counter()
+    try:
+        logo = get_logo_asset()
+        for kind in RECEIPT_TEMPLATES:
+            get_receipt_plan(kind).render({}, COMPANY_INFO_DEFAULTS, logo)
+    except Exception as e:
+        print(f"Receipt warm-up failed: {e}", file=sys.stderr)
+        return
+    record_startup("warm_up_s", time.perf_counter() - started)
+
+
+@st.cache_resource
+def start_warm_up() -> threading.Thread:
+    """warm_up_receipts() once per process, in a daemon thread that carries the caller's script context."""
+    thread = threading.Thread(target=warm_up_receipts, name="receipt-warm-up", daemon=True)
+    add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+    return thread
 
 
 # ============================================================================
 # MAIN APP
 # ============================================================================
 def main():
+    init_page()
     if not check_password():
+        record_startup("first_run_s", time.perf_counter() - _SCRIPT_STARTED)
         st.stop()
 
+    # primul bon de dupa login nu mai plateste importul reportlab / compilarea template-urilor
+    if str(storage_config().get("warm_up", True)).lower() not in ("false", "0", "no"):
+        start_warm_up()
+
     st.title("🖨️ Printer Service CRM")
     st.markdown("### Professional Printer Service Management System")
 
     if "company_info" not in st.session_state:
-        try:
-            st.session_state["company_info"] = dict(st.secrets.get("company_info", {}))
-        except Exception:
-            st.session_state["company_info"] = {
-                "company_name": "Company Name",
-                "company_address": "Address",
-                "cui": "CUI",
-                "reg_com": "Reg.Com",
-                "phone": "Phone",
-                "email": "Email",
-            }
+        st.session_state["company_info"] = load_company_info()
 
     # Sidebar
     with st.sidebar:
@@ -926,8 +4541,9 @@ def main():
         st.divider()
 
         with st.expander("🖼️ Company Logo", expanded=False):
-            if st.session_state.get("logo_image"):
-                st.image(st.session_state["logo_image"], width=150)
+            logo = get_logo_asset()
+            if logo:
+                st.image(logo.png, width=150)
                 st.success("✅ Logo loaded from repository")
             else:
                 st.warning("⚠️ Logo not found")
@@ -942,23 +4558,62 @@ def main():
             ci["phone"] = st.text_input("Phone", value=ci["phone"], key="company_phone_input")
             ci["email"] = st.text_input("Email", value=ci["email"], key="company_email_input")
 
-        conn = get_sheets_connection()
-        with st.expander("📊 Google Sheets", expanded=False):
-            if conn:
-                st.success("✅ Connected to Google Sheets!")
+        store = get_order_store()
+        with st.expander("💾 Storage", expanded=False):
+            if store:
+                st.success(f"✅ Connected to {store.backend.label}!")
+                st.caption(f"Orders snapshot v{store.version} · synced up to {store.watermark or '—'}")
+                mem = store.memory_report
+                if mem["raw_bytes"]:
+                    saved = 100 * (1 - mem["typed_bytes"] / mem["raw_bytes"])
+                    st.caption(
+                        f"Typed snapshot: {mem['typed_bytes'] / 1024:.0f} KB "
+                        f"(raw {mem['raw_bytes'] / 1024:.0f} KB, {saved:.0f}% saved)"
+                    )
+                receipts = get_receipt_cache().stats()
+                if receipts["hits"] + receipts["misses"]:
+                    st.caption(
+                        f"Receipt cache: {receipts['hit_rate']:.0%} hit rate "
+                        f"({receipts['hits']}/{receipts['hits'] + receipts['misses']}), "
+                        f"{receipts['entries']} PDF(s), {receipts['bytes'] / 1024:.0f} KB"
+                    )
+                if st.button("⚡ Sync changes", key="sync_store_btn"):
+                    store.sync()
+                if st.button("🔄 Full reload", key="reload_store_btn"):
+                    store.reload()
+                if st.button(
+                    f"🗄 Archive Completed orders older than {store.archive_after_days} days",
+                    key="archive_orders_btn",
+                ):
+                    moved = store.archive_completed(store.archive_after_days)
+                    st.success(f"🗄 Archived {moved} order(s).")
+                if st.button("🧮 Rebuild report rollups", key="rebuild_rollups_btn"):
+                    store.rebuild_rollups()
+                if st.button("🖨 Migrate legacy printer columns", key="migrate_printers_btn"):
+                    migrated = store.migrate_legacy_printers()
+                    st.success(f"🖨 Migrated {migrated} order(s) to printers_json.")
+                if st.button("🛠 Repair storage (full rewrite)", key="repair_sheet_btn"):
+                    if store.backend.repair():
+                        store.reload()
             else:
-                st.error("❌ Not connected to Google Sheets")
+                st.error("❌ Not connected to storage")
 
-    conn = get_sheets_connection()
-    if not conn:
-        st.error("Cannot connect to Google Sheets. Check secrets configuration.")
+        with st.expander("⏱ Startup", expanded=False):
+            report = startup_report()
+            st.caption(
+                f"Release {report['release']} · "
+                + " · ".join(f"{phase} {value:.2f}s" for phase, value in report.items() if phase != "release")
+            )
+
+    store = get_order_store()
+    if not store:
+        st.error("Cannot connect to storage. Check secrets configuration.")
         st.stop()
 
     if "crm" not in st.session_state:
-        st.session_state["crm"] = PrinterServiceCRM(conn)
+        st.session_state["crm"] = PrinterServiceCRM(store)
 
     crm = st.session_state["crm"]
-    df_all_orders = crm.list_orders_df()
 
     # Tab navigation
     tab_titles = ["📥 New Order", "📋 All Orders", "✏️ Update Order", "📊 Reports"]
@@ -979,6 +4634,9 @@ def main():
 
     st.divider()
     active_tab = st.session_state["active_tab"]
+    # doar ce citeste tab-ul activ, o singura data per rerun
+    data = TabData(crm, active_tab)
+    data.sync()
 
     # TAB 0: NEW ORDER
     if active_tab == 0:
@@ -994,108 +4652,21 @@ def main():
             if "temp_printers" not in st.session_state or not st.session_state["temp_printers"]:
                 st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
 
-            with st.form(key="new_order_form", clear_on_submit=False):
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.subheader("Client Information")
-                    client_name = st.text_input("Name *", key="new_client_name")
-                    client_phone = st.text_input("Phone *", key="new_client_phone")
-                    client_email = st.text_input("Email", key="new_client_email")
-                with col2:
-                    st.subheader("Order Dates")
-                    date_received = st.date_input("Date Received *", value=date.today(), key="new_date_received")
-                    # dacă vrei, poți pune aici value=date.today() în loc de None
-                    date_pickup = st.date_input("Scheduled Pickup (optional)", value=None, key="new_date_pickup")
-
-                st.subheader("Printers in This Order")
-
-                printers_list = st.session_state["temp_printers"]
-                remove_flags = []
-
-                # Draw each printer row
-                for i, p in enumerate(printers_list):
-                    st.markdown(f"**Printer #{i+1}**")
-                    colA, colB, colC, colD = st.columns([1.2, 1.2, 1.2, 0.6])
-                    with colA:
-                        p["brand"] = st.text_input(f"Brand #{i+1} *", value=p["brand"], key=f"new_printer_brand_{i}")
-                    with colB:
-                        p["model"] = st.text_input(f"Model #{i+1} *", value=p["model"], key=f"new_printer_model_{i}")
-                    with colC:
-                        p["serial"] = st.text_input(f"Serial #{i+1}", value=p["serial"], key=f"new_printer_serial_{i}")
-                    with colD:
-                        remove_flags.append(
-                            st.checkbox("Remove", key=f"new_printer_remove_{i}")
-                        )
-
-                issue_description = st.text_area("Issue Description *", height=100, key="new_issue_description")
-                accessories = st.text_input("Accessories (cables, cartridges, etc.)", key="new_accessories")
-                notes = st.text_area("Additional Notes", height=60, key="new_notes")
-
-                col_btn1, col_btn2, col_btn3 = st.columns(3)
-                with col_btn1:
-                    remove_clicked = st.form_submit_button("🗑 Remove selected printers")
-                with col_btn2:
-                    add_clicked = st.form_submit_button("➕ Add another printer")
-                with col_btn3:
-                    submit = st.form_submit_button("🎫 Create Order", type="primary", use_container_width=True)
-
-                if remove_clicked:
-                    st.session_state["temp_printers"] = [
-                        p for p, flag in zip(printers_list, remove_flags) if not flag
-                    ]
-                    if not st.session_state["temp_printers"]:
-                        st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
-                    st.rerun()
-
-                if add_clicked:
-                    st.session_state["temp_printers"].append({"brand": "", "model": "", "serial": ""})
-                    st.rerun()
+            render_client_lookup(data)
 
-                if submit:
-                    # Clean printers list
-                    printers_clean = []
-                    for p in st.session_state["temp_printers"]:
-                        brand = safe_text(p.get("brand", "")).strip()
-                        model = safe_text(p.get("model", "")).strip()
-                        serial = safe_text(p.get("serial", "")).strip()
-                        if brand or model or serial:
-                            printers_clean.append({
-                                "brand": brand,
-                                "model": model,
-                                "serial": serial,
-                            })
-
-                    if not client_name or not client_phone or not issue_description:
-                        st.error("❌ Please fill in all required fields (*) for client and issue.")
-                    elif not printers_clean:
-                        st.error("❌ Please add at least one printer (brand and model).")
-                    else:
-                        order_id = crm.create_service_order(
-                            client_name, client_phone, client_email,
-                            printers_clean,
-                            issue_description, accessories, notes, date_received, date_pickup
-                        )
-                        if order_id:
-                            st.session_state["last_created_order"] = order_id
-                            st.session_state["pdf_downloaded"] = False
-                            # Reset temp printers
-                            st.session_state["temp_printers"] = [{"brand": "", "model": "", "serial": ""}]
-                            st.success(f"✅ Order Created: **{order_id}**")
-                            st.balloons()
-                            st.rerun()
+            render_new_order_form(crm, data)
 
         if st.session_state["last_created_order"] and not st.session_state["pdf_downloaded"]:
-            df_fresh = crm.list_orders_df()
-            order_row = df_fresh[df_fresh["order_id"] == st.session_state["last_created_order"]]
-            if not order_row.empty:
-                order = order_row.iloc[0].to_dict()
+            order = data.get_order(st.session_state["last_created_order"])
+            if order is not None:
                 st.divider()
                 st.success(f"✅ Order Created: **{order['order_id']}**")
                 st.subheader("📄 Download Receipt")
 
-                # Get logo from session state
-                logo = st.session_state.get("logo_image", None)
-                pdf_buffer = generate_initial_receipt_pdf(order, st.session_state["company_info"], logo)
+                # Logo decodat o singura data per proces
+                logo = get_logo_asset()
+                pdf_buffer = render_receipt_pdf("initial", order, st.session_state["company_info"], logo)
+                render_overflow_note("initial", order)
 
                 if st.download_button(
                     "📄 Download Initial Receipt",
@@ -1113,43 +4684,115 @@ def main():
     # TAB 1: ALL ORDERS
     elif active_tab == 1:
         st.header("All Service Orders")
-        df = df_all_orders
-        if not df.empty:
+        include_archive = st.checkbox("Include archived orders", key="orders_include_archive")
+        search_query = st.text_input(
+            "🔍 Search orders",
+            key="orders_search",
+            placeholder="Client, phone, issue, parts, printer, serial... (all words must match)",
+        )
+        counts = data.status_counts(include_archive=include_archive)
+        if counts:
             col1, col2, col3, col4 = st.columns(4)
-            col1.metric("📊 Total Orders", len(df))
-            col2.metric("📥 Received", len(df[df["status"] == "Received"]))
-            col3.metric("✅ Ready", len(df[df["status"] == "Ready for Pickup"]))
-            col4.metric("🎉 Completed", len(df[df["status"] == "Completed"]))
-
-            st.markdown("**Click on a row to edit that order:**")
-
-            event = st.dataframe(
-                df[["order_id", "client_name", "printer_brand", "date_received", "status", "total_cost"]],
-                use_container_width=True,
-                selection_mode="single-row",
-                on_select="rerun",
-                key="orders_table"
+            col1.metric("📊 Total Orders", sum(counts.values()))
+            col2.metric("📥 Received", counts.get("Received", 0))
+            col3.metric("✅ Ready", counts.get("Ready for Pickup", 0))
+            col4.metric("🎉 Completed", counts.get("Completed", 0))
+
+            # filtrare / sortare / paginare pe server: in browser ajunge doar pagina curenta
+            sort_options = {
+                "Date received": "date_received",
+                "Order ID": "order_id",
+                "Client": "client_name",
+                "Status": "status",
+                "Total cost": "total_cost",
+            }
+            if search_query.strip():
+                sort_options = {"Relevance": "relevance", **sort_options}
+            colf1, colf2, colf3, colf4 = st.columns(4)
+            status_filter = colf1.selectbox("Status", ["All", "Open"] + ORDER_STATUSES, key="orders_status_filter")
+            technician_filter = colf2.selectbox("Technician", ["All"] + data.technicians(), key="orders_technician_filter")
+            brand_filter = colf3.selectbox("Brand", ["All"] + data.brands(), key="orders_brand_filter")
+            received_range = colf4.date_input("Received between", value=(), key="orders_received_range")
+
+            cols1, cols2, cols3 = st.columns(3)
+            sort_label = cols1.selectbox("Sort by", list(sort_options), key="orders_sort_by")
+            descending = cols2.selectbox("Order", ["Descending", "Ascending"], key="orders_sort_dir") == "Descending"
+            page_size = cols3.selectbox("Rows per page", [25, 50, 100, 200], index=1, key="orders_page_size")
+
+            query = dict(
+                sort_by=sort_options[sort_label],
+                ascending=not descending,
+                search=search_query,
+                include_archive=include_archive,
+                status={"All": None, "Open": OPEN_STATUSES}.get(status_filter, status_filter),
+                technician=None if technician_filter == "All" else technician_filter,
+                brand=None if brand_filter == "All" else brand_filter,
+                received_between=date_range_filter(received_range),
             )
+            _, total = data.orders_page(page=1, page_size=0, **query)
+            pages = max(1, math.ceil(total / page_size))
+            # pagina se reseteaza cand se schimba filtrele
+            filter_key = (repr(sorted(query.items())), page_size)
+            if st.session_state.get("orders_filter_key") != filter_key:
+                st.session_state["orders_filter_key"] = filter_key
+                st.session_state["orders_page"] = 1
+                st.session_state.pop("orders_csv", None)
+            st.session_state["orders_page"] = min(st.session_state.get("orders_page", 1), pages)
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key="orders_page")
+
+            page_df, total = data.orders_page(page=page, page_size=page_size, **query)
+            first = (page - 1) * page_size + 1 if total else 0
+            st.caption(f"Showing {first}–{first + len(page_df) - 1 if total else 0} of {total} order(s)")
+
+            if not page_df.empty:
+                st.markdown("**Click on a row to edit that order:**")
+
+                event = st.dataframe(
+                    page_df[["order_id", "client_name", "printer_brand", "date_received", "status", "total_cost"]],
+                    column_config={"date_received": st.column_config.DateColumn(format="YYYY-MM-DD")},
+                    use_container_width=True,
+                    hide_index=True,
+                    selection_mode="single-row",
+                    on_select="rerun",
+                    key=f"orders_table_{page}",
+                )
 
-            if event and "selection" in event and event["selection"]["rows"]:
-                selected_idx = event["selection"]["rows"][0]
-                selected_order_id = df.iloc[selected_idx]["order_id"]
+                if event and "selection" in event and event["selection"]["rows"]:
+                    # pozitia selectata este relativa la pagina afisata
+                    selected_idx = event["selection"]["rows"][0]
+                    selected_order_id = page_df.iloc[selected_idx]["order_id"]
 
-                st.session_state["selected_order_for_update"] = selected_order_id
-                st.session_state["previous_selected_order"] = selected_order_id
-                st.session_state["active_tab"] = 2
-                st.rerun()
+                    if data.get_order(selected_order_id) is None:
+                        st.info(f"🗄 {selected_order_id} is archived and can no longer be edited.")
+                    else:
+                        st.session_state["selected_order_for_update"] = selected_order_id
+                        st.session_state["previous_selected_order"] = selected_order_id
+                        st.session_state["active_tab"] = 2
+                        st.rerun()
+            elif search_query.strip():
+                st.info("🔍 No orders match your search.")
+            else:
+                st.info("📝 No orders match these filters.")
+
+            # CSV-ul (toate comenzile filtrate, nu doar pagina) se genereaza doar la cerere
+            if total and st.button("📥 Prepare CSV export", key="orders_prepare_csv", use_container_width=True):
+                export_df, _ = data.orders_page(page=1, page_size=total, **query)
+                st.session_state["orders_csv"] = export_df.to_csv(index=False)
+            if st.session_state.get("orders_csv"):
+                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+                if st.download_button(
+                    "📥 Export to CSV",
+                    st.session_state["orders_csv"],
+                    f"orders_{ts}.csv",
+                    "text/csv",
+                    key="dl_csv",
+                    use_container_width=True,
+                ):
+                    st.session_state.pop("orders_csv", None)
 
-            csv = df.to_csv(index=False)
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            st.download_button(
-                "📥 Export to CSV",
-                csv,
-                f"orders_{ts}.csv",
-                "text/csv",
-                key="dl_csv",
-                use_container_width=True,
-            )
+            # bonuri pentru toate comenzile filtrate (ex. reprintare la final de luna pentru contabilitate)
+            if total:
+                render_batch_receipts(data, query, total)
         else:
             st.info("📝 No orders yet. Create your first order in the 'New Order' tab!")
 
@@ -1157,10 +4800,28 @@ def main():
     elif active_tab == 2:
         st.header("Update Service Order")
 
-        df = df_all_orders
-
-        if not df.empty:
-            available_orders = df["order_id"].tolist()
+        if data.count():
+            colq1, colq2 = st.columns([2, 1])
+            update_query = colq1.text_input(
+                "🔍 Find order",
+                key="update_order_search",
+                placeholder="Search by client, phone, printer, serial...",
+            )
+            update_status = colq2.selectbox("Status", ["All", "Open"] + ORDER_STATUSES, key="update_status_filter")
+            status_filter = {"All": None, "Open": OPEN_STATUSES}.get(update_status, update_status)
+            if update_query.strip():
+                available_orders = data.search_orders(update_query)["order_id"].tolist()
+                if status_filter is not None:
+                    wanted = set(data.query(status=status_filter)["order_id"])
+                    available_orders = [oid for oid in available_orders if oid in wanted]
+            else:
+                available_orders = data.query(status=status_filter)["order_id"].tolist()
+            # comanda deschisa din All Orders ramane selectabila chiar daca nu trece de filtre
+            opened = st.session_state["selected_order_for_update"]
+            if opened and opened not in available_orders and data.get_order(opened) is not None:
+                available_orders = [opened] + available_orders
+            if not available_orders:
+                st.info("🔍 No orders match your search.")
 
             default_idx = 0
             if st.session_state["selected_order_for_update"] in available_orders:
@@ -1179,275 +4840,390 @@ def main():
             )
 
             if selected_order_id:
-                df_fresh = crm._read_df(raw=True, ttl=0)
-                if df_fresh is None or df_fresh.empty:
-                    st.error("❌ Error reading current data from Google Sheets.")
+                order = data.get_order(selected_order_id)
+                if order is None:
+                    st.error("❌ Order not found in current data.")
                 else:
-                    order_row = df_fresh[df_fresh["order_id"] == selected_order_id]
+                    # revizia de la care pornesc modificarile (pentru compare-and-swap la salvare)
+                    rev_key = f"upd_rev_{selected_order_id}"
+                    if rev_key not in st.session_state:
+                        st.session_state[rev_key] = order_revision(order)
+                        st.session_state[f"upd_base_{selected_order_id}"] = order
+                    elif order_revision(order) != st.session_state[rev_key]:
+                        st.info("ℹ️ This order was updated by someone else since you opened it.")
+                        if st.button("🔄 Load latest version", key=f"upd_reload_{selected_order_id}"):
+                            reset_update_form(selected_order_id)
+                            st.rerun()
 
-                    if order_row.empty:
-                        st.error("❌ Order not found in current data.")
-                    else:
-                        order = order_row.iloc[0].to_dict()
-
-                        # load printers for this order
-                        printers_initial = load_printers_from_order(order)
-                        state_key = f"upd_printers_{selected_order_id}"
-                        if state_key not in st.session_state:
-                            st.session_state[state_key] = printers_initial if printers_initial else [{"brand": "", "model": "", "serial": ""}]
-                        current_printers = st.session_state[state_key]
-
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.write(f"**Client:** {safe_text(order.get('client_name'))}")
-                            st.write(f"**Phone:** {safe_text(order.get('client_phone'))}")
-                            st.write(f"**Printer (main):** {safe_text(order.get('printer_brand'))} {safe_text(order.get('printer_model'))}")
-                            st.write(f"**Serial (main):** {safe_text(order.get('printer_serial'))}")
-                        with col2:
-                            st.write(f"**Received:** {safe_text(order.get('date_received'))}")
-                            st.write(f"**Issue:** {safe_text(order.get('issue_description'))}")
-                            st.write(f"**Accessories:** {safe_text(order.get('accessories'))}")
-
-                        st.divider()
-
-                        st.subheader("Printers in This Order")
-
-                        remove_flags = []
-                        for i, p in enumerate(current_printers):
-                            st.markdown(f"**Printer #{i+1}**")
-                            colA, colB, colC, colD = st.columns([1.2, 1.2, 1.2, 0.6])
-                            with colA:
-                                p["brand"] = st.text_input(f"Brand #{i+1}", value=p["brand"], key=f"upd_brand_{selected_order_id}_{i}")
-                            with colB:
-                                p["model"] = st.text_input(f"Model #{i+1}", value=p["model"], key=f"upd_model_{selected_order_id}_{i}")
-                            with colC:
-                                p["serial"] = st.text_input(f"Serial #{i+1}", value=p["serial"], key=f"upd_serial_{selected_order_id}_{i}")
-                            with colD:
-                                remove_flags.append(
-                                    st.checkbox("Remove", key=f"upd_remove_printer_{selected_order_id}_{i}")
-                                )
-
-                        colp_r1, colp_r2 = st.columns(2)
-                        with colp_r1:
-                            if st.button("🗑 Remove selected", key=f"upd_remove_selected_{selected_order_id}"):
-                                # 1) Ștergere locală
-                                st.session_state[state_key] = [
-                                    p for p, flag in zip(current_printers, remove_flags) if not flag
-                                ]
-                                if not st.session_state[state_key]:
-                                    st.session_state[state_key] = [{"brand": "", "model": "", "serial": ""}]
-
-                                # 2) Regenerăm JSON-ul pentru spreadsheet
-                                printers_clean = []
-                                for p in st.session_state[state_key]:
-                                    brand = safe_text(p.get("brand", "")).strip()
-                                    model = safe_text(p.get("model", "")).strip()
-                                    serial = safe_text(p.get("serial", "")).strip()
-                                    if brand or model or serial:
-                                        printers_clean.append({
-                                            "brand": brand,
-                                            "model": model,
-                                            "serial": serial,
-                                        })
-
-                                printers_json = json.dumps(printers_clean, ensure_ascii=False)
-
-                                # 3) Actualizăm și câmpurile legacy
-                                fb, fm, fs = "", "", ""
-                                if printers_clean:
-                                    fb, fm, fs = printers_clean[0]["brand"], printers_clean[0]["model"], printers_clean[0]["serial"]
-
-                                # 4) Scriem în spreadsheet imediat
-                                crm.update_order(
-                                    selected_order_id,
-                                    printers_json=printers_json,
-                                    printer_brand=fb,
-                                    printer_model=fm,
-                                    printer_serial=fs
-                                )
-
-                                # 5) Reafișăm pagina
-                                st.success("🗑 Imprimantele selectate au fost șterse!")
-                                st.rerun()
-
-                        with colp_r2:
-                            if st.button("➕ Add printer", key=f"upd_add_printer_btn_{selected_order_id}"):
-                                printers_list = st.session_state.get(state_key, [])
-                                printers_list.append({"brand": "", "model": "", "serial": ""})
-                                st.session_state[state_key] = printers_list
-                                st.rerun()
-
-                        st.divider()
-
-                        status_options = ["Received", "In Progress", "Ready for Pickup", "Completed"]
-                        current_status = safe_text(order.get("status")) or "Received"
-                        if current_status not in status_options:
-                            current_status = "Received"
-                        status_index = status_options.index(current_status)
-
-                        new_status = st.selectbox(
-                            "Status",
-                            status_options,
-                            index=status_index,
-                            key=f"update_status_{selected_order_id}",
+                    # load printers for this order
+                    printers_initial = order_printers(order)
+                    state_key = f"upd_printers_{selected_order_id}"
+                    if state_key not in st.session_state:
+                        st.session_state[state_key] = printers_initial if printers_initial else [{"brand": "", "model": "", "serial": ""}]
+
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.write(f"**Client:** {safe_text(order.get('client_name'))}")
+                        st.write(f"**Phone:** {safe_text(order.get('client_phone'))}")
+                        st.write(f"**Printer (main):** {safe_text(order.get('printer_brand'))} {safe_text(order.get('printer_model'))}")
+                        st.write(f"**Serial (main):** {safe_text(order.get('printer_serial'))}")
+                    with col2:
+                        st.write(f"**Received:** {safe_text(order.get('date_received'))}")
+                        st.write(f"**Issue:** {safe_text(order.get('issue_description'))}")
+                        st.write(f"**Accessories:** {safe_text(order.get('accessories'))}")
+
+                    st.divider()
+
+                    st.subheader("Printers in This Order")
+                    render_printer_editor(crm, data, selected_order_id)
+
+                    st.divider()
+
+                    status_options = ["Received", "In Progress", "Ready for Pickup", "Completed"]
+                    current_status = safe_text(order.get("status")) or "Received"
+                    if current_status not in status_options:
+                        current_status = "Received"
+                    status_index = status_options.index(current_status)
+
+                    new_status = st.selectbox(
+                        "Status",
+                        status_options,
+                        index=status_index,
+                        key=f"update_status_{selected_order_id}",
+                    )
+
+                    if new_status == "Completed":
+                        actual_pickup_date = st.date_input(
+                            "Actual Pickup Date",
+                            value=date.today(),
+                            key=f"update_pickup_date_{selected_order_id}",
                         )
-
+                    else:
+                        actual_pickup_date = None
+
+                    st.subheader("Repair details")
+
+                    repair_details = st.text_area(
+                        "Repairs performed",
+                        value=safe_text(order.get("repair_details")),
+                        height=100,
+                        key=f"update_repair_details_{selected_order_id}",
+                    )
+
+                    parts_used = st.text_input(
+                        "Parts used",
+                        value=safe_text(order.get("parts_used")),
+                        key=f"update_parts_used_{selected_order_id}",
+                    )
+
+                    technician = st.text_input(
+                        "Technician",
+                        value=safe_text(order.get("technician")),
+                        key=f"update_technician_{selected_order_id}",
+                    )
+
+                    render_cost_inputs(order)
+
+                    if st.button("💾 Update Order", type="primary", key=f"update_order_btn_{selected_order_id}"):
+                        # valorile din fragmente sunt in session_state (fragmentele ruleaza inaintea butonului)
+                        labor_cost = st.session_state[f"update_labor_cost_{selected_order_id}"]
+                        parts_cost = st.session_state[f"update_parts_cost_{selected_order_id}"]
+                        updates = {
+                            "status": new_status,
+                            "repair_details": repair_details,
+                            "parts_used": parts_used,
+                            "technician": technician,
+                            "labor_cost": labor_cost,
+                            "parts_cost": parts_cost,
+                            **printer_fields(st.session_state[state_key]),
+                        }
+
+                        if new_status == "Ready for Pickup" and not safe_text(order.get("date_completed")):
+                            updates["date_completed"] = datetime.now().strftime("%Y-%m-%d")
                         if new_status == "Completed":
-                            actual_pickup_date = st.date_input(
-                                "Actual Pickup Date",
-                                value=date.today(),
-                                key=f"update_pickup_date_{selected_order_id}",
+                            updates["date_picked_up"] = (
+                                actual_pickup_date.strftime("%Y-%m-%d")
+                                if actual_pickup_date
+                                else datetime.now().strftime("%Y-%m-%d")
                             )
-                        else:
-                            actual_pickup_date = None
-
-                        st.subheader("Repair details")
 
-                        repair_details = st.text_area(
-                            "Repairs performed",
-                            value=safe_text(order.get("repair_details")),
-                            height=100,
-                            key=f"update_repair_details_{selected_order_id}",
-                        )
-
-                        parts_used = st.text_input(
-                            "Parts used",
-                            value=safe_text(order.get("parts_used")),
-                            key=f"update_parts_used_{selected_order_id}",
-                        )
+                        if save_order_update(crm, selected_order_id, updates):
+                            st.success("✅ Order updated successfully!")
+                            st.rerun()
 
-                        technician = st.text_input(
-                            "Technician",
-                            value=safe_text(order.get("technician")),
-                            key=f"update_technician_{selected_order_id}",
-                        )
+                    if st.session_state.get(f"upd_conflict_{selected_order_id}"):
+                        render_order_conflict(crm, selected_order_id)
 
-                        colc1, colc2, colc3 = st.columns(3)
-                        labor_cost = colc1.number_input(
-                            "Labor cost (RON)",
-                            value=safe_float(order.get("labor_cost")),
-                            min_value=0.0,
-                            step=10.0,
-                            key=f"update_labor_cost_{selected_order_id}",
-                        )
-                        parts_cost = colc2.number_input(
-                            "Parts cost (RON)",
-                            value=safe_float(order.get("parts_cost")),
-                            min_value=0.0,
-                            step=10.0,
-                            key=f"update_parts_cost_{selected_order_id}",
-                        )
-                        colc3.metric("💰 Total", f"{labor_cost + parts_cost:.2f} RON")
-
-                        if st.button("💾 Update Order", type="primary", key=f"update_order_btn_{selected_order_id}"):
-                            # Clean printers list
-                            printers_clean = []
-                            for p in st.session_state[state_key]:
-                                brand = safe_text(p.get("brand", "")).strip()
-                                model = safe_text(p.get("model", "")).strip()
-                                serial = safe_text(p.get("serial", "")).strip()
-                                if brand or model or serial:
-                                    printers_clean.append({
-                                        "brand": brand,
-                                        "model": model,
-                                        "serial": serial,
-                                    })
-
-                            printers_json = json.dumps(printers_clean, ensure_ascii=False)
-
-                            first_brand = ""
-                            first_model = ""
-                            first_serial = ""
-                            if printers_clean:
-                                first_brand = printers_clean[0]["brand"]
-                                first_model = printers_clean[0]["model"]
-                                first_serial = printers_clean[0]["serial"]
-
-                            updates = {
-                                "status": new_status,
-                                "repair_details": repair_details,
-                                "parts_used": parts_used,
-                                "technician": technician,
-                                "labor_cost": labor_cost,
-                                "parts_cost": parts_cost,
-                                "printers_json": printers_json,
-                                "printer_brand": first_brand,
-                                "printer_model": first_model,
-                                "printer_serial": first_serial,
-                            }
-
-                            if new_status == "Ready for Pickup" and not order.get("date_completed"):
-                                updates["date_completed"] = datetime.now().strftime("%Y-%m-%d")
-                            if new_status == "Completed":
-                                updates["date_picked_up"] = (
-                                    actual_pickup_date.strftime("%Y-%m-%d")
-                                    if actual_pickup_date
-                                    else datetime.now().strftime("%Y-%m-%d")
-                                )
-
-                            if crm.update_order(selected_order_id, **updates):
-                                st.success("✅ Order updated successfully!")
-                                st.rerun()
-
-                        st.divider()
-                        st.subheader("📄 Download Receipts")
-
-                        # Re-citim comanda proaspăt din sheet pentru PDF-uri actualizate
-                        df_latest = crm._read_df(raw=True, ttl=0)
-                        if df_latest is not None and not df_latest.empty:
-                            mask = df_latest["order_id"] == selected_order_id
-                            if mask.any():
-                                order_latest = df_latest[mask].iloc[0].to_dict()
-                            else:
-                                order_latest = order  # fallback la varianta veche deja încărcată
-                        else:
-                            order_latest = order
-
-                        logo = st.session_state.get("logo_image", None)
-
-                        colp1, colp2 = st.columns(2)
-                        with colp1:
-                            st.markdown("**Initial Receipt**")
-                            pdf_init = generate_initial_receipt_pdf(order_latest, st.session_state["company_info"], logo)
-                            st.download_button(
-                                "📄 Download Initial",
-                                pdf_init,
-                                f"Initial_{order_latest['order_id']}.pdf",
-                                "application/pdf",
-                                use_container_width=True,
-                                key=f"dl_upd_init_{order_latest['order_id']}",
-                            )
-                        with colp2:
-                            st.markdown("**Completion Receipt**")
-                            pdf_comp = generate_completion_receipt_pdf(order_latest, st.session_state["company_info"], logo)
-                            st.download_button(
-                                "📄 Download Completion",
-                                pdf_comp,
-                                f"Completion_{order_latest['order_id']}.pdf",
-                                "application/pdf",
-                                use_container_width=True,
-                                key=f"dl_upd_comp_{order_latest['order_id']}",
-                            )
+                    st.divider()
+                    st.subheader("📄 Download Receipts")
+                    render_receipt_downloads(data, selected_order_id)
         else:
             st.info("📝 No orders yet.")
 
     # TAB 3: REPORTS
     elif active_tab == 3:
         st.header("Reports & Analytics")
-        df = df_all_orders
-        if not df.empty:
+        include_archive = st.checkbox("Include archived orders", key="reports_include_archive")
+        colr1, colr2 = st.columns(2)
+        report_range = colr1.date_input("Received between", value=(), key="reports_received_range")
+        report_technician = colr2.selectbox("Technician", ["All"] + data.technicians(), key="reports_technician")
+        # totalurile si graficele vin din rollup-urile intretinute de store, nu dintr-o scanare a comenzilor
+        report_filters = dict(
+            received_between=date_range_filter(report_range),
+            technician=None if report_technician == "All" else report_technician,
+            include_archive=include_archive,
+        )
+        totals = data.report_totals(**report_filters)
+        filtered = bool(report_range) or report_technician != "All"
+        if totals["orders"]:
             col1, col2, col3 = st.columns(3)
-            col1.metric("💰 Total Revenue", f"{df['total_cost'].sum():.2f} RON")
-            avg_cost = df[df["total_cost"] > 0]["total_cost"].mean() if len(df[df["total_cost"] > 0]) > 0 else 0
-            col2.metric("📊 Average Cost", f"{avg_cost:.2f} RON")
-            col3.metric("👥 Unique Clients", df["client_name"].nunique())
+            col1.metric("💰 Total Revenue", f"{totals['revenue']:.2f} RON")
+            col2.metric("📊 Average Cost", f"{totals['avg_ticket']:.2f} RON")
+            # clienti = telefoane normalizate (nu nume scrise diferit)
+            df = data.query(**report_filters) if include_archive or filtered else None
+            unique_clients = (
+                client_keys(df).replace("", pd.NA).nunique() if df is not None else data.client_count()
+            )
+            col3.metric("👥 Unique Clients", unique_clients)
 
             st.divider()
             st.subheader("Orders by Status")
-            st.bar_chart(df["status"].value_counts())
+            if filtered:
+                st.bar_chart(df["status"].astype(str).value_counts())
+            else:
+                st.bar_chart(data.report_rollup("status", include_archive=include_archive).set_index("status")["orders"])
+
+            st.subheader("Monthly Trend")
+            monthly = data.report_rollup("month", **report_filters)
+            trend_metrics = {"Revenue (RON)": "revenue", "Orders": "orders", "Average ticket (RON)": "avg_ticket"}
+            trend = st.radio("Show", list(trend_metrics), horizontal=True, key="reports_trend_metric")
+            st.bar_chart(monthly.set_index("month")[trend_metrics[trend]])
+
+            st.subheader("Technician Breakdown")
+            by_technician = data.report_rollup("technician", **report_filters)
+            st.dataframe(
+                by_technician.sort_values("revenue", ascending=False),
+                column_config={
+                    "technician": "Technician",
+                    "orders": "Orders",
+                    "revenue": st.column_config.NumberColumn("Revenue", format="%.2f RON"),
+                    "avg_ticket": st.column_config.NumberColumn("Average ticket", format="%.2f RON"),
+                },
+                use_container_width=True,
+                hide_index=True,
+            )
+
+            st.subheader("Open Orders by Technician")
+            week_start = date.today() - timedelta(days=date.today().weekday())
+            workload = [
+                {
+                    "Technician": name,
+                    "Open": data.count(status=OPEN_STATUSES, technician=name),
+                    "Open, received this week": data.count(
+                        status=OPEN_STATUSES, technician=name, received_between=(week_start, None)
+                    ),
+                }
+                for name in data.technicians()
+            ]
+            workload.append({
+                "Technician": "(unassigned)",
+                "Open": data.count(status=OPEN_STATUSES) - sum(w["Open"] for w in workload),
+                "Open, received this week": data.count(status=OPEN_STATUSES, received_between=(week_start, None))
+                - sum(w["Open, received this week"] for w in workload),
+            })
+            st.dataframe(pd.DataFrame(workload), use_container_width=True, hide_index=True)
+        elif filtered:
+            st.info("📝 No orders match these filters.")
         else:
             st.info("📝 No data yet.")
 
+    elapsed = time.perf_counter() - _SCRIPT_STARTED
+    record_startup("first_run_s", elapsed)  # daca sesiunea era deja autentificata
+    record_startup("first_app_s", elapsed)
+
+
+# ============================================================================
+# COMMAND LINE
+# ============================================================================
+# Aceleasi operatii ca in UI, fara sesiune Streamlit (cron, worker de batch):
+#   python printer.py receipts completion --status Completed --from 2025-01-01 --to 2025-01-31 --out jan.pdf
+#   python printer.py export --format jsonl --archive > orders.jsonl
+#   python printer.py sync           (sqlite + mirror: push the local orders to the mirror)
+#   python printer.py sync --pull    (rebuild the local SQLite orders from the mirror)
+#   python printer.py migrate-printers
+EXPORT_CHUNK_ROWS = 1000
+
+
+def cli_crm() -> PrinterServiceCRM:
+    store = get_order_store()
+    if store is None:
+        raise SystemExit("❌ No storage backend configured (see [storage] in .streamlit/secrets.toml).")
+    return PrinterServiceCRM(store)
+
+
+def cli_orders(crm: PrinterServiceCRM, args) -> pd.DataFrame:
+    """Orders picked by the shared filters (--id, --search, --status, --technician, --brand, --from/--to, --archive)."""
+    if args.ids:
+        frame = crm.list_orders_df(include_archive=args.archive)
+        positions = {oid: pos for pos, oid in enumerate(frame["order_id"])}
+        return frame.iloc[[positions[oid] for oid in args.ids if oid in positions]]
+    status = args.status or None
+    if status and "open" in [s.lower() for s in status]:
+        status = list(OPEN_STATUSES) + [s for s in status if s.lower() != "open"]
+    received = (args.received_from, args.received_to) if args.received_from or args.received_to else None
+    query = dict(
+        sort_by="date_received", ascending=True, search=args.search, include_archive=args.archive,
+        status=status, technician=args.technician, brand=args.brand, received_between=received,
+    )
+    _, total = crm.orders_page(page=1, page_size=0, **query)
+    frame, _ = crm.orders_page(page=1, page_size=total, **query)
+    return frame
+
+
+def cli_progress(label: str):
+    """Progress on stderr: one updating line on a terminal, ~10 plain lines in logs (cron)."""
+    interactive = sys.stderr.isatty()
+
+    def progress(done: int, total: int):
+        if interactive:
+            print(f"\r{label} {done}/{total}", end="\n" if done >= total else "", file=sys.stderr, flush=True)
+        elif done and (done >= total or done % max(1, total // 10) == 0):
+            print(f"{label} {done}/{total}", file=sys.stderr, flush=True)
+    return progress
+
+
+def cli_receipts(args) -> int:
+    crm = cli_crm()
+    orders = crm.receipt_orders(cli_orders(crm, args))
+    if not orders:
+        print("No matching orders.", file=sys.stderr)
+        return 1
+    company_info = load_company_info()
+    progress = cli_progress(f"{args.kind} receipts")
+
+    if args.format == "files":
+        # fiecare PDF se scrie imediat ce e gata; numele fisierelor merg pe stdout
+        out = Path(args.out or ".")
+        out.mkdir(parents=True, exist_ok=True)
+        plan, logo = get_receipt_plan(args.kind), get_logo_asset()
+        for done, order in enumerate(orders, start=1):
+            path = out / receipt_filename(args.kind, order)
+            path.write_bytes(plan.render(order, company_info, logo).getvalue())
+            print(path, flush=True)
+            progress(done, len(orders))
+        return 0
+
+    export = export_receipts_zip if args.format == "zip" else export_receipts_pdf
+    path = Path(args.out) if args.out else Path(f"{args.kind.title()}_receipts_{datetime.now():%Y%m%d_%H%M%S}.{args.format}")
+    print(export(args.kind, orders, company_info, progress=progress, path=path), flush=True)
+    return 0
+
+
+def cli_export(args) -> int:
+    crm = cli_crm()
+    frame = cli_orders(crm, args)
+    out = open(args.out, "w", encoding="utf-8", newline="") if args.out and args.out != "-" else sys.stdout
+    try:
+        # pe bucati, ca iesirea sa curga (pipe / fisier mare) fara o copie text a intregului tabel
+        for start in range(0, len(frame), EXPORT_CHUNK_ROWS):
+            chunk = frame.iloc[start:start + EXPORT_CHUNK_ROWS]
+            if args.format == "csv":
+                chunk.to_csv(out, header=start == 0, index=False)
+            else:
+                for line in chunk.to_json(orient="records", lines=True, date_format="iso", force_ascii=False).splitlines():
+                    out.write(line + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{len(frame)} order(s) exported.", file=sys.stderr)
+    return 0
+
+
+def cli_sync(args) -> int:
+    crm = cli_crm()
+    store = crm.store
+    backend = store.backend
+    if not isinstance(backend, MirroredBackend):
+        raise SystemExit(f"❌ {backend.label} has no mirror to sync (set mirror = \"gsheets\" under [storage]).")
+    started = time.perf_counter()
+    if args.pull:
+        if not backend.pull_from_mirror():
+            return 1
+        store.reload()
+        action = f"rebuilt from {backend.mirror.label}"
+    else:
+        if not backend.push_to_mirror():
+            return 1
+        action = f"pushed to {backend.mirror.label}"
+    counts = crm.status_counts()
+    print(f"{sum(counts.values())} active order(s) {action} in {time.perf_counter() - started:.2f}s")
+    for status, n in sorted(counts.items()):
+        print(f"  {status}: {n}")
+    return 0
+
+
+def cli_migrate_printers(args) -> int:
+    store = cli_crm().store
+    started = time.perf_counter()
+    migrated = store.migrate_legacy_printers()
+    print(f"{migrated} order(s) migrated to printers_json in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+def add_order_filters(parser: argparse.ArgumentParser):
+    parser.add_argument("--id", dest="ids", action="append", default=[], metavar="ORDER_ID",
+                        help="order id (repeatable); overrides the other filters")
+    parser.add_argument("--search", default="", help="free-text search (archived orders too with --archive)")
+    parser.add_argument("--status", action="append", default=[],
+                        help="status (repeatable); 'open' = every status before pickup")
+    parser.add_argument("--technician")
+    parser.add_argument("--brand")
+    parser.add_argument("--from", dest="received_from", type=date.fromisoformat, metavar="YYYY-MM-DD")
+    parser.add_argument("--to", dest="received_to", type=date.fromisoformat, metavar="YYYY-MM-DD")
+    parser.add_argument("--archive", action="store_true", help="include archived orders")
+
+
+def cli(argv=None) -> int:
+    """Headless entry point: `python printer.py <command>` (the web app runs with `streamlit run printer.py`)."""
+    parser = argparse.ArgumentParser(prog="printer.py", description="Printer Service CRM jobs without the web UI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    receipts = commands.add_parser("receipts", help="render receipts for the selected orders")
+    receipts.add_argument("kind", choices=sorted(RECEIPT_TEMPLATES))
+    receipts.add_argument("--format", choices=["pdf", "zip", "files"], default="pdf",
+                          help="one merged PDF, a ZIP of PDFs, or one PDF file per order in --out")
+    receipts.add_argument("--out", help="output file (directory for --format files)")
+    add_order_filters(receipts)
+    receipts.set_defaults(handler=cli_receipts)
+
+    export = commands.add_parser("export", help="export the selected orders")
+    export.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    export.add_argument("--out", help="output file (default: stdout)")
+    add_order_filters(export)
+    export.set_defaults(handler=cli_export)
+
+    sync = commands.add_parser("sync", help="copy the active orders between the local database and its mirror")
+    sync.add_argument("--pull", action="store_true",
+                      help="rebuild the local orders from the mirror instead of pushing them to it")
+    sync.set_defaults(handler=cli_sync)
+
+    migrate = commands.add_parser("migrate-printers",
+                                  help="one-time: build printers_json for orders with only the legacy printer columns")
+    migrate.set_defaults(handler=cli_migrate_printers)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.handler(args)
+    except BrokenPipeError:
+        # cititorul a inchis iesirea (ex. `| head`): nu e o eroare
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+
 
 if __name__ == "__main__":
-    main()
+    # `streamlit run printer.py` executes the script inside a session; plain `python printer.py` is the CLI
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        main()
+    else:
+        sys.exit(cli())
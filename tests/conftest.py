@@ -0,0 +1,33 @@
+import sys
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import printer  # noqa: E402  (headless import: no Streamlit session needed)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "crm.db")
+
+
+@pytest.fixture
+def make_store(db_path):
+    """A new OrderStore on the shared SQLite file, as if it lived in another server process."""
+
+    def make(**kwargs):
+        store = printer.OrderStore(printer.SQLiteBackend(db_path), **kwargs)
+        store.reload()
+        return store
+
+    return make
+
+
+def new_order(crm, name="Ion Pop", phone="0722123456", received=date(2025, 3, 1), serial="SN1"):
+    return crm.create_service_order(
+        name, phone, "", [{"brand": "HP", "model": "M404", "serial": serial}],
+        "Nu trage hartia", "", "", received, None,
+    )
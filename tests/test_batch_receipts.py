@@ -0,0 +1,37 @@
+import os
+
+from pypdf import PdfReader
+
+import printer
+from conftest import new_order
+
+
+def test_pool_pays_off_only_past_the_measured_cost(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    zip_s, pdf_s = printer.BATCH_RENDER_S["zip"], printer.BATCH_RENDER_S["pdf"]
+
+    assert printer.batch_pool_workers(100, zip_s) == 0
+    assert printer.batch_pool_workers(300, zip_s) == 8
+    assert printer.batch_pool_workers(300, pdf_s, printer.BATCH_MERGE_S) == 0
+    assert printer.batch_pool_workers(10000, pdf_s, printer.BATCH_MERGE_S) == 8
+    monkeypatch.setattr(os, "cpu_count", lambda: 1)
+    assert printer.batch_pool_workers(10000, zip_s) == 0
+
+
+def test_merged_pdf_from_pool_parts_keeps_order(make_store, monkeypatch, tmp_path):
+    crm = printer.PrinterServiceCRM(make_store())
+    ids = [new_order(crm, serial=f"SN{i}") for i in range(12)]
+    orders = crm.receipt_orders(crm.query())
+    monkeypatch.setattr(printer, "BATCH_DIR", tmp_path / "batch")
+    monkeypatch.setattr(printer, "batch_pool_workers", lambda *args: 2)
+    seen = []
+
+    path = printer.export_receipts_pdf(
+        "initial", orders, printer.COMPANY_INFO_DEFAULTS, progress=lambda done, n: seen.append(done)
+    )
+
+    pages = PdfReader(str(path)).pages
+    assert len(pages) == len(ids)
+    assert [next(i for i in ids if i in page.extract_text()) for page in pages] == [o["order_id"] for o in orders]
+    assert seen[-1] == len(ids)
+    assert not list((tmp_path / "batch").glob("*.part.pdf"))
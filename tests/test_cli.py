@@ -0,0 +1,81 @@
+import json
+from datetime import date
+
+import pytest
+
+import printer
+from conftest import new_order
+
+
+@pytest.fixture
+def cli_crm(make_store, monkeypatch):
+    crm = printer.PrinterServiceCRM(make_store())
+    monkeypatch.setattr(printer, "cli_crm", lambda: crm)
+    monkeypatch.setattr(printer, "load_company_info", lambda: dict(printer.COMPANY_INFO_DEFAULTS))
+    return crm
+
+
+@pytest.fixture
+def orders(cli_crm):
+    ids = [new_order(cli_crm, serial=f"SN{i}", received=date(2025, 1, 10 * i + 1)) for i in range(3)]
+    cli_crm.update_order(ids[1], status="Completed", technician="Maria")
+    return ids
+
+
+def test_export_jsonl_applies_the_filters(orders, capsys):
+    assert printer.cli(["export", "--format", "jsonl", "--status", "Completed"]) == 0
+
+    out, err = capsys.readouterr()
+    rows = [json.loads(line) for line in out.splitlines()]
+    assert [r["order_id"] for r in rows] == [orders[1]]
+    assert rows[0]["technician"] == "Maria"
+    assert "1 order(s) exported." in err
+
+
+def test_export_csv_to_a_file_in_received_order(orders, tmp_path):
+    out = tmp_path / "orders.csv"
+
+    assert printer.cli(["export", "--from", "2025-01-05", "--out", str(out)]) == 0
+
+    lines = out.read_text(encoding="utf-8").splitlines()
+    assert lines[0].startswith("order_id,")
+    assert [line.split(",")[0] for line in lines[1:]] == orders[1:]
+
+
+def test_receipts_as_files_and_merged_pdf(orders, tmp_path, capsys):
+    assert printer.cli(["receipts", "initial", "--format", "files", "--out", str(tmp_path / "pdfs"),
+                        "--id", orders[2], "--id", orders[0]]) == 0
+    written = capsys.readouterr().out.split()
+    assert [p.rsplit("/", 1)[-1] for p in written] == [f"Initial_{orders[2]}.pdf", f"Initial_{orders[0]}.pdf"]
+
+    merged = tmp_path / "all.pdf"
+    assert printer.cli(["receipts", "completion", "--out", str(merged)]) == 0
+    assert merged.read_bytes().startswith(b"%PDF")
+    assert printer.cli(["receipts", "completion", "--technician", "Nimeni"]) == 1
+
+
+def test_sync_needs_a_mirror_and_copies_both_ways(cli_crm, orders, tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        printer.cli(["sync"])
+
+    mirror = printer.SQLiteBackend(str(tmp_path / "mirror.db"))
+    mirror.ensure_schema()
+    cli_crm.store.backend = printer.MirroredBackend(cli_crm.store.backend, mirror)
+    assert printer.cli(["sync"]) == 0
+    assert "3 active order(s) pushed" in capsys.readouterr().out
+    assert sorted(mirror.read_all()["order_id"]) == orders
+
+    assert printer.cli(["sync", "--pull"]) == 0
+    assert "3 active order(s) rebuilt" in capsys.readouterr().out
+
+
+def test_migrate_printers_converts_legacy_rows(cli_crm, orders, capsys):
+    legacy = {"order_id": "SRV-00009", "client_name": "Vechi", "printer_brand": "Canon",
+              "printer_model": "LBP", "printer_serial": "L9", "date_received": "2019-02-03", "revision": 1}
+    assert cli_crm.store.backend.insert(legacy)
+    cli_crm.store.reload()
+
+    assert printer.cli(["migrate-printers"]) == 0
+
+    assert capsys.readouterr().out.startswith("1 order(s) migrated")
+    assert cli_crm.store.printers_for("SRV-00009") == [{"brand": "Canon", "model": "LBP", "serial": "L9"}]
@@ -0,0 +1,72 @@
+from streamlit.testing.v1 import AppTest
+
+import printer
+from conftest import new_order
+
+
+def editor_app(db_path, order_id):
+    import streamlit as st
+
+    import printer
+
+    if "crm" not in st.session_state:
+        store = printer.OrderStore(printer.SQLiteBackend(db_path))
+        store.reload()
+        st.session_state["crm"] = printer.PrinterServiceCRM(store)
+        st.session_state[f"upd_printers_{order_id}"] = store.printers_for(order_id)
+    crm = st.session_state["crm"]
+    printer.render_printer_editor(crm, printer.TabData(crm, 2), order_id)
+
+
+def test_printer_editor_writes_only_on_remove(make_store, db_path):
+    order_id = new_order(printer.PrinterServiceCRM(make_store()), serial="SN1")
+    # AppTest re-executa tot scriptul la fiecare interactiune; se verifica starea, nu scope-ul rerun-ului
+    at = AppTest.from_function(editor_app, args=(db_path, order_id), default_timeout=30)
+    at.run()
+    store = at.session_state["crm"].store
+    version = store.version
+
+    at.button(key=f"upd_add_printer_btn_{order_id}").click().run()
+    at.text_input(key=f"upd_serial_{order_id}_1").input("SN2").run()
+
+    assert not at.exception
+    assert store.version == version  # adaugarea unui rand nu scrie nimic
+    assert len(at.session_state[f"upd_printers_{order_id}"]) == 2
+
+    at.checkbox(key=f"upd_remove_printer_{order_id}_0").check().run()
+    at.button(key=f"upd_remove_selected_{order_id}").click().run()
+
+    assert not at.exception
+    assert [p["serial"] for p in store.printers_for(order_id)] == ["SN2"]
+    assert [p["serial"] for p in make_store().printers_for(order_id)] == ["SN2"]
+    assert at.session_state[f"upd_printers_{order_id}"] == store.printers_for(order_id)
+
+
+def new_order_app(db_path):
+    import streamlit as st
+
+    import printer
+
+    if "crm" not in st.session_state:
+        store = printer.OrderStore(printer.SQLiteBackend(db_path))
+        store.reload()
+        st.session_state["crm"] = printer.PrinterServiceCRM(store)
+        st.session_state["temp_printers"] = [
+            {"brand": "HP", "model": "M404", "serial": "SN1"}, {"brand": "Canon", "model": "LBP", "serial": "SN2"},
+        ]
+    crm = st.session_state["crm"]
+    printer.render_new_order_form(crm, printer.TabData(crm, 0))
+
+
+def test_removing_a_new_order_row_keeps_the_other_rows_values(make_store, db_path):
+    make_store()
+    at = AppTest.from_function(new_order_app, args=(db_path,), default_timeout=30)
+    at.run()
+
+    at.checkbox(key="new_printer_remove_0").check()
+    at.button[0].click().run()  # "Remove selected printers" e primul buton din formular
+
+    assert not at.exception
+    assert at.session_state["temp_printers"] == [{"brand": "Canon", "model": "LBP", "serial": "SN2"}]
+    assert at.text_input(key="new_printer_serial_0").value == "SN2"
+    assert not at.checkbox(key="new_printer_remove_0").value
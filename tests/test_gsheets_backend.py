@@ -0,0 +1,242 @@
+import re
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from gspread.utils import a1_to_rowcol
+
+import printer
+from conftest import new_order
+
+
+class FakeWorksheet:
+    """The gspread Worksheet calls GSheetsBackend makes, over a list of rows (rows[0] is the header)."""
+
+    def __init__(self, spreadsheet, title, rows=None, sheet_id=0):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = rows if rows is not None else []
+        self.col_count = max((len(r) for r in self.rows), default=26)
+        self.calls = []
+
+    def _cell(self, row, col):
+        values = self.rows[row - 1] if row <= len(self.rows) else []
+        return values[col - 1] if col <= len(values) else ""
+
+    def row_values(self, row):
+        self.calls.append(("row_values", row))
+        values = list(self.rows[row - 1]) if row <= len(self.rows) else []
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def col_values(self, col):
+        self.calls.append(("col_values", col))
+        values = [self._cell(r, col) for r in range(1, len(self.rows) + 1)]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def _column_range(self, a1):
+        # "A2:A5" sau "A2:A" (pana la ultimul rand)
+        m = re.fullmatch(r"([A-Z]+)(\d+):[A-Z]+(\d*)", a1)
+        _, col = a1_to_rowcol(f"{m.group(1)}1")
+        last = int(m.group(3)) if m.group(3) else len(self.rows)
+        values = [[self._cell(r, col)] if self._cell(r, col) != "" else [] for r in range(int(m.group(2)), last + 1)]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def get(self, a1):
+        self.calls.append(("get", a1))
+        return self._column_range(a1)
+
+    def batch_get(self, ranges):
+        self.calls.append(("batch_get", tuple(ranges)))
+        out = []
+        for a1 in ranges:
+            row = re.fullmatch(r"(\d+):\d+", a1)
+            out.append([self.row_values(int(row.group(1)))] if row else self._column_range(a1))
+        return out
+
+    def append_row(self, values, value_input_option=None, table_range=None):
+        self.calls.append(("append_row", values[0]))
+        self.rows.append(list(values))
+        n = len(self.rows)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{n}:{printer.rowcol_to_a1(n, len(values))}"}}
+
+    def append_rows(self, values, value_input_option=None, table_range=None):
+        self.rows.extend(list(v) for v in values)
+
+    def batch_update(self, data, value_input_option=None):
+        self.calls.append(("batch_update", tuple(d["range"] for d in data)))
+        for d in data:
+            row, col = a1_to_rowcol(d["range"].split(":")[0])
+            for i, values in enumerate(d["values"]):
+                while len(self.rows) < row + i:
+                    self.rows.append([])
+                target = self.rows[row + i - 1]
+                for j, value in enumerate(values):
+                    target.extend([""] * (col + j - len(target)))
+                    target[col + j - 1] = value
+
+    def add_cols(self, n):
+        self.col_count += n
+
+    def delete_rows(self, row):
+        self.calls.append(("delete_rows", row))
+        del self.rows[row - 1]
+
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.sheets = {}
+
+    def add_worksheet(self, title, rows=0, cols=0):
+        self.sheets[title] = FakeWorksheet(self, title, sheet_id=len(self.sheets))
+        return self.sheets[title]
+
+    def worksheet(self, title):
+        return self.sheets[title]
+
+    def worksheets(self):
+        return list(self.sheets.values())
+
+    def values_batch_get(self, ranges):
+        value_ranges = []
+        for a1 in ranges:
+            name, cells = re.fullmatch(r"'(.+)'!(.+)", a1).groups()
+            value_ranges.append({"values": self.sheets[name]._column_range(cells)})
+        return {"valueRanges": value_ranges}
+
+    def batch_update(self, body):
+        by_id = {ws.id: ws for ws in self.sheets.values()}
+        for request in body["requests"]:
+            rng = request["deleteDimension"]["range"]
+            del by_id[rng["sheetId"]].rows[rng["startIndex"]:rng["endIndex"]]
+
+
+class FakeConnection:
+    """st-gsheets-connection: whole-sheet read / update plus the gspread client behind it."""
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self.full_writes = 0
+        self.client = SimpleNamespace(_select_worksheet=lambda worksheet: spreadsheet.worksheet(worksheet))
+
+    def read(self, worksheet, ttl=0):
+        rows = self.spreadsheet.worksheet(worksheet).rows
+        header = rows[0] if rows else []
+        return pd.DataFrame([r + [""] * (len(header) - len(r)) for r in rows[1:]], columns=header)
+
+    def update(self, worksheet, data):
+        self.full_writes += 1
+        ws = self.spreadsheet.worksheet(worksheet)
+        ws.rows = [list(data.columns)] + [[printer.to_cell_value(v) for v in row] for row in data.values.tolist()]
+
+
+@pytest.fixture
+def sheet():
+    spreadsheet = FakeSpreadsheet()
+    spreadsheet.add_worksheet("Orders").rows.append(list(printer.ORDER_COLUMNS))
+    return spreadsheet
+
+
+@pytest.fixture
+def make_sheet_store(sheet):
+    def make():
+        store = printer.OrderStore(printer.GSheetsBackend(FakeConnection(sheet)))
+        store.reload()
+        return store
+
+    return make
+
+
+def test_new_orders_do_not_read_the_whole_id_column(sheet, make_sheet_store):
+    crm = printer.PrinterServiceCRM(make_sheet_store())
+    ws = sheet.worksheet("Orders")
+    ws.calls.clear()
+
+    ids = [new_order(crm, serial=f"SN{i}") for i in range(5)]
+
+    assert ids == [f"SRV-0000{i}" for i in range(1, 6)]
+    assert not [c for c in ws.calls if c[0] == "col_values"]
+    # dupa fiecare append se citeste doar randul scris
+    assert [c[1] for c in ws.calls if c[0] == "get"] == [f"A{r}:A{r}" for r in range(2, 7)]
+    assert [row[0] for row in ws.rows[1:]] == ids
+
+
+def test_id_taken_by_another_session_is_detected_after_append(sheet, make_sheet_store):
+    mine, theirs = make_sheet_store(), make_sheet_store()
+    crm = printer.PrinterServiceCRM(mine)
+    first = new_order(crm, serial="SN1")
+    # cealalta sesiune nu a vazut inca comanda noastra si ia acelasi id urmator
+    assert new_order(printer.PrinterServiceCRM(theirs), serial="X1") == "SRV-00002"
+    assert new_order(printer.PrinterServiceCRM(theirs), serial="X2") == "SRV-00003"
+
+    second = new_order(crm, serial="SN2")
+
+    ws = sheet.worksheet("Orders")
+    assert second == "SRV-00004"
+    assert [row[0] for row in ws.rows[1:]] == [first, "SRV-00002", "SRV-00003", "SRV-00004"]
+    # citirea de verificare acopera doar randurile adaugate de la ultimul rand cunoscut
+    assert ("get", "A3:A5") in ws.calls
+
+
+def test_update_writes_only_the_changed_cells(sheet, make_sheet_store):
+    store = make_sheet_store()
+    crm = printer.PrinterServiceCRM(store)
+    order_id = new_order(crm)
+    ws = sheet.worksheet("Orders")
+    ws.calls.clear()
+
+    assert crm.update_order(order_id, technician="Maria", notes="")
+
+    columns = printer.ORDER_COLUMNS
+    cell = {name: printer.rowcol_to_a1(2, columns.index(name) + 1) for name in columns}
+    writes = [c[1] for c in ws.calls if c[0] == "batch_update"]
+    # notes era deja gol: doar tehnicianul si revizia / updated_at ajung in sheet, intr-un singur request
+    assert len(writes) == 1
+    assert set(writes[0]) == {cell["technician"], cell["revision"], cell["updated_at"]}
+    assert store.backend.conn.full_writes == 0
+    assert ws.rows[1][columns.index("technician")] == "Maria"
+    assert [c[0] for c in ws.calls if c[0] != "batch_update"] == ["row_values"]
+
+
+def test_row_index_follows_rows_moved_by_hand(sheet, make_sheet_store):
+    crm = printer.PrinterServiceCRM(make_sheet_store())
+    ids = [new_order(crm, serial=f"SN{i}") for i in range(3)]
+    ws = sheet.worksheet("Orders")
+    del ws.rows[1]  # cineva sterge primul rand direct in sheet
+    ws.calls.clear()
+
+    assert crm.update_order(ids[2], technician="Dan")
+
+    assert [row[0] for row in ws.rows[1:]] == ids[1:]
+    tech = printer.ORDER_COLUMNS.index("technician")
+    assert [row[tech] for row in ws.rows[1:]] == ["", "Dan"]
+    # indexul vechi nimereste randul gresit, deci se reconstruieste o data din coloana order_id
+    assert [c[0] for c in ws.calls if c[0] in ("row_values", "col_values")] == ["row_values", "col_values", "row_values"]
+
+
+def test_archive_moves_rows_into_yearly_worksheets(sheet, make_sheet_store):
+    store = make_sheet_store()
+    crm = printer.PrinterServiceCRM(store)
+    ids = [new_order(crm, serial=f"SN{i}") for i in range(4)]
+    crm.update_order(ids[0], status="Completed", date_picked_up="2020-05-04")
+    crm.update_order(ids[2], status="Completed", date_picked_up="2021-01-10")
+    crm.update_order(ids[3], status="Completed", date_picked_up="2020-11-30")
+
+    assert store.archive_completed(30) == 3
+
+    orders = sheet.worksheet("Orders").rows
+    assert [row[0] for row in orders[1:]] == [ids[1]]
+    assert store.backend.archive_partitions() == ["Orders_2020", "Orders_2021"]
+    assert sheet.worksheet("Orders_2020").rows[0] == printer.ORDER_COLUMNS
+    assert [row[0] for row in sheet.worksheet("Orders_2020").rows[1:]] == [ids[0], ids[3]]
+    assert [row[0] for row in sheet.worksheet("Orders_2021").rows[1:]] == [ids[2]]
+    # indexul de randuri e refacut: comanda ramasa se poate scrie, id-urile arhivate nu se refolosesc
+    assert crm.update_order(ids[1], technician="Maria")
+    assert orders[1][printer.ORDER_COLUMNS.index("technician")] == "Maria"
+    assert printer.PrinterServiceCRM(make_sheet_store()).store.allocate_order_id() == "SRV-00005"
@@ -0,0 +1,80 @@
+import pytest
+
+import printer
+from conftest import new_order
+
+
+@pytest.mark.parametrize("raw", ["0722123456", "0722 123 456", "+40722123456", "0040722123456",
+                                 "40722123456", "722123456", 722123456, 722123456.0])
+def test_normalize_phone_romanian_mobile(raw):
+    assert printer.normalize_phone(raw) == "+40722123456"
+
+
+def test_numeric_sheet_phone_is_the_same_client(make_store):
+    store = make_store()
+    crm = printer.PrinterServiceCRM(store)
+    new_order(crm, phone="0722123456", serial="SN1")
+    # Sheets (USER_ENTERED) intoarce telefonul ca numar, fara 0-ul din fata
+    store.backend.insert({"order_id": "SRV-00002", "client_name": "Ion Pop", "client_phone": 722123456,
+                          "status": "Received", "revision": 1})
+    store.reload()
+
+    clients = crm.find_clients("0722")
+    assert len(clients) == 1
+    assert clients[0]["orders"] == 2
+
+
+@pytest.mark.parametrize("query", ["0722123456", "+40722123456", "722123456", "0722"])
+def test_numeric_sheet_phone_is_searchable(make_store, query):
+    store = make_store()
+    store.backend.insert({"order_id": "SRV-00001", "client_name": "Ion Pop", "client_phone": 722123456,
+                          "status": "Received", "revision": 1})
+    store.reload()
+
+    assert printer.PrinterServiceCRM(store).search_orders(query)["order_id"].tolist() == ["SRV-00001"]
+
+
+def test_search_includes_archive_when_asked(make_store):
+    store = make_store()
+    crm = printer.PrinterServiceCRM(store)
+    old = new_order(crm, name="Vasile Arhivat", phone="0744555666", serial="OLD1")
+    new_order(crm, name="Vasile Activ", phone="0755000111", serial="NEW1")
+    crm.update_order(old, status="Completed", date_picked_up="2021-06-01")
+    assert store.archive_completed(30) == 1
+
+    assert crm.search_orders("vasile")["client_name"].tolist() == ["Vasile Activ"]
+    assert set(crm.search_orders("vasile", include_archive=True)["client_name"]) == {"Vasile Activ", "Vasile Arhivat"}
+
+    page, total = crm.orders_page(search="0744555666", include_archive=True)
+    assert total == 1 and page["order_id"].tolist() == [old]
+    page, total = crm.orders_page(search="vasile", include_archive=True, status="Completed")
+    assert page["order_id"].tolist() == [old]
+    assert crm.orders_page(search="0744555666")[1] == 0
+
+
+def test_short_phone_prefix_is_not_expanded_term_by_term(monkeypatch):
+    import pandas as pd
+
+    n = 3000
+    df = pd.DataFrame({
+        "order_id": [printer.format_order_id(i) for i in range(1, n + 1)],
+        "client_name": ["Popescu Ion" if i % 100 == 0 else f"Client {i}" for i in range(n)],
+        "client_phone": [f"07{i:08d}" for i in range(n)],
+    })
+    printers = pd.DataFrame(columns=["order_id", "brand", "model", "serial"])
+    index = printer.OrderSearchIndex()
+    index.build(df, printers)
+    assert index._terms.count("07") > 10 * index.WIDE_PREFIX_TERMS
+
+    expanded = []
+    search = index._terms.search
+    monkeypatch.setattr(index._terms, "search", lambda prefix: expanded.append(prefix) or search(prefix))
+
+    assert len(index.search("07", limit=n)) == n
+    popescu = set(df.loc[df["client_name"] == "Popescu Ion", "order_id"])
+    assert set(index.search("popescu ion 07", limit=n)) == popescu
+    # o comanda scrisa dupa compactare se gaseste tot prin felia prefixului
+    row = {"order_id": "SRV-09999", "client_name": "Popescu Ion", "client_phone": "0799111222"}
+    index.refresh(pd.DataFrame([row]), {"SRV-09999": 0}, ["SRV-09999"], lambda order_id: [])
+    assert set(index.search("popescu ion 07", limit=n)) == popescu | {"SRV-09999"}
+    assert "07" not in expanded
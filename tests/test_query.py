@@ -0,0 +1,74 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import printer
+from conftest import new_order
+
+STATUSES = ["Received", "In Progress", "Ready for Pickup", "Completed"]
+TECHNICIANS = ["", "Maria", "Dan"]
+BRANDS = ["HP", "Canon", "Epson"]
+
+
+@pytest.fixture
+def crm(make_store):
+    crm = printer.PrinterServiceCRM(make_store())
+    for i in range(18):
+        order_id = new_order(crm, serial=f"SN{i}", received=date(2025, 1 + i % 6, 1 + i))
+        crm.update_order(
+            order_id, status=STATUSES[i % 4], technician=TECHNICIANS[i % 3],
+            **printer.printer_fields([{"brand": BRANDS[i % 3], "model": "M", "serial": f"SN{i}"}]),
+        )
+    return crm
+
+
+def expected_ids(df, status=None, received_between=None, technician=None, brand=None):
+    mask = pd.Series(True, index=df.index)
+    if status is not None:
+        mask &= df["status"].isin([status] if isinstance(status, str) else status)
+    if technician is not None:
+        mask &= df["technician"] == technician
+    if brand is not None:
+        mask &= df["printer_brand"] == brand
+    if received_between is not None:
+        start, end = received_between
+        if start is not None:
+            mask &= df["date_received"] >= pd.Timestamp(start)
+        if end is not None:
+            mask &= df["date_received"] <= pd.Timestamp(end)
+    return sorted(df.loc[mask, "order_id"])
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"status": "Received"},
+    {"status": ["In Progress", "Completed"]},
+    {"technician": "Maria"},
+    {"brand": "Canon"},
+    {"received_between": (date(2025, 2, 1), date(2025, 4, 30))},
+    {"received_between": (None, date(2025, 3, 1))},
+    {"status": "Completed", "technician": "Dan", "received_between": (date(2025, 1, 1), None)},
+])
+def test_query_matches_a_full_scan(crm, filters):
+    df = crm.store.snapshot()
+
+    assert sorted(crm.query(**filters)["order_id"]) == expected_ids(df, **filters)
+    assert crm.count(**filters) == len(expected_ids(df, **filters))
+
+
+def test_query_follows_updates_and_counts_by_status(crm):
+    order_id = crm.query(status="Received")["order_id"].iloc[0]
+    crm.update_order(order_id, status="Completed", technician="Dan")
+
+    assert order_id not in set(crm.query(status="Received")["order_id"])
+    assert order_id in set(crm.query(status="Completed", technician="Dan")["order_id"])
+    assert crm.status_counts() == crm.store.snapshot()["status"].value_counts().to_dict()
+
+
+def test_orders_page_sorts_and_pages(crm):
+    page, total = crm.orders_page(page=2, page_size=5, sort_by="date_received", ascending=False, technician="Maria")
+    everything = crm.query(technician="Maria").sort_values("date_received", ascending=False, kind="stable")
+
+    assert total == len(everything)
+    assert page["order_id"].tolist() == everything["order_id"].tolist()[5:10]
@@ -0,0 +1,49 @@
+import printer
+
+ORDER = {
+    "order_id": "SRV-00001", "client_name": "Ion Pop", "client_phone": "0722123456",
+    "printers_json": '[{"brand": "HP", "model": "M404", "serial": "SN1"}]',
+    "issue_description": "Nu trage hartia", "date_received": "2025-03-01", "status": "Received",
+    "revision": 1, "updated_at": "2025-03-01T10:00:00",
+}
+
+
+def key(order=ORDER, company=printer.COMPANY_INFO_DEFAULTS, kind="initial"):
+    return printer.receipt_cache_key(kind, order, company)
+
+
+def test_key_changes_only_with_what_the_receipt_shows():
+    assert key({**ORDER, "revision": 7, "updated_at": "2025-04-01T08:00:00"}) == key()
+    assert key({**ORDER, "client_name": "Ana Pop"}) != key()
+    assert key({**ORDER, "printers_json": '[{"brand": "Canon", "model": "X", "serial": "SN1"}]'}) != key()
+    assert key(company={**printer.COMPANY_INFO_DEFAULTS, "phone": "0700000000"}) != key()
+    assert key(kind="completion") != key()
+
+
+def test_render_reuses_the_cached_pdf(monkeypatch):
+    cache = printer.ReceiptCache()
+    monkeypatch.setattr(printer, "get_receipt_cache", lambda: cache)
+    rendered = []
+    generate = printer.RECEIPT_GENERATORS["initial"]
+    monkeypatch.setitem(printer.RECEIPT_GENERATORS, "initial", lambda *a: rendered.append(1) or generate(*a))
+
+    first = printer.render_receipt_pdf("initial", ORDER, printer.COMPANY_INFO_DEFAULTS)
+    again = printer.render_receipt_pdf("initial", {**ORDER, "revision": 2}, printer.COMPANY_INFO_DEFAULTS)
+    printer.render_receipt_pdf("initial", {**ORDER, "client_name": "Ana Pop"}, printer.COMPANY_INFO_DEFAULTS)
+
+    assert first.startswith(b"%PDF") and again == first
+    assert len(rendered) == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["entries"] == 2
+
+
+def test_cache_evicts_least_recently_used_within_its_bounds():
+    cache = printer.ReceiptCache(max_bytes=10, max_entries=3)
+    for name in "abc":
+        cache.put(name, b"123")
+    cache.get("a")
+    cache.put("d", b"123")  # peste 10 bytes: iese "b", cel mai vechi nefolosit
+
+    assert cache.get("b") is None
+    assert [cache.get(k) for k in "acd"] == [b"123"] * 3
+    cache.put("big", b"x" * 11)
+    assert cache.get("big") is None and cache.stats()["bytes"] == 9
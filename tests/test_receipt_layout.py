@@ -0,0 +1,131 @@
+import pytest
+
+import printer
+
+
+@pytest.mark.parametrize("text", [
+    "SN" + "X7" * 60,
+    "Email: " + "foarte.lung." * 8 + "@example.com",
+])
+def test_long_token_is_broken_not_left_as_an_empty_line(text):
+    width = 60
+    wrapped = printer.wrap_text(text, "Helvetica", 8, width, max_lines=3)
+
+    assert wrapped.lines and all(wrapped.lines)
+    assert len(wrapped.lines) == 3
+    space = printer.word_width(" ", "Helvetica", 8)
+    assert all(printer.word_width(line, "Helvetica", 8) + space < width for line in wrapped.lines)
+    # nimic nu se pierde: liniile plus restul refac textul
+    rebuilt = "".join(wrapped.lines) + wrapped.rest.replace(" ", "")
+    assert rebuilt == text.replace(" ", "")
+
+
+def test_long_token_keeps_short_words_around_it():
+    wrapped = printer.wrap_text("SN: " + "A" * 40 + " ok", "Helvetica", 8, 80)
+
+    assert wrapped.lines[0] == "SN:"
+    assert wrapped.lines[-1].endswith(" ok")
+    assert not wrapped.overflow
+
+
+def page_forms(path):
+    from pypdf import PdfReader
+
+    return [
+        {name: ref.idnum for name, ref in page["/Resources"]["/XObject"].items()}
+        for page in PdfReader(str(path)).pages
+    ]
+
+
+def test_static_layer_is_one_form_shared_by_every_page(tmp_path):
+    orders = [{"order_id": f"SRV-0000{i}", "client_name": f"Client {i}"} for i in range(1, 4)]
+
+    forms = page_forms(printer.render_receipt_part("completion", orders, printer.COMPANY_INFO_DEFAULTS, tmp_path / "a.pdf"))
+
+    # un singur obiect, acelasi pe fiecare pagina (logo-ul e desenat in el)
+    assert len(forms) == 3 and all(f == forms[0] for f in forms)
+    assert len(forms[0]) == 1
+    logo = printer.get_logo_asset()
+    name = "".join(forms[0])
+    assert printer.receipt_form_name("completion", printer.COMPANY_INFO_DEFAULTS, logo) in name
+    company = {**printer.COMPANY_INFO_DEFAULTS, "phone": "0700000000"}
+    assert printer.receipt_form_name("completion", company, logo) not in name
+
+
+def op_points(op):
+    if op[0] == "line":
+        return [op[1:3], op[3:5]]
+    if op[0] == "rect":
+        return [op[1:3], (op[1] + op[3], op[2] + op[4])]
+    return [op[1:3]]
+
+
+@pytest.mark.parametrize("kind", list(printer.RECEIPT_TEMPLATES))
+def test_every_block_stays_inside_one_receipt_copy(kind):
+    plan = printer.get_receipt_plan(kind)
+    page_w, _ = plan.pagesize
+    copy_h = printer.A5_TOP * printer.mm
+
+    for op in plan.static_ops + plan.field_ops:
+        for x, y in op_points(op):
+            assert 0 <= x <= page_w and 0 <= y <= copy_h, op
+
+
+def test_template_fields_are_what_each_receipt_prints():
+    initial = set(printer.get_receipt_plan("initial").fields)
+    completion = set(printer.get_receipt_plan("completion").fields)
+
+    assert {"order_id", "client_name", "client_phone", "date_received", "issue_description"} <= initial
+    assert {"labor_cost", "parts_cost", "total_cost", "repair_details", "parts_used", "date_picked_up"} <= completion
+    assert not initial & {"labor_cost", "repair_details", "technician"}
+
+
+def test_flow_lines_step_down_from_the_column_top():
+    order = {
+        "order_id": "SRV-00001", "date_received": "2025-03-01", "accessories": "",
+        "issue_description": "Nu trage hartia",
+    }
+    printers = [{"brand": "HP", "model": "M404", "serial": "SN1"}, {"brand": "Canon", "model": "LBP", "serial": ""}]
+    flow = next(op for op in printer.get_receipt_plan("initial").field_ops if op[0] == "flow")
+
+    drawn, overflow = printer.layout_flow(flow[1], flow[2], flow[3], printer.order_template_fields(order), printers)
+
+    step = 4 * printer.mm
+    assert [text for *_, text in drawn] == [
+        "1. HP M404 (SN: SN1)", "2. Canon LBP", "Data predarii: 2025-03-01", "PROBLEMA RAPORTATA:", "Nu trage hartia",
+    ]
+    ys = [y for _, y, *_ in drawn]
+    assert ys[:3] == pytest.approx([flow[2], flow[2] - step, flow[2] - 2 * step])
+    assert ys[3] == pytest.approx(flow[2] - 3 * step - 2 * printer.mm)  # accesoriile goale nu ocupa rand
+    assert overflow == []
+
+
+def test_unknown_block_type_is_rejected():
+    with pytest.raises(ValueError):
+        printer.compile_blocks([{"type": "barcode", "at": (0, 0)}])
+
+
+def test_both_copies_carry_the_order():
+    from pypdf import PdfReader
+
+    order = {"order_id": "SRV-00042", "client_name": "Ion Pop", "client_phone": "0722123456"}
+    pdf = printer.generate_initial_receipt_pdf(order, printer.COMPANY_INFO_DEFAULTS)
+
+    text = PdfReader(pdf).pages[0].extract_text()
+    assert text.count("Nr. Comanda: SRV-00042") == 2
+    assert text.count("Nume: Ion Pop") == 2
+
+
+def test_text_that_does_not_fit_continues_on_an_extra_page():
+    from pypdf import PdfReader
+
+    issue = " ".join(f"cuvant{i}" for i in range(400))
+    order = {"order_id": "SRV-00007", "issue_description": issue, "repair_details": "Curatat role"}
+
+    assert printer.receipt_overflow("initial", order) == ["PROBLEMA RAPORTATA"]
+    assert printer.receipt_overflow("completion", order) == []
+    pages = PdfReader(printer.generate_initial_receipt_pdf(order, printer.COMPANY_INFO_DEFAULTS)).pages
+    assert len(pages) == 2
+    assert printer.OVERFLOW_MARK in pages[0].extract_text()
+    continued = pages[1].extract_text()
+    assert "CONTINUARE - Nr. Comanda: SRV-00007" in continued and "cuvant399" in continued
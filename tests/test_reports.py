@@ -0,0 +1,60 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import printer
+from conftest import new_order
+
+
+@pytest.fixture
+def crm(make_store):
+    crm = printer.PrinterServiceCRM(make_store())
+    for i in range(10):
+        order_id = new_order(crm, serial=f"SN{i}", received=date(2025, 1 + i % 4, 5 + i))
+        crm.update_order(order_id, technician=["Maria", "Dan", ""][i % 3], labor_cost=10 * i, parts_cost=i % 2 * 5)
+    return crm
+
+
+def test_incremental_rollups_match_a_full_rebuild(crm, make_store):
+    ids = crm.store.snapshot()["order_id"].tolist()
+    crm.update_order(ids[0], status="Completed", technician="maria", labor_cost=0, parts_cost=0)
+    crm.update_order(ids[1], **printer.printer_fields([
+        {"brand": "Canon", "model": "X", "serial": "C1"}, {"brand": "Epson", "model": "L", "serial": "E1"},
+    ]))
+    crm.update_order(ids[2], status="Completed", date_picked_up="2020-01-02")
+    crm.store.archive_completed(30)
+    other = printer.PrinterServiceCRM(make_store())
+    other.update_order(ids[3], date_received="2025-06-01", labor_cost=99)
+    assert crm.store.sync()
+
+    rebuilt = printer.OrderRollups.from_frame(crm.store.snapshot())
+    assert crm.store.rollups.buckets == rebuilt.buckets
+    assert crm.store.rollups.buckets == make_store().rollups.buckets
+
+
+def test_report_rollups_agree_with_the_filtered_orders(crm):
+    between = (date(2025, 1, 1), date(2025, 2, 28))
+    rows = crm.query(received_between=between, technician="Maria")
+    assert rows["date_received"].dt.month.nunique() == 2
+
+    totals = crm.report_totals(received_between=between, technician="Maria")
+    paid = rows[rows["total_cost"] > 0]
+    assert totals["orders"] == len(rows)
+    assert totals["revenue"] == pytest.approx(rows["total_cost"].sum())
+    assert totals["avg_ticket"] == pytest.approx(paid["total_cost"].mean())
+
+    by_month = crm.report_rollup("month", received_between=between, technician="Maria").set_index("month")
+    expected = rows.groupby(rows["date_received"].dt.strftime("%Y-%m"))["total_cost"].agg(["size", "sum"])
+    assert by_month["orders"].to_dict() == expected["size"].to_dict()
+    assert by_month["revenue"].to_dict() == pytest.approx(expected["sum"].to_dict())
+
+    by_tech = crm.report_rollup("technician").set_index("technician")
+    all_rows = crm.store.snapshot()
+    counts = all_rows["technician"].astype(str).replace("", "(unassigned)").value_counts()
+    assert by_tech["orders"].to_dict() == counts.to_dict()
+
+
+def test_combinations_without_a_day_bucket_are_rejected(crm):
+    with pytest.raises(ValueError):
+        printer.rollup_totals(crm.store.rollup_sources(), "status", technician="Maria")
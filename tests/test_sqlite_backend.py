@@ -0,0 +1,218 @@
+from datetime import date
+
+import pytest
+from pandas import testing as pd_testing
+
+import printer
+from conftest import new_order
+
+
+def test_stale_revision_raises_conflict(make_store):
+    first, second = make_store(), make_store()
+    order_id = new_order(printer.PrinterServiceCRM(first))
+    second.sync()
+
+    assert first.patch(order_id, {"technician": "Maria"}, expected_revision=1)
+    with pytest.raises(printer.OrderConflictError) as err:
+        second.patch(order_id, {"technician": "Vasile"}, expected_revision=1)
+
+    assert err.value.current["technician"] == "Maria"
+    assert printer.order_revision(err.value.current) == 2
+    assert first.backend.get(order_id)["technician"] == "Maria"
+
+
+def test_blind_write_does_not_lower_a_remote_revision(make_store):
+    stale, remote, checker = make_store(), make_store(), make_store()
+    order_id = new_order(printer.PrinterServiceCRM(stale))
+    remote.sync(); checker.sync()
+    assert remote.patch(order_id, {"technician": "Maria"}, expected_revision=1)
+    assert remote.patch(order_id, {"technician": "Maria"}, expected_revision=2)
+
+    # `stale` inca vede revizia 1; scrierea fara CAS urca peste cea stocata (3)
+    assert stale.patch(order_id, {"notes": "sunat clientul"})
+    assert printer.order_revision(stale.backend.get(order_id)) == 4
+    assert printer.order_revision(stale.get(order_id)) == 4
+
+    # cine a citit revizia 1 nu mai poate scrie peste ea
+    with pytest.raises(printer.OrderConflictError):
+        checker.patch(order_id, {"technician": "Vasile"}, expected_revision=1)
+    assert checker.get(order_id)["notes"] == "sunat clientul"
+
+
+def test_archived_ids_are_not_reused(make_store):
+    store = make_store()
+    crm = printer.PrinterServiceCRM(store)
+    ids = [new_order(crm, serial=f"SN{i}") for i in range(3)]
+    # ultima comanda (id-ul cel mai mare) ajunge in arhiva
+    crm.update_order(ids[-1], status="Completed", date_picked_up="2020-05-04")
+
+    assert store.archive_completed(30) == 1
+    assert store.backend.archive_partitions() == ["orders_2020"]
+    assert ids[-1] not in set(store.snapshot()["order_id"])
+    assert crm.get_order(ids[-1], include_archive=True)["status"] == "Completed"
+
+    assert new_order(crm, serial="SN9") == "SRV-00004"
+    # si dupa o pornire noua, din ce e in storage
+    assert printer.PrinterServiceCRM(make_store()).store.allocate_order_id() == "SRV-00005"
+
+
+def test_sync_merges_only_changed_rows(make_store, monkeypatch):
+    writer, reader = make_store(), make_store()
+    crm = printer.PrinterServiceCRM(writer)
+    kept = new_order(crm, serial="SN1")
+    changed = new_order(crm, serial="SN2")
+    reader.sync()
+    version = reader.version
+
+    monkeypatch.setattr(reader, "reload", lambda: pytest.fail("incremental sync fell back to a full reload"))
+    crm.update_order(changed, technician="Maria", labor_cost=100)
+    added = new_order(crm, name="Ana Ion", phone="0733000111", serial="SN3")
+
+    assert reader.sync()
+    assert reader.version == version + 1
+    assert reader.get(changed)["technician"] == "Maria"
+    assert reader.get(changed)["total_cost"] == 100
+    assert reader.get(added)["client_name"] == "Ana Ion"
+    assert reader.get(kept)["technician"] == ""
+    # nimic nou: sync-ul nu republica snapshot-ul
+    assert not reader.sync()
+    assert reader.version == version + 1
+
+
+def test_reload_keeps_reserved_ids(make_store):
+    store = make_store()
+    new_order(printer.PrinterServiceCRM(store))
+    reserved = store.allocate_order_id()
+    store.reload()  # alt tab a apasat "Reload" intre rezervare si scriere
+    assert store.allocate_order_id() != reserved
+    store.release_order_id(reserved)
+
+
+def test_concurrent_sessions_get_distinct_ids(make_store):
+    from concurrent.futures import ThreadPoolExecutor
+
+    store = make_store()
+    crm = printer.PrinterServiceCRM(store)
+
+    def create(i):
+        if i % 5 == 0:
+            store.reload()
+        return new_order(crm, serial=f"SN{i}")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        ids = list(pool.map(create, range(40)))
+
+    assert None not in ids
+    assert len(set(ids)) == 40
+    assert sorted(make_store().snapshot()["order_id"]) == sorted(ids)
+
+
+def test_legacy_printer_migration_is_one_bulk_write(make_store, monkeypatch):
+    store = make_store()
+    new_order(printer.PrinterServiceCRM(store))  # deja cu printers_json
+    legacy = [
+        {"order_id": printer.format_order_id(n), "client_name": f"Client {n}", "client_phone": "0722000000",
+         "printer_brand": "Canon", "printer_model": "LBP", "printer_serial": f"L{n}",
+         "date_received": "2019-02-03", "status": "Picked Up", "labor_cost": 50, "revision": 1}
+        for n in range(2, 3002)
+    ]
+    for row in legacy:
+        assert store.backend.insert(row)
+    store = make_store()
+    monkeypatch.setattr(store.backend, "patch", lambda *a, **k: pytest.fail("migration patched row by row"))
+
+    assert store.migrate_legacy_printers() == 3000
+    assert store.migrate_legacy_printers() == 0
+
+    reread = make_store()
+    order = reread.get("SRV-03001")
+    assert order["printers_json"]
+    assert printer.load_printers_from_order(order) == [{"brand": "Canon", "model": "LBP", "serial": "L3001"}]
+    assert order["revision"] == 2
+    assert order["labor_cost"] == 50
+    assert printer.safe_text(order["date_received"]) == "2019-02-03"
+    assert reread.get("SRV-00001")["revision"] == 1
+    assert reread.device_history("L42")["order_id"].tolist() == ["SRV-00042"]
+
+
+def test_mirror_push_and_pull(tmp_path, make_store):
+    store = make_store()
+    new_order(printer.PrinterServiceCRM(store))
+    mirror = printer.SQLiteBackend(str(tmp_path / "mirror.db"))
+    mirror.ensure_schema()
+    backend = printer.MirroredBackend(store.backend, mirror)
+
+    assert backend.push_to_mirror()
+    assert mirror.get("SRV-00001")["client_name"] == "Ion Pop"
+
+    fresh = printer.MirroredBackend(printer.SQLiteBackend(str(tmp_path / "fresh.db")), mirror)
+    fresh.primary.ensure_schema()
+    assert fresh.pull_from_mirror()
+    assert fresh.get("SRV-00001")["client_phone"] == "0722123456"
+
+
+def printer_rows(table):
+    return sorted(map(tuple, table[["order_id", "position", "brand", "model", "serial"]].astype(str).values.tolist()))
+
+
+@pytest.mark.parametrize("overlay_min", [1000, 2])
+def test_printer_writes_update_only_touched_orders(make_store, monkeypatch, overlay_min):
+    monkeypatch.setattr(printer.OrderStore, "PRINTER_OVERLAY_MIN", overlay_min)
+    store = make_store()
+    crm = printer.PrinterServiceCRM(store)
+    ids = [new_order(crm, serial=f"SN{i}") for i in range(6)]
+    two = [{"brand": "Canon", "model": "LBP", "serial": "C1"}, {"brand": "Epson", "model": "L3", "serial": "E1"}]
+    crm.update_order(ids[1], **printer.printer_fields(two))
+    crm.update_order(ids[2], **printer.printer_fields([]))
+    crm.update_order(ids[3], technician="Maria")  # fara imprimante: overlay-ul nu se atinge
+
+    assert store.printers_for(ids[1]) == two
+    assert store.printers_for(ids[2]) == []
+    assert store.printers_for(ids[3]) == [{"brand": "HP", "model": "M404", "serial": "SN3"}]
+    assert printer_rows(store.printers_table) == printer_rows(printer.build_printers_table(store.snapshot()))
+    assert store.device_history("SN1").empty
+    assert store.device_history("E1")["order_id"].tolist() == [ids[1]]
+    if overlay_min == 2:
+        assert not store._printer_overlay or len(store._printer_overlay) <= 2
+    monkeypatch.setattr(printer.OrderStore, "_merged_printers", lambda self: pytest.fail("full printers merge on write"))
+    if overlay_min == 1000:
+        crm.update_order(ids[4], **printer.printer_fields(two[:1]))
+        assert store.printers_for(ids[4]) == two[:1]
+
+
+def index_state(store):
+    indexes, clients = store.indexes, store.clients
+    return {
+        "positions": dict(store._positions),
+        "status": indexes.status, "technician": indexes.technician, "brand": indexes.brand,
+        "received": indexes._received, "keys": indexes._keys,
+        "clients": {k: {**c, "order_ids": sorted(c["order_ids"])} for k, c in clients.clients.items()},
+        "client_of": clients._order_client,
+        "phones": clients._phones._items, "names": clients._names._items,
+        "serials": {k: sorted(v) for k, v in store._serial_index.items()},
+    }
+
+
+def test_incremental_indexes_match_a_full_rebuild(make_store):
+    store, other = make_store(), make_store()
+    crm = printer.PrinterServiceCRM(store)
+    ids = [new_order(crm, name=f"Client {i % 3}", phone=f"07220000{i % 3:02d}", serial=f"SN{i}") for i in range(8)]
+    held = store.snapshot()
+    before = held.copy()
+
+    crm.update_order(ids[0], status="In Progress", technician="Maria")
+    crm.update_order(ids[1], client_name="Ana Noua", client_phone="0733111222")
+    crm.update_order(ids[2], **printer.printer_fields([{"brand": "Canon", "model": "X", "serial": "SN0"}]))
+    crm.update_order(ids[3], status="Completed", date_picked_up="2020-01-02")
+    store.archive_completed(30)
+    other_crm = printer.PrinterServiceCRM(other)
+    other.sync()
+    other_crm.update_order(ids[4], technician="Dan", date_received="2025-05-05")
+    new_order(other_crm, name="Remote", phone="0744000000", serial="R1")
+    assert store.sync()
+    new_order(crm, name="Client 1", phone="0722000001", serial="SN9")
+
+    pd_testing.assert_frame_equal(held, before)  # un snapshot publicat nu se modifica
+    assert index_state(store) == index_state(make_store())
+    assert [c["client_name"] for c in crm.find_clients("0722000001")] == ["Client 1"]
+    assert sorted(store.device_history("SN0")["order_id"]) == sorted([ids[0], ids[2]])
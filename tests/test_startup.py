@@ -0,0 +1,26 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def run(code: str) -> str:
+    # interpretor nou: in procesul testelor modulele sunt deja importate
+    return subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+
+
+def test_import_defers_pdf_imaging_and_sheets_modules():
+    out = run(
+        "import sys, printer; "
+        "print(sorted(m for m in ('reportlab', 'PIL', 'streamlit_gsheets', 'gspread') if m in sys.modules))"
+    )
+    assert out.strip() == "[]"
+
+
+def test_warm_up_loads_the_receipt_path_and_records_its_time():
+    out = run(
+        "import sys, printer; printer.warm_up_receipts(); report = printer.startup_report(); "
+        "print('reportlab.pdfgen.canvas' in sys.modules, report['warm_up_s'] > 0, report['imports_s'] > 0)"
+    )
+    assert out.split() == ["True", "True", "True"]
@@ -0,0 +1,36 @@
+import pytest
+
+import printer
+from conftest import new_order
+
+
+def test_tab_reads_go_through_the_plan_and_see_writes(make_store):
+    crm = printer.PrinterServiceCRM(make_store())
+    order_id = new_order(crm, serial="SN1")
+    reports = printer.TabData(crm, 3)
+
+    assert reports.client_count() == 1
+    with pytest.raises(AttributeError):
+        reports.device_history("SN1")
+
+    new_order(crm, name="Ana Pop", phone="0733000111", serial="SN2")
+    # versiunea store-ului e in cheie: scrierea din acelasi rerun se vede
+    assert reports.client_count() == 2
+
+    update = printer.TabData(crm, 2)
+    assert update.device_history("SN1")["order_id"].tolist() == [order_id]
+    assert update.get_order(order_id) is update.get_order(order_id)
+
+
+def test_frame_arguments_are_not_memoized(make_store):
+    crm = printer.PrinterServiceCRM(make_store())
+    first = new_order(crm, serial="SN1")
+    second = new_order(crm, serial="SN2")
+    orders = printer.TabData(crm, 1)
+
+    frame, _ = orders.orders_page(page=1, page_size=10)
+    both = orders.receipt_orders(frame)
+    one = orders.receipt_orders(frame[frame["order_id"] == second])
+
+    assert sorted(o["order_id"] for o in both) == [first, second]
+    assert [o["order_id"] for o in one] == [second]